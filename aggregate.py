@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import contextlib
+import datetime
+import logging
+import pathlib
+import sys
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+import pytz
+import yaml
+import dedup
+import utility
+import vendors
+
+
+class Summary(NamedTuple):
+    category: str
+    seconds: float
+    result: Optional[utility.AggregateResult] = None
+    error: Optional[str] = None
+
+
+def aggregate_all(
+        config: Dict[str, Any],
+        *,
+        timezone: Optional[datetime.tzinfo] = None,
+        logger: Optional[logging.Logger] = None) -> List[Summary]:
+    logger = logger or logging.getLogger(__name__)
+    category_list: List[str] = []
+    for name, target in config['target'].items():
+        if target.get('mixed', False):
+            continue
+        if name not in vendors.VENDOR:
+            logger.warning('%s: unknown vendor, skip', name)
+            continue
+        category_list.append(name)
+    aggregate_config = config.get('aggregate') or {}
+    workers = aggregate_config.get('workers') or utility.DEFAULT_WORKERS
+    with contextlib.ExitStack() as stack:
+        # shared by all the vendors
+        index = dedup.open_index(config, logger=logger)
+        if index is not None:
+            stack.callback(index.close)
+        # the headers of the mixed targets are read once for all the vendors
+        routed = utility.route_mixed(
+                config,
+                vendors.ROUTER,
+                index=index,
+                logger=logger)
+        category_list.extend(
+                name for name, path_list in routed.items()
+                if path_list and name not in category_list)
+        executor = (
+                stack.enter_context(concurrent.futures.ProcessPoolExecutor(
+                        max_workers=workers))
+                if workers > 1 else None)
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(1, len(category_list))) as threads:
+            futures = [
+                    threads.submit(
+                            _aggregate,
+                            name,
+                            config,
+                            index=index,
+                            executor=executor,
+                            timezone=timezone,
+                            routed=routed[name],
+                            logger=logger.getChild(name))
+                    for name in category_list]
+            return [future.result() for future in futures]
+
+
+def _aggregate(
+        category: str,
+        config: Dict[str, Any],
+        *,
+        index: Optional[dedup.DedupIndex],
+        executor: Optional[concurrent.futures.Executor],
+        timezone: Optional[datetime.tzinfo],
+        routed: Sequence[pathlib.Path],
+        logger: logging.Logger) -> Summary:
+    vendor = vendors.VENDOR[category]
+    start = time.perf_counter()
+    try:
+        result = utility.aggregate_target(
+                category,
+                config,
+                vendor.mail_class,
+                vendor.to_markdown,
+                vendor.to_gnucash,
+                timezone=timezone,
+                index=index,
+                executor=executor,
+                routed=routed,
+                logger=logger)
+    except Exception as error:  # pylint: disable=broad-except
+        logger.exception('%s: failed to aggregate', category)
+        return Summary(
+                category=category,
+                seconds=time.perf_counter() - start,
+                error='{0}: {1}'.format(type(error).__name__, error))
+    return Summary(
+            category=category,
+            seconds=time.perf_counter() - start,
+            result=result)
+
+
+def main(*, logger: Optional[logging.Logger] = None) -> int:
+    logger = logger or logging.getLogger(__name__)
+    start = time.perf_counter()
+    # config
+    config_path = pathlib.Path('config.yaml')
+    with config_path.open() as config_file:
+        config = yaml.load(
+                config_file,
+                Loader=yaml.SafeLoader)
+    summary_list = aggregate_all(
+            config,
+            timezone=pytz.timezone('Asia/Tokyo'),
+            logger=logger)
+    # summary
+    for summary in summary_list:
+        if summary.result is not None:
+            print('{0}: {1} mails, {2} receipts in {3:.3f} seconds'.format(
+                    summary.category,
+                    summary.result.mails,
+                    summary.result.receipts,
+                    summary.seconds))
+        else:
+            print('{0}: failed in {1:.3f} seconds ({2})'.format(
+                    summary.category,
+                    summary.seconds,
+                    summary.error))
+    failed = sum(1 for summary in summary_list if summary.error is not None)
+    print('total: {0} targets, {1} failed in {2:.3f} seconds'.format(
+            len(summary_list),
+            failed,
+            time.perf_counter() - start))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    _logger = logging.getLogger('aggregate')
+    _logger.setLevel(logging.WARNING)
+    handler = logging.StreamHandler()
+    handler.formatter = logging.Formatter(
+                fmt='%(name)s::%(levelname)s::%(message)s')
+    _logger.addHandler(handler)
+    sys.exit(main(logger=_logger))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import logging
+import os
+import pathlib
+import tempfile
+import time
+from typing import Any, Dict, List
+import utility
+import vendors
+from . import generator
+
+
+def run(
+        mail_list: List[pathlib.Path],
+        vendor: str,
+        workers: int,
+        chunk_size: int) -> Dict[str, Any]:
+    logger = logging.getLogger('benchmark.aggregate')
+    start = time.perf_counter()
+    receipt_list = utility.read_receipt_list(
+            mail_list,
+            vendors.VENDOR[vendor].mail_class,
+            workers=workers,
+            chunk_size=chunk_size,
+            logger=logger)
+    elapsed = time.perf_counter() - start
+    return {
+            'receipts': receipt_list,
+            'seconds': elapsed,
+            'mails_per_second': len(mail_list) / elapsed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+            description='parse benchmark of utility.read_receipt_list')
+    parser.add_argument(
+            '--vendor', choices=sorted(generator.VENDOR), default='amazon')
+    parser.add_argument(
+            '--mails', type=int, default=2000,
+            help='generated mails')
+    parser.add_argument(
+            '--items', type=int, default=3,
+            help='items per generated mail')
+    parser.add_argument(
+            '--workers', type=int, action='append', default=[],
+            help='worker processes to compare (repeatable)')
+    parser.add_argument(
+            '--chunk-size', type=int, default=utility.DEFAULT_CHUNK_SIZE)
+    option = parser.parse_args()
+    workers_list = option.workers or sorted({1, 2, 4, os.cpu_count() or 1})
+    with tempfile.TemporaryDirectory() as workspace:
+        directory = pathlib.Path(workspace)
+        generator.write_directory(directory, generator.generate(
+                option.vendor,
+                option.mails,
+                items=option.items))
+        mail_list = sorted(directory.iterdir())
+        baseline: Dict[str, Any] = {}
+        for workers in workers_list:
+            result = run(mail_list, option.vendor, workers, option.chunk_size)
+            if not baseline:
+                baseline = result
+            print('workers {0}: {1:.3f} seconds, {2:.1f} mails/s,'
+                  ' speedup {3:.2f}, same result: {4}'.format(
+                        workers,
+                        result['seconds'],
+                        result['mails_per_second'],
+                        baseline['seconds'] / result['seconds'],
+                        result['receipts'] == baseline['receipts']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import re
+import time
+from typing import Any, Callable, Dict, List
+import receipt_mail.bookwalker
+from receipt_mail._grammar import Grammar
+from receipt_mail.bookwalker._mail import GRAMMAR
+from . import generator
+
+
+KEYS = {
+        'purchased_date': 'Purchased Date',
+        'discount': 'Coupon Discount',
+        'tax': 'Tax',
+        'total_amount': 'Total Amount',
+        'coin_usage': 'Coin Usage (1 Coin = JPY 1)',
+        'total_payment': 'Total Payment'}
+
+
+# the fields of the grammar without the item rows
+FIELD_GRAMMAR = Grammar('bookwalker fields', fields=GRAMMAR.fields)
+
+
+def search_field(order: str) -> Dict[str, Any]:
+    # a search per field, as the getters did before the scanner,
+    # which required the newline after the value (parser_version 1)
+    result: Dict[str, Any] = {}
+    for field in GRAMMAR.fields:
+        match = re.search(
+                r'■{0}\s*[:：]\s*(?P<value>.+)\n'.format(
+                        re.escape(KEYS[field.name])),
+                order)
+        result[field.name] = (
+                field.convert(match.group('value'))
+                if match else field.default)
+    return result
+
+
+def scan_field(order: str) -> Dict[str, Any]:
+    return FIELD_GRAMMAR.parse(order)
+
+
+def measure(
+        function: Callable[[str], Any],
+        order_list: List[str],
+        repeat: int) -> Dict[str, Any]:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = [function(order) for order in order_list]
+    return {
+            'result': result,
+            'seconds': time.perf_counter() - start}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+            description='field extraction benchmark of BOOK☆WALKER orders')
+    parser.add_argument(
+            '--mails', type=int, default=1000,
+            help='generated mails per type')
+    parser.add_argument(
+            '--items', type=int, default=3,
+            help='items per generated order')
+    parser.add_argument(
+            '--repeat', type=int, default=10)
+    option = parser.parse_args()
+    for type_ in ('order', 'pre_order', 'coin'):
+        mail_list = [
+                receipt_mail.bookwalker.Mail.read_binary(binary)
+                for binary in generator.generate(
+                        'bookwalker',
+                        option.mails,
+                        items=option.items,
+                        type_=type_)]
+        # the order blocks as Mail.order returns them
+        order_list = [mail.order() or '' for mail in mail_list]
+        search = measure(search_field, order_list, option.repeat)
+        scan = measure(scan_field, order_list, option.repeat)
+        start = time.perf_counter()
+        for binary in generator.generate(
+                'bookwalker',
+                option.mails,
+                items=option.items,
+                type_=type_):
+            receipt_mail.bookwalker.Mail.read_binary(binary).receipt()
+        parse = time.perf_counter() - start
+        print('{0}: search {1:.3f} s, scan {2:.3f} s, speedup {3:.2f},'
+              ' same result: {4}, receipt() {5:.1f} us/mail'.format(
+                    type_,
+                    search['seconds'],
+                    scan['seconds'],
+                    search['seconds'] / scan['seconds'],
+                    search['result'] == scan['result'],
+                    parse * 1e6 / option.mails))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import logging
+import pathlib
+import resource
+import tempfile
+import time
+from typing import Any, Dict, Optional
+import download
+from . import fake_imap, generator
+
+
+def peak_rss() -> int:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run(
+        server: fake_imap.FakeIMAPServer,
+        workspace: pathlib.Path,
+        download_config: Dict[str, Any],
+        *,
+        logger: Optional[logging.Logger] = None) -> Dict[str, float]:
+    logger = logger or logging.getLogger(__name__)
+    config = {
+            'host': server.host,
+            'port': server.port,
+            'ssl': False,
+            'username': 'user',
+            'password': 'password',
+            'since': {'year': 2000, 'month': 1, 'day': 1},
+            'download': download_config,
+            'dedup': {'index': workspace.joinpath('dedup.sqlite3').as_posix()},
+            'target': {
+                    name: {
+                            'mailbox': name,
+                            'workspace': workspace.joinpath(name).as_posix()}
+                    for name in server.mailboxes}}
+    sent = server.sent
+    rss = peak_rss()
+    start = time.perf_counter()
+    download.download(config, logger=logger)
+    elapsed = time.perf_counter() - start
+    mails = list(workspace.glob('*/mail/*'))
+    size = sum(path.stat().st_size for path in mails)
+    return {
+            'mails': len(mails),
+            'stored_bytes': size,
+            'transferred_bytes': server.sent - sent,
+            'seconds': elapsed,
+            'mails_per_second': len(mails) / elapsed,
+            'bytes_per_second': (server.sent - sent) / elapsed,
+            'peak_rss': peak_rss(),
+            'peak_rss_growth': peak_rss() - rss}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+            description='download benchmark against a fake IMAP server')
+    parser.add_argument(
+            '--mails', type=int, default=200,
+            help='generated mails per vendor')
+    parser.add_argument(
+            '--items', type=int, default=3,
+            help='items per generated mail')
+    parser.add_argument(
+            '--noise', type=float, default=0.5,
+            help='ratio of non-receipt mails')
+    parser.add_argument(
+            '--eml', type=pathlib.Path, action='append', default=[],
+            metavar='DIRECTORY',
+            help='seed a mailbox from *.eml files instead of generated mails')
+    parser.add_argument(
+            '--latency', type=float, default=0.0,
+            help='seconds added to each command')
+    parser.add_argument(
+            '--bandwidth', type=float, default=None,
+            help='bytes per second of each connection')
+    parser.add_argument('--mode', choices=('full', 'text'), default='full')
+    parser.add_argument('--no-triage', action='store_true')
+    parser.add_argument('--no-compress', action='store_true')
+    parser.add_argument('--connections', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--batch-bytes', type=int, default=None)
+    parser.add_argument('--verbose', '-v', action='store_true')
+    option = parser.parse_args()
+    # logger
+    logger = logging.getLogger('benchmark.download')
+    logger.setLevel(logging.DEBUG if option.verbose else logging.WARNING)
+    handler = logging.StreamHandler()
+    handler.formatter = logging.Formatter(
+                fmt='%(name)s::%(levelname)s::%(message)s')
+    logger.addHandler(handler)
+    # server
+    with fake_imap.FakeIMAPServer(
+            latency=option.latency,
+            bandwidth=option.bandwidth) as server:
+        if option.eml:
+            for directory in option.eml:
+                server.load_directory(directory.name, directory)
+        else:
+            for vendor in generator.VENDOR:
+                server.load(vendor, generator.generate(
+                        vendor,
+                        option.mails,
+                        noise=option.noise,
+                        items=option.items))
+        for mailbox in server.mailboxes.values():
+            print('mailbox {0}: {1} mails, {2} bytes'.format(
+                    mailbox.name,
+                    len(mailbox.messages),
+                    sum(len(message.binary)
+                        for message in mailbox.messages)))
+        download_config = {
+                'mode': option.mode,
+                'triage': not option.no_triage,
+                'compress': not option.no_compress,
+                'connections': option.connections,
+                'batch_size': option.batch_size,
+                'batch_bytes': option.batch_bytes}
+        with tempfile.TemporaryDirectory() as workspace:
+            result = run(
+                    server,
+                    pathlib.Path(workspace),
+                    download_config,
+                    logger=logger)
+    for key, value in result.items():
+        print('{0}: {1:.3f}'.format(key, value)
+              if isinstance(value, float)
+              else '{0}: {1}'.format(key, value))
+
+
+if __name__ == '__main__':
+    main()
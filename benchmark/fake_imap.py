@@ -0,0 +1,685 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import email
+import email.message
+import email.policy
+import email.utils
+import logging
+import pathlib
+import re
+import select
+import socketserver
+import threading
+import time
+import zlib
+from typing import (
+        Any, Dict, Iterable, List, Optional, Tuple, Union, cast)
+
+
+CAPABILITIES = (
+        'IMAP4rev1',
+        'IDLE',
+        'ENABLE',
+        'CONDSTORE',
+        'COMPRESS=DEFLATE',
+        'LITERAL+')
+
+_POLICY = email.policy.compat32.clone(linesep='\r\n')
+
+_MONTH = (
+        'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+        'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+
+Token = Union[str, List[Any]]
+
+
+class Message:
+    def __init__(
+            self,
+            uid: int,
+            binary: bytes,
+            internal_date: datetime.datetime) -> None:
+        self.uid = uid
+        self.binary = binary
+        self.internal_date = internal_date
+        self._message: Optional[email.message.Message] = None
+
+    def message(self) -> email.message.Message:
+        if self._message is None:
+            self._message = email.message_from_bytes(
+                    self.binary,
+                    policy=_POLICY)
+        return self._message
+
+    def header(self) -> bytes:
+        match = re.search(b'\r?\n\r?\n', self.binary)
+        return self.binary[:match.end()] if match else self.binary
+
+    def text(self) -> bytes:
+        return self.binary[len(self.header()):]
+
+    def header_fields(self, names: List[str]) -> bytes:
+        names = [name.lower() for name in names]
+        fields: List[bytes] = []
+        for line in self.header().splitlines(keepends=True):
+            if line in (b'\r\n', b'\n'):
+                break
+            if line[:1] in (b' ', b'\t') and fields:
+                fields[-1] += line
+            else:
+                fields.append(line)
+        return b''.join(
+                field for field in fields
+                if field.split(b':', 1)[0].strip().decode().lower() in names
+                ) + b'\r\n'
+
+    def part(self, section: str) -> Tuple[bytes, bytes]:
+        # (MIME header, body) of the section
+        part = self.message()
+        for number in section.split('.'):
+            index = int(number)
+            if part.is_multipart():
+                part = cast(List[email.message.Message],
+                            part.get_payload())[index - 1]
+            elif index != 1:
+                raise KeyError(section)
+        if part is self.message():
+            return self.header(), self.text()
+        return _split(part.as_bytes(policy=_POLICY))
+
+    def bodystructure(self) -> str:
+        return _bodystructure(self.message())
+
+
+class Mailbox:
+    def __init__(self, name: str, uid_validity: int) -> None:
+        self.name = name
+        self.uid_validity = uid_validity
+        self.uid_next = 1
+        self.highest_modseq = 1
+        self.messages: List[Message] = []
+        self.condition = threading.Condition()
+
+    def append(
+            self,
+            binary: bytes,
+            internal_date: Optional[datetime.datetime] = None) -> int:
+        if internal_date is None:
+            date = email.message_from_bytes(binary).get('Date')
+            internal_date = (
+                    email.utils.parsedate_to_datetime(date)
+                    if date is not None
+                    else datetime.datetime.now(tz=datetime.timezone.utc))
+        with self.condition:
+            uid = self.uid_next
+            self.messages.append(Message(uid, binary, internal_date))
+            self.uid_next += 1
+            self.highest_modseq += 1
+            self.condition.notify_all()
+        return uid
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+            self,
+            *,
+            host: str = '127.0.0.1',
+            port: int = 0,
+            latency: float = 0.0,
+            bandwidth: Optional[float] = None,
+            capabilities: Iterable[str] = CAPABILITIES,
+            logger: Optional[logging.Logger] = None) -> None:
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.capabilities = tuple(capabilities)
+        self.logger = logger or logging.getLogger(__name__)
+        self.mailboxes: Dict[str, Mailbox] = {}
+        self.sent = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return str(self.server_address[0])
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def __enter__(self) -> 'FakeIMAPServer':
+        self._thread = threading.Thread(
+                target=self.serve_forever,
+                name='FakeIMAPServer',
+                daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def mailbox(self, name: str) -> Mailbox:
+        if name not in self.mailboxes:
+            self.mailboxes[name] = Mailbox(
+                    name,
+                    uid_validity=len(self.mailboxes) + 1)
+        return self.mailboxes[name]
+
+    def append(
+            self,
+            mailbox: str,
+            binary: bytes,
+            internal_date: Optional[datetime.datetime] = None) -> int:
+        return self.mailbox(mailbox).append(binary, internal_date)
+
+    def load(self, mailbox: str, mails: Iterable[bytes]) -> int:
+        count = 0
+        for mail in mails:
+            self.append(mailbox, mail)
+            count += 1
+        return count
+
+    def load_directory(self, mailbox: str, directory: pathlib.Path) -> int:
+        return self.load(
+                mailbox,
+                (path.read_bytes()
+                 for path in sorted(directory.glob('*.eml'))))
+
+    def count_sent(self, size: int) -> None:
+        with self._lock:
+            self.sent += size
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    server: FakeIMAPServer
+
+    def setup(self) -> None:
+        self.logger = self.server.logger
+        self._buffer = bytearray()
+        self._compressor: Optional[Any] = None
+        self._decompressor: Optional[Any] = None
+        self._mailbox: Optional[Mailbox] = None
+        self._condstore = False
+        self._compress_next = False
+        self._closed = False
+
+    def handle(self) -> None:
+        self._send('* OK [CAPABILITY {0}] fake IMAP server ready\r\n'.format(
+                ' '.join(self.server.capabilities)).encode())
+        while not self._closed:
+            try:
+                line = self._read_command()
+            except (ConnectionError, OSError):
+                return
+            if line is None:
+                return
+            tokens = _tokenize(line[0], line[1])
+            if len(tokens) < 2:
+                self._send(b'* BAD empty command\r\n')
+                continue
+            tag = str(tokens[0])
+            command = str(tokens[1]).upper()
+            arguments = tokens[2:]
+            uid = False
+            if command == 'UID':
+                uid = True
+                command = str(arguments[0]).upper()
+                arguments = arguments[1:]
+            self.logger.debug('%s %s %s', tag, command, arguments)
+            try:
+                status = getattr(
+                        self,
+                        '_{0}'.format(command.lower()),
+                        self._unknown)(tag, arguments, uid)
+            except (ConnectionError, OSError):
+                return
+            except Exception as error:  # pylint: disable=broad-except
+                self.logger.exception('%s %s failed', tag, command)
+                status = 'BAD {0}'.format(error)
+            if status is not None:
+                if self.server.latency > 0:
+                    time.sleep(self.server.latency)
+                self._send('{0} {1}\r\n'.format(tag, status).encode())
+                self._start_compress()
+
+    # I/O
+    def _recv(self) -> bool:
+        data = self.request.recv(65536)
+        if not data:
+            return False
+        if self._decompressor is not None:
+            data = self._decompressor.decompress(data)
+        self._buffer += data
+        return True
+
+    def _read_line(self) -> Optional[bytes]:
+        while True:
+            end = self._buffer.find(b'\r\n')
+            if end >= 0:
+                line = bytes(self._buffer[:end])
+                del self._buffer[:end + 2]
+                return line
+            if not self._recv():
+                return None
+
+    def _read_bytes(self, size: int) -> Optional[bytes]:
+        while len(self._buffer) < size:
+            if not self._recv():
+                return None
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def _read_command(self) -> Optional[Tuple[str, List[bytes]]]:
+        result: List[str] = []
+        literals: List[bytes] = []
+        while True:
+            line = self._read_line()
+            if line is None:
+                return None
+            match = re.search(rb'\{(?P<size>[0-9]+)(?P<plus>\+?)\}$', line)
+            if not match:
+                result.append(line.decode(errors='surrogateescape'))
+                return ''.join(result), literals
+            result.append(line[:match.start()].decode(
+                    errors='surrogateescape'))
+            result.append('\x00{0}'.format(len(literals)))
+            if not match.group('plus'):
+                self._send(b'+ Ready for literal data\r\n')
+            literal = self._read_bytes(int(match.group('size')))
+            if literal is None:
+                return None
+            literals.append(literal)
+
+    def _send(self, data: bytes) -> None:
+        if self._compressor is not None:
+            data = (self._compressor.compress(data)
+                    + self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        bandwidth = self.server.bandwidth
+        chunk = 16384
+        for i in range(0, len(data), chunk):
+            self.request.sendall(data[i:i + chunk])
+            if bandwidth:
+                time.sleep(min(chunk, len(data) - i) / bandwidth)
+        self.server.count_sent(len(data))
+
+    def _start_compress(self) -> None:
+        if self._compress_next:
+            self._compress_next = False
+            self._compressor = zlib.compressobj(
+                    zlib.Z_DEFAULT_COMPRESSION,
+                    zlib.DEFLATED,
+                    -zlib.MAX_WBITS)
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            # data received after the command is already compressed
+            pending = bytes(self._buffer)
+            self._buffer.clear()
+            if pending:
+                self._buffer += self._decompressor.decompress(pending)
+
+    # commands
+    def _unknown(self, tag: str, arguments: List[Token], uid: bool) -> str:
+        return 'BAD unknown command'
+
+    def _capability(
+            self,
+            tag: str,
+            arguments: List[Token],
+            uid: bool) -> str:
+        self._send('* CAPABILITY {0}\r\n'.format(
+                ' '.join(self.server.capabilities)).encode())
+        return 'OK CAPABILITY completed'
+
+    def _login(self, tag: str, arguments: List[Token], uid: bool) -> str:
+        return 'OK [CAPABILITY {0}] LOGIN completed'.format(
+                ' '.join(self.server.capabilities))
+
+    def _noop(self, tag: str, arguments: List[Token], uid: bool) -> str:
+        return 'OK NOOP completed'
+
+    def _logout(self, tag: str, arguments: List[Token], uid: bool) -> str:
+        self._send(b'* BYE fake IMAP server logging out\r\n')
+        self._closed = True
+        return 'OK LOGOUT completed'
+
+    def _enable(self, tag: str, arguments: List[Token], uid: bool) -> str:
+        enabled = [
+                str(argument) for argument in arguments
+                if str(argument).upper() in self.server.capabilities]
+        if 'CONDSTORE' in (name.upper() for name in enabled):
+            self._condstore = True
+        self._send('* ENABLED {0}\r\n'.format(' '.join(enabled)).encode())
+        return 'OK ENABLE completed'
+
+    def _compress(self, tag: str, arguments: List[Token], uid: bool) -> str:
+        if 'COMPRESS=DEFLATE' not in self.server.capabilities:
+            return 'BAD COMPRESS is not supported'
+        if self._compressor is not None:
+            return 'NO [COMPRESSIONACTIVE] already compressed'
+        self._compress_next = True
+        return 'OK DEFLATE active'
+
+    def _select(self, tag: str, arguments: List[Token], uid: bool) -> str:
+        return self._open(arguments, readonly=False)
+
+    def _examine(self, tag: str, arguments: List[Token], uid: bool) -> str:
+        return self._open(arguments, readonly=True)
+
+    def _open(self, arguments: List[Token], *, readonly: bool) -> str:
+        name = _string(arguments[0])
+        if name not in self.server.mailboxes:
+            self._mailbox = None
+            return 'NO no such mailbox'
+        mailbox = self.server.mailboxes[name]
+        self._mailbox = mailbox
+        with mailbox.condition:
+            lines = [
+                    '* {0} EXISTS'.format(len(mailbox.messages)),
+                    '* 0 RECENT',
+                    '* FLAGS (\\Seen \\Answered \\Flagged \\Deleted)',
+                    '* OK [UIDVALIDITY {0}] UIDs valid'.format(
+                            mailbox.uid_validity),
+                    '* OK [UIDNEXT {0}] predicted next UID'.format(
+                            mailbox.uid_next)]
+            if self._condstore:
+                lines.append('* OK [HIGHESTMODSEQ {0}] modseq'.format(
+                        mailbox.highest_modseq))
+        self._send(''.join(line + '\r\n' for line in lines).encode())
+        return 'OK [{0}] completed'.format(
+                'READ-ONLY' if readonly else 'READ-WRITE')
+
+    def _idle(self, tag: str, arguments: List[Token], uid: bool) -> str:
+        self._send(b'+ idling\r\n')
+        mailbox = self._mailbox
+        known = len(mailbox.messages) if mailbox is not None else 0
+        while b'\r\n' not in self._buffer:
+            if mailbox is not None and len(mailbox.messages) != known:
+                known = len(mailbox.messages)
+                self._send('* {0} EXISTS\r\n'.format(known).encode())
+            readable, _, _ = select.select([self.request], [], [], 0.1)
+            if readable and not self._recv():
+                raise ConnectionError('connection is closed in IDLE')
+        line = self._read_line()
+        if line is None or line.upper() != b'DONE':
+            return 'BAD expected DONE'
+        return 'OK IDLE terminated'
+
+    def _unselect(self, tag: str, arguments: List[Token], uid: bool) -> str:
+        self._mailbox = None
+        return 'OK UNSELECT completed'
+
+    def _close(self, tag: str, arguments: List[Token], uid: bool) -> str:
+        self._mailbox = None
+        return 'OK CLOSE completed'
+
+    def _search(self, tag: str, arguments: List[Token], uid: bool) -> str:
+        if self._mailbox is None:
+            return 'BAD no mailbox selected'
+        if arguments and str(arguments[0]).upper() == 'CHARSET':
+            arguments = arguments[2:]
+        with self._mailbox.condition:
+            messages = list(enumerate(self._mailbox.messages, start=1))
+        result = [
+                str(message.uid if uid else seq)
+                for seq, message in messages
+                if _match(arguments, seq, message, messages)]
+        self._send('* SEARCH {0}\r\n'.format(' '.join(result)).encode())
+        return 'OK SEARCH completed'
+
+    def _fetch(self, tag: str, arguments: List[Token], uid: bool) -> str:
+        if self._mailbox is None:
+            return 'BAD no mailbox selected'
+        with self._mailbox.condition:
+            messages = list(enumerate(self._mailbox.messages, start=1))
+        targets = _select_set(str(arguments[0]), messages, uid=uid)
+        items = arguments[1] if isinstance(arguments[1], list) else [
+                arguments[1]]
+        names = [str(item) for item in items]
+        if uid and 'UID' not in (name.upper() for name in names):
+            names.insert(0, 'UID')
+        for seq, message in targets:
+            response = [b'* ', str(seq).encode(), b' FETCH (']
+            for i, name in enumerate(names):
+                if i:
+                    response.append(b' ')
+                response.append(self._fetch_item(name, message))
+            response.append(b')\r\n')
+            self._send(b''.join(response))
+        return 'OK FETCH completed'
+
+    def _fetch_item(self, name: str, message: Message) -> bytes:
+        upper = name.upper()
+        if upper == 'UID':
+            return 'UID {0}'.format(message.uid).encode()
+        if upper == 'FLAGS':
+            return b'FLAGS ()'
+        if upper == 'INTERNALDATE':
+            return 'INTERNALDATE "{0}"'.format(
+                    message.internal_date.strftime(
+                            '%d-{0}-%Y %H:%M:%S %z'.format(
+                                    _MONTH[message.internal_date.month - 1]
+                                    ))).encode()
+        if upper == 'RFC822.SIZE':
+            return 'RFC822.SIZE {0}'.format(len(message.binary)).encode()
+        if upper == 'RFC822':
+            return b'RFC822 ' + _literal(message.binary)
+        if upper == 'RFC822.HEADER':
+            return b'RFC822.HEADER ' + _literal(message.header())
+        if upper == 'BODYSTRUCTURE':
+            return b'BODYSTRUCTURE ' + message.bodystructure().encode()
+        match = re.match(
+                r'BODY(\.PEEK)?\[(?P<section>[^\]]*)\]$',
+                name,
+                flags=re.IGNORECASE)
+        if match:
+            section = match.group('section')
+            return 'BODY[{0}] '.format(section).encode() + _literal(
+                    _section(message, section))
+        raise ValueError('unknown fetch item: {0}'.format(name))
+
+
+def _tokenize(line: str, literals: List[bytes]) -> List[Token]:
+    stack: List[List[Token]] = [[]]
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if char == ' ':
+            i += 1
+        elif char == '(':
+            stack.append([])
+            i += 1
+        elif char == ')':
+            token = stack.pop()
+            stack[-1].append(token)
+            i += 1
+        elif char == '"':
+            value: List[str] = []
+            i += 1
+            while line[i] != '"':
+                if line[i] == '\\':
+                    i += 1
+                value.append(line[i])
+                i += 1
+            stack[-1].append('"' + ''.join(value))
+            i += 1
+        elif char == '\x00':
+            end = i + 1
+            while end < len(line) and line[end].isdigit():
+                end += 1
+            stack[-1].append('"' + literals[int(line[i + 1:end])].decode(
+                    errors='surrogateescape'))
+            i = end
+        else:
+            end = i
+            depth = 0
+            while end < len(line):
+                if line[end] == '[':
+                    depth += 1
+                elif line[end] == ']':
+                    depth -= 1
+                elif depth == 0 and line[end] in ' ()':
+                    break
+                end += 1
+            stack[-1].append(line[i:end])
+            i = end
+    return stack[0]
+
+
+def _string(token: Token) -> str:
+    value = str(token)
+    return value[1:] if value.startswith('"') else value
+
+
+def _literal(data: bytes) -> bytes:
+    return '{{{0}}}\r\n'.format(len(data)).encode() + data
+
+
+def _split(binary: bytes) -> Tuple[bytes, bytes]:
+    match = re.search(b'\r?\n\r?\n', binary)
+    if not match:
+        return binary, b''
+    return binary[:match.end()], binary[match.end():]
+
+
+def _section(message: Message, section: str) -> bytes:
+    upper = section.upper()
+    if upper == '':
+        return message.binary
+    if upper == 'HEADER':
+        return message.header()
+    if upper == 'TEXT':
+        return message.text()
+    fields = re.match(r'HEADER\.FIELDS \((?P<names>[^)]*)\)$', upper)
+    if fields:
+        return message.header_fields(fields.group('names').split())
+    if upper.endswith('.MIME'):
+        return message.part(section[:-len('.MIME')])[0]
+    return message.part(section)[1]
+
+
+def _nstring(value: Optional[str]) -> str:
+    if value is None:
+        return 'NIL'
+    return '"{0}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def _bodystructure(part: email.message.Message) -> str:
+    if part.is_multipart():
+        return '({0} {1})'.format(
+                ''.join(_bodystructure(subpart)
+                        for subpart in cast(
+                                List[email.message.Message],
+                                part.get_payload())),
+                _nstring(part.get_content_subtype().upper()))
+    body = _split(part.as_bytes(policy=_POLICY))[1]
+    params = part.get_params() or []
+    param_list = ' '.join(
+            '{0} {1}'.format(_nstring(key.upper()), _nstring(value))
+            for key, value in params[1:]
+            if isinstance(value, str))
+    result = '{0} {1} {2} {3} {4} {5} {6}'.format(
+            _nstring(part.get_content_maintype().upper()),
+            _nstring(part.get_content_subtype().upper()),
+            '({0})'.format(param_list) if param_list else 'NIL',
+            _nstring(part.get('Content-ID')),
+            _nstring(part.get('Content-Description')),
+            _nstring((part.get('Content-Transfer-Encoding') or '7BIT')
+                     .upper()),
+            len(body))
+    if part.get_content_maintype() == 'text':
+        result += ' {0}'.format(body.count(b'\n'))
+    return '({0})'.format(result)
+
+
+def _parse_set(sequence_set: str, last: int) -> List[Tuple[int, int]]:
+    result: List[Tuple[int, int]] = []
+    for item in sequence_set.split(','):
+        start, _, end = item.partition(':')
+        low = last if start == '*' else int(start)
+        high = low if not end else (last if end == '*' else int(end))
+        result.append((min(low, high), max(low, high)))
+    return result
+
+
+def _in_set(value: int, ranges: List[Tuple[int, int]]) -> bool:
+    return any(low <= value <= high for low, high in ranges)
+
+
+def _select_set(
+        sequence_set: str,
+        messages: List[Tuple[int, Message]],
+        *,
+        uid: bool) -> List[Tuple[int, Message]]:
+    if not messages:
+        return []
+    ranges = _parse_set(
+            sequence_set,
+            messages[-1][1].uid if uid else messages[-1][0])
+    return [
+            (seq, message) for seq, message in messages
+            if _in_set(message.uid if uid else seq, ranges)]
+
+
+def _parse_date(value: str) -> datetime.date:
+    day, month, year = _string(value).split('-')
+    return datetime.date(int(year), _MONTH.index(month.title()) + 1, int(day))
+
+
+def _match(
+        criteria: List[Token],
+        seq: int,
+        message: Message,
+        messages: List[Tuple[int, Message]]) -> bool:
+    i = 0
+    while i < len(criteria):
+        criterion = criteria[i]
+        if isinstance(criterion, list):
+            if not _match(criterion, seq, message, messages):
+                return False
+            i += 1
+            continue
+        key = criterion.upper()
+        if key == 'ALL':
+            i += 1
+        elif key == 'SINCE':
+            date = _parse_date(str(criteria[i + 1]))
+            if message.internal_date.date() < date:
+                return False
+            i += 2
+        elif key == 'BEFORE':
+            date = _parse_date(str(criteria[i + 1]))
+            if message.internal_date.date() >= date:
+                return False
+            i += 2
+        elif key == 'UID':
+            if not _in_set(message.uid, _parse_set(
+                    str(criteria[i + 1]),
+                    messages[-1][1].uid)):
+                return False
+            i += 2
+        elif key == 'SUBJECT':
+            header = email.message_from_bytes(
+                    message.header(),
+                    policy=email.policy.default)
+            if _string(criteria[i + 1]).lower() not in str(
+                    header.get('Subject', '')).lower():
+                return False
+            i += 2
+        elif re.match(r'^[0-9*:,]+$', key):
+            if not _in_set(seq, _parse_set(key, messages[-1][0])):
+                return False
+            i += 1
+        else:
+            raise ValueError('unsupported search key: {0}'.format(key))
+    return True
@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import email.message
+import email.policy
+import email.utils
+import pathlib
+import random
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+import pytz
+
+
+TIMEZONE = pytz.timezone('Asia/Tokyo')
+
+CHARSETS = ('utf-8', 'iso-2022-jp', 'shift_jis', 'euc-jp')
+# plain: text/plain only
+# alternative: text/plain and text/html
+# mixed: the alternative and a PDF attachment
+LAYOUTS = ('plain', 'alternative', 'mixed')
+
+TITLES = (
+        'ソードアート・オンライン',
+        '魔法科高校の劣等生',
+        'とある魔術の禁書目録',
+        'ノーゲーム・ノーライフ',
+        'ダンジョン飯',
+        '葬送のフリーレン',
+        'Re:ゼロから始める異世界生活',
+        '狼と香辛料',
+        'この素晴らしい世界に祝福を!',
+        '86―エイティシックス―')
+
+GOODS = (
+        'USB-C ケーブル 1m',
+        'ワイヤレスマウス',
+        '単3形 アルカリ乾電池 20本パック',
+        'A4 コピー用紙 500枚',
+        'ボールペン 0.5mm 黒',
+        'モバイルバッテリー 10000mAh',
+        'HDMI ケーブル 2m',
+        'microSDXC カード 128GB')
+
+
+def _date(
+        rng: random.Random,
+        *,
+        legacy: bool = False) -> datetime.datetime:
+    # 5 years after, or 3 years before the coin format change
+    if legacy:
+        start = datetime.datetime(2016, 3, 1, tzinfo=datetime.timezone.utc)
+        days = 3 * 365
+    else:
+        start = datetime.datetime(2019, 4, 1, tzinfo=datetime.timezone.utc)
+        days = 5 * 365
+    return (start + datetime.timedelta(
+            seconds=rng.randrange(days * 24 * 60 * 60))).astimezone(
+                    TIMEZONE)
+
+
+def _title(rng: random.Random) -> str:
+    return '{0} {1}'.format(rng.choice(TITLES), rng.randrange(1, 30))
+
+
+def _message(
+        rng: random.Random,
+        subject: str,
+        sender: str,
+        date: datetime.datetime,
+        text: str,
+        *,
+        charset: str = 'utf-8',
+        layout: str = 'plain',
+        padding: int = 0) -> email.message.EmailMessage:
+    if layout not in LAYOUTS:
+        raise ValueError('unknown layout: {0}'.format(layout))
+    message = email.message.EmailMessage()
+    message['Subject'] = subject
+    message['From'] = sender
+    message['To'] = 'user@example.com'
+    message['Date'] = email.utils.format_datetime(date)
+    message['Message-ID'] = '<{0:032x}@example.com>'.format(
+            rng.getrandbits(128))
+    message.set_content(text, charset=charset)
+    if layout != 'plain':
+        message.add_alternative(
+                _html(text, padding),
+                subtype='html',
+                charset=charset)
+    if layout == 'mixed':
+        message.add_attachment(
+                rng.randbytes(padding),
+                maintype='application',
+                subtype='pdf',
+                filename='receipt.pdf')
+    return message
+
+
+def _html(text: str, padding: int) -> str:
+    body = ''.join('<p>{0}</p>\n'.format(line) for line in text.splitlines())
+    style = '<div style="display:none">{0}</div>\n'.format('x' * padding)
+    return '<html><body>\n{0}{1}</body></html>\n'.format(body, style)
+
+
+def amazon(
+        rng: random.Random,
+        *,
+        items: int = 3,
+        orders: int = 1,
+        charset: str = 'utf-8',
+        layout: str = 'alternative') -> email.message.EmailMessage:
+    date = _date(rng)
+    line = '=' * 40
+    blocks: List[str] = []
+    names: List[str] = []
+    for _ in range(orders):
+        order_id = '{0:03d}-{1:07d}-{2:07d}'.format(
+                rng.randrange(1000),
+                rng.randrange(10 ** 7),
+                rng.randrange(10 ** 7))
+        rows: List[str] = []
+        total = 0
+        for _ in range(items):
+            name = rng.choice(GOODS + TITLES)
+            names.append(name)
+            piece = rng.choice((1, 1, 1, 2, 3))
+            unit_price = rng.randrange(100, 5000)
+            total += piece * unit_price
+            rows.append('  {0}{1}\n  ￥ {2:,}\n'.format(
+                    name,
+                    ' - {0} 点'.format(piece) if piece > 1 else '',
+                    unit_price))
+        shipping = rng.choice((0, 0, 410))
+        discount = rng.choice((0, 0, 0, 100))
+        total += shipping - discount
+        blocks.append(
+                'Amazon.co.jp でのご注文\n'
+                '注文番号： {0}\n'
+                'お届け予定： {1:%Y/%m/%d}\n'
+                '{2}'
+                '{3}\n'
+                '配送料・手数料： ￥ {4:,}\n'
+                '{5}'
+                '注文合計： ￥ {6:,}\n'.format(
+                        order_id,
+                        date + datetime.timedelta(days=2),
+                        ''.join(rows),
+                        '_' * 40,
+                        shipping,
+                        '割引： -￥ {0:,}\n'.format(discount)
+                        if discount else '',
+                        total))
+    text = (
+            'Amazon.co.jp をご利用いただき、ありがとうございます。\n'
+            '{0}\n{1}{0}\n'
+            'またのご利用をお待ちしております。\n').format(
+                    line,
+                    '{0}\n'.format(line).join(blocks))
+    return _message(
+            rng,
+            'Amazon.co.jp ご注文の確認 "{0}"'.format(names[0]),
+            'auto-confirm@amazon.co.jp',
+            date,
+            text,
+            charset=charset,
+            layout=layout,
+            padding=20000)
+
+
+def bookwalker(
+        rng: random.Random,
+        *,
+        items: int = 3,
+        type_: str = 'order',
+        coin_format: str = 'latest',
+        charset: str = 'utf-8',
+        layout: str = 'plain') -> email.message.EmailMessage:
+    # type_: order, pre_order or coin
+    # coin_format: legacy (before 2019-03-27 13:00 JST) or latest,
+    # the date is taken from the side of the change
+    if coin_format not in ('legacy', 'latest'):
+        raise ValueError('unknown coin format: {0}'.format(coin_format))
+    date = _date(rng, legacy=coin_format == 'legacy')
+    line = '━' * 30
+    rows: List[str] = []
+    total = 0
+    if type_ == 'coin':
+        coin = rng.choice((1000, 3000, 5000, 10000))
+        total = coin
+        rows.append(
+                '■Item：BOOK☆WALKER 期間限定コイン {0:,}円分'
+                ' (有効期限：購入から6ヶ月)\n'
+                '■Amount：1\n'.format(coin))
+    else:
+        for _ in range(items):
+            price = rng.randrange(100, 1500)
+            total += price
+            rows.append(
+                    '■Title / Item：{0}\n'
+                    '■Price：JPY {1:,} (+Tax)\n'.format(_title(rng), price))
+    discount = -rng.choice((0, 0, 100)) if type_ != 'coin' else 0
+    tax = (total + discount) // 10 if type_ != 'coin' else 0
+    amount = total + discount + tax
+    coin_usage = (
+            -min(rng.choice((0, 0, 300)), amount) if type_ != 'coin' else 0)
+    # the normal coins and the limited ones of a campaign
+    granted = [amount // 10 if type_ != 'coin' else coin // 20]
+    if type_ != 'coin' and rng.random() < 0.3:
+        granted.append(amount // 20)
+    bonus = rng.choice((0, 0, 50))
+    if coin_format == 'legacy':
+        granted_text = (
+                '■Granted Coin(s)：{0:,} Coin(s)\n'
+                '{1}'.format(
+                        sum(granted),
+                        ''.join(
+                                '  * Limited Coin： {0:,} Coin(s)\n'.format(
+                                        coin)
+                                for coin in granted[1:])))
+    else:
+        granted_text = (
+                '■Granted Coin：{0:,} coins\n'
+                '{1}'.format(
+                        sum(granted),
+                        ''.join(
+                                '  ┗ {0:,} coins ({1}) {2}%\n'.format(
+                                        coin,
+                                        '通常コイン' if i == 0
+                                        else '期間限定コイン',
+                                        10 if i == 0 else 5)
+                                for i, coin in enumerate(granted))))
+    text = (
+            'BOOK☆WALKER をご利用いただき、ありがとうございます。\n'
+            '\n'
+            '[Your Order]\n'
+            '{line}\n'
+            '■Order Number：{number}\n'
+            '■Purchased Date：{date:%Y/%m/%d %H:%M} (JST)\n'
+            '{line}\n'
+            '{rows}'
+            '{line}\n'
+            '{discount}'
+            '{tax}'
+            '■Total Amount：JPY {amount:,}\n'
+            '{coin_usage}'
+            '■Total Payment：JPY {payment:,}\n'
+            '{granted}'
+            '{bonus}'
+            '■Payment Method：Credit Card\n'
+            '{line}\n'
+            '\n'
+            'BOOK☆WALKER\n').format(
+                    line=line,
+                    number=rng.randrange(10 ** 9),
+                    date=date,
+                    rows='\n'.join(rows),
+                    discount=(
+                            '■Coupon Discount：JPY {0:,}\n'.format(discount)
+                            if discount else ''),
+                    tax='■Tax：JPY {0:,}\n'.format(tax) if tax else '',
+                    amount=amount,
+                    coin_usage=(
+                            '■Coin Usage (1 Coin = JPY 1)：JPY {0:,}\n'.format(
+                                    coin_usage)
+                            if coin_usage else ''),
+                    payment=amount + coin_usage,
+                    granted=granted_text,
+                    bonus=(
+                            '■Bonus Coin：{0:,}\n'.format(bonus)
+                            if bonus else ''))
+    subject = (
+            'BOOK☆WALKER: Order Confirmation for Pre-ordered eBooks'
+            if type_ == 'pre_order'
+            else 'BOOK☆WALKER: Order Confirmation')
+    return _message(
+            rng,
+            subject,
+            'info@bookwalker.jp',
+            date,
+            text,
+            charset=charset,
+            layout=layout,
+            padding=5000)
+
+
+def melonbooks(
+        rng: random.Random,
+        *,
+        items: int = 3,
+        charset: str = 'utf-8',
+        layout: str = 'plain') -> email.message.EmailMessage:
+    date = _date(rng)
+    rows: List[str] = []
+    total = 0
+    for _ in range(items):
+        piece = rng.choice((1, 1, 2))
+        unit_price = rng.randrange(100, 3000)
+        price = piece * unit_price * 11 // 10
+        total += price
+        rows.append(
+                '商品名: {0}\n'
+                '数量: {1} 個\n'
+                '単価: {2:,} 円 + 消費税\n'
+                '商品合計額: {3:,} 円 (税込)\n'
+                '\n'.format(_title(rng), piece, unit_price, price))
+    shipping = rng.choice((0, 550, 770))
+    charge = rng.choice((0, 0, 330))
+    point_usage = rng.choice((0, 0, 100))
+    text = (
+            'メロンブックス通販をご利用いただき、ありがとうございます。\n'
+            '\n'
+            '●ご注文番号\n'
+            '{0}\n'
+            '●ご注文内容\n'
+            '{1}'
+            '●合計\n'
+            '送料: {2:,}円(税込)\n'
+            '手数料: {3:,}円(税込)\n'
+            '合計額: {4:,}円(税込)\n'
+            '利用ポイント数: {5:,}\n'
+            '獲得予定ポイント数: {6:,}\n').format(
+                    rng.randrange(10 ** 8),
+                    ''.join(rows),
+                    shipping,
+                    charge,
+                    total + shipping + charge - point_usage,
+                    point_usage,
+                    total // 100)
+    return _message(
+            rng,
+            '【メロンブックス／フロマージュブックス】 ご注文の確認',
+            'info@melonbooks.co.jp',
+            date,
+            text,
+            charset=charset,
+            layout=layout,
+            padding=5000)
+
+
+def yodobashi(
+        rng: random.Random,
+        *,
+        items: int = 3,
+        charset: str = 'utf-8',
+        layout: str = 'alternative') -> email.message.EmailMessage:
+    date = _date(rng)
+    rows: List[str] = []
+    total = 0
+    for _ in range(items):
+        piece = rng.choice((1, 1, 2))
+        price = piece * rng.randrange(100, 20000)
+        total += price
+        rows.append(
+                '・「{0}」\n'
+                '　　配達希望日：指定なし\n'
+                '　　合計 {1} 点  {2:,} 円\n'.format(
+                        rng.choice(GOODS), piece, price))
+    used_point = rng.choice((0, 0, 100))
+    text = (
+            'ヨドバシ・ドット・コムをご利用いただき、ありがとうございます。\n'
+            '\n'
+            '【ご注文商品】\n'
+            '{0}\n'
+            '{1}'
+            '・配達料金：  0 円\n'
+            '{0}\n'
+            '【お支払方法】\n'
+            'ゴールドポイントでのお支払い  {2} 円\n'
+            '今回の還元ゴールドポイント数  {3:,} ポイント\n').format(
+                    '-' * 40,
+                    ''.join(rows),
+                    used_point,
+                    total // 10)
+    return _message(
+            rng,
+            'ヨドバシ・ドット・コム：ご注文ありがとうございます',
+            'thanks_gbizmail@yodobashi.com',
+            date,
+            text,
+            charset=charset,
+            layout=layout,
+            padding=5000)
+
+
+def newsletter(rng: random.Random) -> email.message.EmailMessage:
+    text = '\n'.join(
+            '{0} が入荷しました。'.format(_title(rng)) for _ in range(20))
+    return _message(
+            rng,
+            '【新着情報】今週のおすすめ',
+            'news@example.com',
+            _date(rng),
+            text,
+            layout='alternative',
+            padding=50000)
+
+
+VENDOR: Dict[str, Callable[..., email.message.EmailMessage]] = {
+        'amazon': amazon,
+        'bookwalker': bookwalker,
+        'melonbooks': melonbooks,
+        'yodobashi': yodobashi}
+
+
+def generate(
+        vendor: str,
+        count: int,
+        *,
+        seed: int = 0,
+        noise: float = 0.0,
+        **kwargs: Any) -> Iterator[bytes]:
+    rng = random.Random('{0}:{1}'.format(vendor, seed))
+    for _ in range(count):
+        if rng.random() < noise:
+            message = newsletter(rng)
+        else:
+            message = VENDOR[vendor](rng, **kwargs)
+        yield message.as_bytes(policy=email.policy.SMTP)
+
+
+def write_directory(
+        directory: pathlib.Path,
+        mails: Iterable[bytes]) -> int:
+    directory.mkdir(parents=True, exist_ok=True)
+    count = 0
+    for i, mail in enumerate(mails):
+        directory.joinpath('{0:06d}.eml'.format(i)).write_bytes(mail)
+        count += 1
+    return count
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+from typing import Any, Callable, Dict, List, Tuple
+import receipt_mail.amazon._mail
+import receipt_mail.bookwalker._mail
+import receipt_mail.melonbooks._mail
+import receipt_mail.yodobashi._mail
+from receipt_mail._grammar import Grammar
+import vendors
+from . import generator
+
+
+# the grammars of each vendor and the texts they parse
+INPUT: Dict[str, List[Tuple[Grammar, Callable[[Any], List[str]]]]] = {
+        'amazon': [
+                (receipt_mail.amazon._mail.MAIL_GRAMMAR,
+                 lambda mail: [
+                        text.replace('\r\n', '\n')
+                        for text in mail.text_list()]),
+                (receipt_mail.amazon._mail.ORDER_GRAMMAR,
+                 lambda mail: mail.order())],
+        'bookwalker': [
+                (receipt_mail.bookwalker._mail.GRAMMAR,
+                 lambda mail: [mail.order() or ''])],
+        'melonbooks': [
+                (receipt_mail.melonbooks._mail.GRAMMAR,
+                 lambda mail: [mail.text()])],
+        'yodobashi': [
+                (receipt_mail.yodobashi._mail.GRAMMAR,
+                 lambda mail: mail.text_list())]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+            description='match cost of each pattern in the vendor grammars')
+    parser.add_argument(
+            '--vendor', choices=sorted(INPUT), action='append',
+            help='vendors to profile (default: all)')
+    parser.add_argument(
+            '--mails', type=int, default=1000,
+            help='generated mails')
+    parser.add_argument(
+            '--items', type=int, default=3,
+            help='items per generated mail')
+    option = parser.parse_args()
+    for vendor in option.vendor or sorted(INPUT):
+        mail_class: Any = vendors.VENDOR[vendor].mail_class
+        mail_list = [
+                mail_class.read_binary(binary)
+                for binary in generator.generate(
+                        vendor,
+                        option.mails,
+                        items=option.items)]
+        for grammar, text_of in INPUT[vendor]:
+            text_list = [
+                    text for mail in mail_list for text in text_of(mail)]
+            cost_list = grammar.cost(text_list)
+            total = sum(cost.seconds for cost in cost_list) or 1.0
+            print('{0}: {1} texts'.format(grammar.name, len(text_list)))
+            for cost in sorted(
+                    cost_list,
+                    key=lambda x: x.seconds,
+                    reverse=True):
+                print('  {0:<32} {1:>6} calls {2:>6} hits'
+                      ' {3:>9.1f} us/call {4:>5.1f}%'.format(
+                            cost.name,
+                            cost.calls,
+                            cost.hits,
+                            cost.seconds * 1e6 / max(cost.calls, 1),
+                            cost.seconds * 100 / total))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import importlib
+import time
+import unittest.mock
+from typing import Any, Dict, List, Match, Pattern
+import vendors
+from . import generator
+
+
+def legacy_extract_all(
+        pattern: Pattern[str],
+        text: str) -> List[Match[str]]:
+    # search & sub(count=1) until no match, as the parsers did before
+    match_list: List[Match[str]] = []
+    match = pattern.search(text)
+    while match:
+        text = pattern.sub('', text, count=1)
+        match_list.append(match)
+        match = pattern.search(text)
+    return match_list
+
+
+def run(
+        vendor: str,
+        binary_list: List[bytes],
+        legacy: bool) -> Dict[str, Any]:
+    mail_class: Any = vendors.VENDOR[vendor].mail_class
+    # the item rows of every vendor are extracted by the grammar
+    module = importlib.import_module('receipt_mail._grammar')
+    # decode outside of the measurement
+    mail_list = [mail_class.read_binary(binary) for binary in binary_list]
+    for mail in mail_list:
+        mail.text_list()
+    with unittest.mock.patch.object(
+            module,
+            'extract_all',
+            legacy_extract_all if legacy else module.extract_all):
+        start = time.perf_counter()
+        receipt_list = [mail.receipt() for mail in mail_list]
+        elapsed = time.perf_counter() - start
+    return {
+            'items': [
+                    item
+                    for receipts in receipt_list
+                    for receipt in receipts
+                    for item in receipt.items],
+            'seconds': elapsed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+            description='item extraction benchmark of bulk orders')
+    parser.add_argument(
+            '--vendor', choices=sorted(generator.VENDOR), action='append',
+            help='vendors to measure (default: all)')
+    parser.add_argument(
+            '--mails', type=int, default=20,
+            help='generated mails')
+    parser.add_argument(
+            '--items', type=int, action='append', default=[],
+            help='items per generated order (repeatable)')
+    option = parser.parse_args()
+    for vendor in option.vendor or sorted(generator.VENDOR):
+        for items in option.items or [10, 100, 1000]:
+            binary_list = list(generator.generate(
+                    vendor,
+                    option.mails,
+                    items=items))
+            legacy = run(vendor, binary_list, True)
+            scan = run(vendor, binary_list, False)
+            print('{0} {1} items: legacy {2:.3f} s, scan {3:.3f} s,'
+                  ' speedup {4:.2f}, same amounts: {5}, renamed: {6}'.format(
+                        vendor,
+                        items,
+                        legacy['seconds'],
+                        scan['seconds'],
+                        legacy['seconds'] / scan['seconds'],
+                        [(item.price, item.piece) for item in legacy['items']]
+                        == [(item.price, item.piece)
+                            for item in scan['items']],
+                        sum(1 for old, new
+                            in zip(legacy['items'], scan['items'])
+                            if old.name != new.name)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import gc
+import json
+import logging
+import pathlib
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import pytz
+import yaml
+import utility
+import vendors
+from . import generator
+
+
+DEFAULT_BASELINE = pathlib.Path(__file__).with_name('baseline.json')
+TIMEZONE = pytz.timezone('Asia/Tokyo')
+STAGES = (
+        'read_file',
+        'is_receipt',
+        'receipt',
+        'aggregate',
+        'write_markdown',
+        'write_gnucash_csv')
+# the receipt types and both granted coin formats of BOOK☆WALKER
+BOOKWALKER_VARIANTS: Tuple[Dict[str, Any], ...] = tuple(
+        {'type_': type_, 'coin_format': coin_format}
+        for type_ in ('order', 'pre_order', 'coin')
+        for coin_format in ('legacy', 'latest'))
+
+
+def calibrate() -> float:
+    # a fixed workload, the throughput is compared in its units
+    seconds: List[float] = []
+    for _ in range(5):
+        start = time.perf_counter()
+        sum(i * i for i in range(200000))
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+def workload(
+        vendor: str,
+        mails: int,
+        option: argparse.Namespace) -> List[bytes]:
+    kwargs: Dict[str, Any] = {
+            'items': option.items,
+            'charset': option.charset,
+            'noise': option.noise}
+    if option.layout is not None:
+        kwargs['layout'] = option.layout
+    if vendor != 'bookwalker':
+        return list(generator.generate(vendor, mails, **kwargs))
+    result: List[bytes] = []
+    for seed, variant in enumerate(BOOKWALKER_VARIANTS):
+        result.extend(generator.generate(
+                vendor,
+                mails // len(BOOKWALKER_VARIANTS),
+                seed=seed,
+                **variant,
+                **kwargs))
+    return result
+
+
+def measure(
+        run: Callable[[Any], int],
+        prepare: Callable[[], Any],
+        repeat: int) -> Dict[str, Any]:
+    # the best time of repeat runs, the peak memory of one more traced run
+    seconds: List[float] = []
+    for _ in range(repeat):
+        data = prepare()
+        gc.collect()
+        start = time.perf_counter()
+        count = run(data)
+        seconds.append(time.perf_counter() - start)
+    data = prepare()
+    gc.collect()
+    tracemalloc.start()
+    run(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+            'count': count,
+            'per_second': count / min(seconds),
+            'peak_bytes': peak}
+
+
+def run_vendor(
+        vendor: str,
+        directory: pathlib.Path,
+        option: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    logger = logging.getLogger('benchmark.suite')
+    mail_class: Any = vendors.VENDOR[vendor].mail_class
+    to_markdown = vendors.VENDOR[vendor].to_markdown
+    to_gnucash = vendors.VENDOR[vendor].to_gnucash
+    workspace = directory.joinpath(vendor)
+    generator.write_directory(
+            workspace.joinpath('mail'),
+            workload(vendor, option.mails, option))
+    path_list = sorted(workspace.joinpath('mail').iterdir())
+    config_path = workspace.joinpath('config.yaml')
+    with config_path.open(mode='w') as config_file:
+        yaml.dump(
+                {'target': {vendor: {'workspace': workspace.as_posix()}},
+                 'aggregate': {'cache': False, 'workers': 1},
+                 'dedup': {'enable': False},
+                 'store': {'enable': False}},
+                config_file)
+
+    def read_all() -> List[Any]:
+        return [mail_class.read_file(path) for path in path_list]
+
+    def receipt_mails() -> List[Any]:
+        # read again, the sections are memoized per mail
+        return [mail for mail in read_all() if mail.is_receipt()]
+
+    receipt_list = sorted(
+            (receipt
+             for mail in receipt_mails()
+             for receipt in mail.receipt()),
+            key=lambda x: x.purchased_date)
+
+    def write_markdown(_: Any) -> int:
+        utility.write_markdown(
+                workspace.joinpath('bench.md'),
+                receipt_list,
+                to_markdown,
+                timezone=TIMEZONE)
+        return len(receipt_list)
+
+    def write_gnucash_csv(_: Any) -> int:
+        utility.write_gnucash_csv(
+                workspace.joinpath('bench.csv'),
+                receipt_list,
+                to_gnucash,
+                timezone=TIMEZONE)
+        return len(receipt_list)
+
+    def aggregate(_: Any) -> int:
+        utility.aggregate(
+                vendor,
+                config_path,
+                mail_class,
+                to_markdown,
+                to_gnucash,
+                timezone=TIMEZONE,
+                logger=logger)
+        return len(path_list)
+
+    stage: Dict[str, Callable[[], Dict[str, Any]]] = {
+            'read_file': lambda: measure(
+                    lambda _: len(read_all()),
+                    lambda: None,
+                    option.repeat),
+            'is_receipt': lambda: measure(
+                    lambda mail_list: sum(
+                            1 for mail in mail_list if mail.is_receipt()),
+                    read_all,
+                    option.repeat),
+            'receipt': lambda: measure(
+                    lambda mail_list: sum(
+                            len(mail.receipt()) for mail in mail_list),
+                    receipt_mails,
+                    option.repeat),
+            'aggregate': lambda: measure(
+                    aggregate,
+                    lambda: None,
+                    option.repeat),
+            'write_markdown': lambda: measure(
+                    write_markdown,
+                    lambda: None,
+                    option.repeat),
+            'write_gnucash_csv': lambda: measure(
+                    write_gnucash_csv,
+                    lambda: None,
+                    option.repeat)}
+    return {name: stage[name]() for name in STAGES}
+
+
+def compare(
+        current: Dict[str, Any],
+        baseline: Dict[str, Any],
+        option: argparse.Namespace) -> List[str]:
+    # throughput in the calibration units, the counts must not change
+    regression: List[str] = []
+    scale = current['calibration'] / baseline['calibration']
+    for vendor, stage_result in current['result'].items():
+        for name, result in stage_result.items():
+            base = baseline['result'].get(vendor, {}).get(name)
+            if base is None:
+                continue
+            speed = result['per_second'] * scale / base['per_second']
+            memory = result['peak_bytes'] / max(1, base['peak_bytes'])
+            result['speed'] = speed
+            result['memory'] = memory
+            if result['count'] != base['count']:
+                regression.append('{0} {1}: count {2} != {3}'.format(
+                        vendor, name, result['count'], base['count']))
+            if speed < 1.0 - option.tolerance:
+                regression.append('{0} {1}: {2:.2f}x throughput'.format(
+                        vendor, name, speed))
+            if memory > 1.0 + option.memory_tolerance:
+                regression.append('{0} {1}: {2:.2f}x peak memory'.format(
+                        vendor, name, memory))
+    return regression
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+            description='parse path benchmark against a stored baseline')
+    parser.add_argument(
+            '--vendor', choices=sorted(generator.VENDOR), action='append',
+            help='vendors to measure (default: all)')
+    parser.add_argument(
+            '--mails', type=int, default=240,
+            help='generated mails per vendor')
+    parser.add_argument(
+            '--items', type=int, default=3,
+            help='items per generated order')
+    parser.add_argument(
+            '--charset', choices=generator.CHARSETS, default='utf-8')
+    parser.add_argument(
+            '--layout', choices=generator.LAYOUTS,
+            help='MIME layout (default: the one of each vendor)')
+    parser.add_argument(
+            '--noise', type=float, default=0.1,
+            help='ratio of the mails that are not receipts')
+    parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='timed runs of each stage, the best is taken')
+    parser.add_argument(
+            '--baseline', type=pathlib.Path, default=DEFAULT_BASELINE)
+    parser.add_argument(
+            '--save', action='store_true',
+            help='store the result as the baseline')
+    parser.add_argument(
+            '--tolerance', type=float, default=0.3,
+            help='allowed throughput loss against the baseline')
+    parser.add_argument(
+            '--memory-tolerance', type=float, default=0.25,
+            help='allowed peak memory growth against the baseline')
+    option = parser.parse_args()
+    parameter = {
+            'mails': option.mails,
+            'items': option.items,
+            'charset': option.charset,
+            'layout': option.layout,
+            'noise': option.noise}
+    current: Dict[str, Any] = {
+            'parameter': parameter,
+            'calibration': calibrate(),
+            'result': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for vendor in option.vendor or sorted(generator.VENDOR):
+            current['result'][vendor] = run_vendor(
+                    vendor,
+                    pathlib.Path(directory),
+                    option)
+    baseline: Optional[Dict[str, Any]] = None
+    regression: List[str] = []
+    if not option.save and option.baseline.exists():
+        with option.baseline.open() as baseline_file:
+            baseline = json.load(baseline_file)
+        assert baseline is not None
+        if baseline['parameter'] != parameter:
+            print('baseline is measured with {0}, not compared'.format(
+                    baseline['parameter']))
+            baseline = None
+        else:
+            regression = compare(current, baseline, option)
+    for vendor, stage_result in current['result'].items():
+        for name, result in stage_result.items():
+            print('{0:10} {1:17} {2:6d} {3:10.1f}/s {4:10.1f} KiB{5}'.format(
+                    vendor,
+                    name,
+                    result['count'],
+                    result['per_second'],
+                    result['peak_bytes'] / 1024,
+                    ' speed {0:.2f}x, memory {1:.2f}x'.format(
+                            result['speed'],
+                            result['memory'])
+                    if 'speed' in result else ''))
+    if option.save:
+        with option.baseline.open(mode='w') as baseline_file:
+            json.dump(current, baseline_file, indent=4, sort_keys=True)
+            baseline_file.write('\n')
+        print('baseline is saved to {0}'.format(option.baseline))
+    for line in regression:
+        print('regression: {0}'.format(line))
+    return 1 if regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
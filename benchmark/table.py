@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import gc
+import pickle
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+import receipt_table
+import vendors
+from . import generator
+
+
+def measure(build: Callable[[], Any]) -> Dict[str, Any]:
+    # the memory held by the result of build
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'result': result, 'bytes': size, 'seconds': elapsed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+            description='memory of the receipts in a list and a ReceiptTable')
+    parser.add_argument(
+            '--vendor', choices=sorted(generator.VENDOR), action='append',
+            help='vendors to measure (default: all)')
+    parser.add_argument(
+            '--mails', type=int, default=2000,
+            help='generated mails')
+    parser.add_argument(
+            '--items', type=int, default=3,
+            help='items per generated order')
+    option = parser.parse_args()
+    for vendor in option.vendor or sorted(generator.VENDOR):
+        mail_class: Any = vendors.VENDOR[vendor].mail_class
+        # each receipt unpickled by itself, as it comes from the parse cache
+        binary_list: List[bytes] = []
+        for binary in generator.generate(
+                vendor,
+                option.mails,
+                items=option.items):
+            mail = mail_class.read_binary(binary)
+            if mail.is_receipt():
+                binary_list.extend(
+                        pickle.dumps(receipt) for receipt in mail.receipt())
+        receipt_list = measure(lambda: [
+                pickle.loads(binary) for binary in binary_list])
+        table = measure(lambda: receipt_table.ReceiptTable(
+                pickle.loads(binary) for binary in binary_list))
+        items = sum(len(receipt.items) for receipt in receipt_list['result'])
+        print('{0}: {1} receipts, {2} items, list {3:.1f} KiB,'
+              ' table {4:.1f} KiB ({5:.1f} KiB in columns),'
+              ' ratio {6:.2f}, build {7:.3f} s, same receipts: {8}'.format(
+                    vendor,
+                    len(binary_list),
+                    items,
+                    receipt_list['bytes'] / 1024,
+                    table['bytes'] / 1024,
+                    table['result'].nbytes() / 1024,
+                    receipt_list['bytes'] / table['bytes'],
+                    table['seconds'],
+                    list(table['result']) == receipt_list['result']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import datetime
+import functools
+import logging
+import pathlib
+from typing import Any, Callable, Dict, List, Optional, Set, TypeVar
+import imapclient
+import pytz
+import yaml
+import dedup
+import download
+import imap_utility
+import parse_cache
+import receipt_store
+import receipt_table
+import utility
+import vendors
+
+
+DEFAULT_IDLE_TIMEOUT = 60.0
+DEFAULT_MIN_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 300.0
+
+
+T = TypeVar('T')
+
+
+class Watcher:
+    def __init__(
+            self,
+            name: str,
+            config: Dict[str, Any],
+            vendor: utility.Vendor,
+            *,
+            index: Optional[dedup.DedupIndex] = None,
+            timezone: Optional[datetime.tzinfo] = None,
+            logger: Optional[logging.Logger] = None) -> None:
+        self.name = name
+        self.config = config
+        self.vendor = vendor
+        self.index = index
+        self.timezone = timezone
+        self.logger = logger or logging.getLogger(__name__)
+        target = config['target'][name]
+        self.mailbox: str = target['mailbox']
+        self.workspace = pathlib.Path(target['workspace'])
+        self.since = datetime.date(
+                year=config['since']['year'],
+                month=config['since']['month'],
+                day=config['since']['day'])
+        download_config = config.get('download') or {}
+        self.option = download.download_option(download_config)
+        self.use_triage = download_config.get('triage', True) is not False
+        daemon_config = config.get('daemon') or {}
+        self.idle_timeout = float(
+                daemon_config.get('idle_timeout') or DEFAULT_IDLE_TIMEOUT)
+        self.min_backoff = float(
+                daemon_config.get('min_backoff') or DEFAULT_MIN_BACKOFF)
+        self.max_backoff = float(
+                daemon_config.get('max_backoff') or DEFAULT_MAX_BACKOFF)
+        # the whole history in columns
+        self.receipt_list: receipt_table.ReceiptTable[Any] = (
+                receipt_table.ReceiptTable(timezone=timezone))
+        self.parsed: Set[pathlib.Path] = set()
+        # the incremental mode: the receipts not in the ledger yet
+        aggregate_config = config.get('aggregate') or {}
+        self.ledger = (
+                utility.ExportLedger(self.workspace.joinpath(
+                        '{0}.exported'.format(name)))
+                if aggregate_config.get('incremental', False) else None)
+        self.pending: List[utility.ReceiptRecord] = []
+        self._backoff = self.min_backoff
+
+    async def run(self) -> None:
+        await self._call(self._load)
+        while True:
+            try:
+                await self._session()
+            except (imapclient.exceptions.IMAPClientError,
+                    imapclient.exceptions.IMAPClientAbortError,
+                    OSError) as error:
+                self.logger.warning(
+                        '%s: session is dropped (%s: %s),'
+                        ' reconnect in %.0f seconds',
+                        self.name,
+                        type(error).__name__,
+                        error,
+                        self._backoff)
+                await asyncio.sleep(self._backoff)
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    async def _session(self) -> None:
+        client = await self._call(
+                imap_utility.connect,
+                self.config['host'],
+                self.config['username'],
+                self.config['password'],
+                port=self.config.get('port'),
+                ssl=self.config.get('ssl', True) is not False,
+                name=self.name,
+                logger=self.logger)
+        try:
+            self._backoff = self.min_backoff
+            # catch up with the mails while disconnected
+            await self._call(self._sync, client)
+            while True:
+                await self._call(client.idle)
+                responses = await self._call(
+                        client.idle_check,
+                        self.idle_timeout)
+                _, done_responses = await self._call(client.idle_done)
+                responses.extend(done_responses)
+                self.logger.debug('%s: IDLE %s', self.name, responses)
+                if any(len(response) >= 2 and response[1] == b'EXISTS'
+                       for response in responses):
+                    self.logger.info('%s: new mail is arrived', self.name)
+                    await self._call(self._sync, client)
+        finally:
+            await self._call(_logout, client)
+
+    def _load(self) -> None:
+        mail_directory = self.workspace.joinpath('mail')
+        if not mail_directory.exists():
+            return
+        aggregate_config = self.config.get('aggregate') or {}
+        cache = parse_cache.open_cache(
+                self.workspace,
+                self.vendor.mail_class,
+                self.config,
+                logger=self.logger)
+        mail_list = utility.list_mail(
+                mail_directory,
+                index=self.index,
+                cache=cache,
+                logger=self.logger)
+        record_iter = utility.iter_receipt_record(
+                mail_list,
+                self.vendor.mail_class,
+                workers=(
+                        aggregate_config.get('workers')
+                        or utility.DEFAULT_WORKERS),
+                chunk_size=(
+                        aggregate_config.get('chunk_size')
+                        or utility.DEFAULT_CHUNK_SIZE),
+                cache=cache,
+                logger=self.logger)
+        # the store is brought up to the mails as aggregate does
+        store = receipt_store.open_store(self.config, logger=self.logger)
+        if store is not None:
+            record_iter = store.insert_stream(
+                    self.name,
+                    record_iter,
+                    replace=True)
+        # the receipts go into the columns as they are parsed
+        for record in record_iter:
+            self.receipt_list.append(record.receipt)
+            if self.ledger is not None and record.id not in self.ledger:
+                self.pending.append(record)
+        if store is not None:
+            store.close()
+        if cache is not None:
+            cache.prune()
+            cache.close()
+        self.parsed.update(mail_list)
+        self.logger.info(
+                '%s: %d receipts are loaded',
+                self.name,
+                len(self.receipt_list))
+        self._write()
+
+    def _sync(self, client: imapclient.IMAPClient) -> None:
+        state_path = self.workspace.joinpath('sync.yaml')
+        state = imap_utility.load_sync_state(state_path, logger=self.logger)
+        mail_directory = self.workspace.joinpath('mail')
+        plan = download.plan_download(
+                client,
+                mailbox=self.mailbox,
+                since=self.since,
+                state=state,
+                directory=mail_directory,
+                mail_class=(
+                        download.triage_class(
+                                self.name,
+                                self.config['target'][self.name])
+                        if self.use_triage else None),
+                index=self.index,
+                logger=self.logger)
+        if not mail_directory.exists():
+            mail_directory.mkdir(parents=True)
+        imap_utility.remove_temp_files(mail_directory, logger=self.logger)
+        # the mails are removed by plan_download
+        if plan.reset:
+            self.receipt_list.clear()
+            self.parsed.clear()
+            self.pending.clear()
+        journal = imap_utility.Journal(
+                self.workspace.joinpath('sync.journal'),
+                plan.state.uid_validity,
+                logger=self.logger)
+        try:
+            imap_utility.download_mails(
+                    client,
+                    plan.uids,
+                    mail_directory,
+                    option=self.option,
+                    index=self.index,
+                    journal=journal,
+                    logger=self.logger)
+        except BaseException:
+            journal.close()
+            raise
+        imap_utility.save_sync_state(state_path, plan.state)
+        journal.clear()
+        # parse only the new mails
+        record_list: List[utility.ReceiptRecord] = []
+        for uid in plan.uids:
+            mail_file = mail_directory.joinpath(str(uid))
+            # skipped as a duplicate, or loaded after an interrupted run
+            if not mail_file.exists() or mail_file in self.parsed:
+                continue
+            # a parser error drops only this mail, not the watcher;
+            # it is not parsed again until the watcher is restarted
+            try:
+                record_list.extend(utility.read_receipt_record(
+                        mail_file,
+                        self.vendor.mail_class,
+                        logger=self.logger))
+            except Exception:  # pylint: disable=broad-except
+                self.logger.exception(
+                        '%s: failed to parse %s',
+                        self.name,
+                        mail_file.as_posix())
+            self.parsed.add(mail_file)
+        self.logger.info(
+                '%s: %d new mails, %d new receipts',
+                self.name,
+                len(plan.uids),
+                len(record_list))
+        # the new receipts are searchable at once
+        if record_list:
+            store = receipt_store.open_store(self.config, logger=self.logger)
+            if store is not None:
+                store.insert(self.name, record_list)
+                store.close()
+        if record_list or plan.reset:
+            self.receipt_list.extend(record.receipt for record in record_list)
+            if self.ledger is not None:
+                self.pending.extend(record_list)
+            self._write()
+
+    def _write(self) -> None:
+        self.receipt_list.sort()
+        if self.ledger is None:
+            utility.write_output(
+                    self.workspace,
+                    self.name,
+                    self.receipt_list,
+                    self.vendor.to_markdown,
+                    self.vendor.to_gnucash,
+                    timezone=self.timezone,
+                    logger=self.logger)
+            return
+        # only the new receipts are appended to the csv as aggregate does
+        utility.append_output(
+                self.workspace,
+                self.name,
+                sorted(
+                        self.pending,
+                        key=lambda x: x.receipt.purchased_date),
+                self.vendor.to_markdown,
+                self.vendor.to_gnucash,
+                self.ledger,
+                timezone=self.timezone,
+                logger=self.logger,
+                receipt_list=self.receipt_list)
+        self.pending.clear()
+
+    async def _call(self, function: Callable[..., T], *args: Any,
+                    **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+                None,
+                functools.partial(function, *args, **kwargs))
+
+
+def _logout(client: imapclient.IMAPClient) -> None:
+    try:
+        client.logout()
+    except Exception:  # pylint: disable=broad-except
+        client.shutdown()
+
+
+async def watch(
+        config: Dict[str, Any],
+        *,
+        timezone: Optional[datetime.tzinfo] = None,
+        logger: Optional[logging.Logger] = None) -> None:
+    logger = logger or logging.getLogger(__name__)
+    index = dedup.open_index(config, logger=logger)
+    watchers: List[Watcher] = []
+    for name, target in config['target'].items():
+        if target.get('mixed', False):
+            logger.warning('%s: mixed target is not watched, skip', name)
+            continue
+        if name not in vendors.VENDOR:
+            logger.warning('%s: unknown vendor, skip', name)
+            continue
+        watchers.append(Watcher(
+                name,
+                config,
+                vendors.VENDOR[name],
+                index=index,
+                timezone=timezone,
+                logger=logger))
+    try:
+        await asyncio.gather(*(watcher.run() for watcher in watchers))
+    finally:
+        if index is not None:
+            index.close()
+
+
+def main(*, logger: Optional[logging.Logger] = None) -> None:
+    logger = logger or logging.getLogger(__name__)
+    # config
+    config_path = pathlib.Path('config.yaml')
+    with config_path.open() as config_file:
+        config = yaml.load(
+                config_file,
+                Loader=yaml.SafeLoader)
+    asyncio.run(watch(
+            config,
+            timezone=pytz.timezone('Asia/Tokyo'),
+            logger=logger))
+
+
+if __name__ == '__main__':
+    _logger = logging.getLogger('daemon')
+    _logger.setLevel(logging.INFO)
+    handler = logging.StreamHandler()
+    handler.formatter = logging.Formatter(
+                fmt='%(name)s::%(levelname)s::%(message)s')
+    _logger.addHandler(handler)
+    main(logger=_logger)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import math
+import pathlib
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+DEFAULT_INDEX_PATH = 'dedup.sqlite3'
+DEFAULT_CAPACITY = 1 << 20
+DEFAULT_ERROR_RATE = 0.01
+READ_SIZE = 8192
+
+
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+
+_MESSAGE_ID = re.compile(
+        rb'^message-id:[ \t]*(?:\r?\n[ \t]+)?(<[^>\r\n]+>)',
+        re.IGNORECASE | re.MULTILINE)
+
+
+def header_part(binary: bytes) -> bytes:
+    match = re.search(rb'\r?\n\r?\n', binary)
+    return binary[:match.start()] if match else binary
+
+
+def message_id_key(header: bytes) -> Optional[str]:
+    match = _MESSAGE_ID.search(header)
+    if match is None:
+        return None
+    return 'message-id:{0}'.format(
+            match.group(1).decode('ascii', errors='replace'))
+
+
+def mail_key(binary: bytes) -> str:
+    # Message-ID, or the content hash if the mail has no Message-ID
+    return (
+            message_id_key(header_part(binary))
+            or 'sha256:{0}'.format(hashlib.sha256(binary).hexdigest()))
+
+
+def file_key(path: pathlib.Path) -> str:
+    return file_header(path)[1]
+
+
+def file_header(path: pathlib.Path) -> Tuple[bytes, str]:
+    # the header and the key of a mail file,
+    # read only the header unless the mail has no Message-ID
+    header = b''
+    with path.open(mode='rb') as mail_file:
+        while True:
+            chunk = mail_file.read(READ_SIZE)
+            header += chunk
+            if not chunk or re.search(rb'\r?\n\r?\n', header):
+                break
+        key = message_id_key(header_part(header))
+        if key is not None:
+            return header_part(header), key
+        digest = hashlib.sha256(header)
+        for chunk in iter(lambda: mail_file.read(READ_SIZE), b''):
+            digest.update(chunk)
+    return header_part(header), 'sha256:{0}'.format(digest.hexdigest())
+
+
+class BloomFilter:
+    def __init__(
+            self,
+            capacity: int = DEFAULT_CAPACITY,
+            error_rate: float = DEFAULT_ERROR_RATE) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(
+                8,
+                int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+                self._bits[position >> 3] & (1 << (position & 7))
+                for position in self._positions(key))
+
+    def _positions(self, key: str) -> Iterator[int]:
+        # double hashing: h1 + i * h2
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+
+class DedupIndex:
+    def __init__(
+            self,
+            path: pathlib.Path,
+            *,
+            capacity: int = DEFAULT_CAPACITY,
+            error_rate: float = DEFAULT_ERROR_RATE,
+            logger: Optional[logging.Logger] = None) -> None:
+        self.path = path
+        self.error_rate = error_rate
+        self.logger = logger or logging.getLogger(__name__)
+        if not path.parent.exists():
+            path.parent.mkdir(parents=True)
+        # shared by the download sessions and the writer threads
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+                path.as_posix(),
+                check_same_thread=False)
+        self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS mail ('
+                ' key TEXT PRIMARY KEY,'
+                ' path TEXT NOT NULL)')
+        self._connection.commit()
+        self._bloom = self._load(capacity)
+        self.skipped = 0
+
+    def __enter__(self) -> 'DedupIndex':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+        self.logger.debug(
+                'dedup index %s: %d keys, %d duplicates skipped',
+                self.path.as_posix(),
+                self._bloom.count,
+                self.skipped)
+
+    def lookup(self, key: str) -> Optional[pathlib.Path]:
+        with self._lock:
+            return self._lookup(key)
+
+    def claim(self, key: str, path: pathlib.Path) -> Optional[pathlib.Path]:
+        # register path as the canonical copy of key,
+        # or return the canonical copy if it is another existing file
+        with self._lock:
+            canonical = self._lookup(key)
+            if canonical is not None:
+                if canonical == path:
+                    return None
+                if canonical.exists():
+                    self.skipped += 1
+                    return canonical
+                # the canonical copy was removed, take it over
+                self._connection.execute(
+                        'UPDATE mail SET path = ? WHERE key = ?',
+                        (path.as_posix(), key))
+                return None
+            self._connection.execute(
+                    'INSERT INTO mail (key, path) VALUES (?, ?)',
+                    (key, path.as_posix()))
+            self._bloom.add(key)
+            if self._bloom.count > self._bloom.capacity:
+                self._bloom = self._load(self._bloom.capacity * 2)
+            return None
+
+    def is_known(self, key: str) -> bool:
+        canonical = self.lookup(key)
+        if canonical is not None and canonical.exists():
+            self.skipped += 1
+            return True
+        return False
+
+    def remove_directory(self, directory: pathlib.Path) -> int:
+        # entries of the removed files become stale in the Bloom filter,
+        # which only costs a lookup in the table
+        with self._lock:
+            cursor = self._connection.execute(
+                    "DELETE FROM mail WHERE path LIKE ? ESCAPE '\\'",
+                    (_escape_like(directory.as_posix()) + '/%',))
+            self._connection.commit()
+            return cursor.rowcount
+
+    def commit(self) -> None:
+        with self._lock:
+            self._connection.commit()
+
+    def _lookup(self, key: str) -> Optional[pathlib.Path]:
+        if key not in self._bloom:
+            return None
+        row = self._connection.execute(
+                'SELECT path FROM mail WHERE key = ?',
+                (key,)).fetchone()
+        return pathlib.Path(row[0]) if row is not None else None
+
+    def _load(self, capacity: int) -> BloomFilter:
+        count = self._connection.execute(
+                'SELECT COUNT(*) FROM mail').fetchone()[0]
+        while capacity < count:
+            capacity *= 2
+        bloom = BloomFilter(capacity, self.error_rate)
+        for (key,) in self._connection.execute('SELECT key FROM mail'):
+            bloom.add(key)
+        self.logger.debug(
+                'dedup index %s: %d keys, Bloom filter of %d bytes',
+                self.path.as_posix(),
+                bloom.count,
+                bloom.nbytes)
+        return bloom
+
+
+def _escape_like(string: str) -> str:
+    return (string
+            .replace('\\', '\\\\')
+            .replace('%', '\\%')
+            .replace('_', '\\_'))
+
+
+def open_index(
+        config: Dict[str, Any],
+        *,
+        logger: Optional[logging.Logger] = None) -> Optional[DedupIndex]:
+    dedup_config = config.get('dedup') or {}
+    if dedup_config.get('enable', True) is False:
+        return None
+    return DedupIndex(
+            pathlib.Path(dedup_config.get('index') or DEFAULT_INDEX_PATH),
+            capacity=dedup_config.get('capacity') or DEFAULT_CAPACITY,
+            logger=logger)
@@ -1,52 +1,224 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import concurrent.futures
 import datetime
+import functools
 import logging
 import pathlib
-from typing import Optional
+from typing import Any, Dict, List, Optional, Type
 import imapclient
 import yaml
+import dedup
+import imap_utility
+import utility
+import vendors
 
 
-def main(*, logger: Optional[logging.Logger] = None) -> None:
+MAIL_CLASS: Dict[str, Type[imap_utility.HeaderMailT]] = dict(
+        vendors.ROUTER.mail_class)
+
+
+def triage_class(
+        name: str,
+        target: Dict[str, Any]) -> Optional[Type[imap_utility.HeaderMailT]]:
+    # a target with 'mixed: true' holds the receipts of every vendor
+    if target.get('mixed', False):
+        return vendors.ROUTER.any_receipt
+    return MAIL_CLASS.get(name)
+
+
+def reset_directory(
+        directory: pathlib.Path,
+        index: Optional[dedup.DedupIndex] = None,
+        logger: Optional[logging.Logger] = None) -> None:
+    # remove mails with the invalidated UIDs
+    logger = logger or logging.getLogger(__name__)
+    if not directory.exists():
+        return
+    for mail_path in directory.iterdir():
+        logger.info('remove %s', mail_path)
+        mail_path.unlink()
+    if index is not None:
+        index.remove_directory(directory)
+
+
+def plan_download(
+        client: imapclient.IMAPClient,
+        *,
+        mailbox: str,
+        since: datetime.date,
+        state: Optional[imap_utility.SyncState],
+        directory: pathlib.Path,
+        mail_class: Optional[Type[imap_utility.HeaderMailT]] = None,
+        index: Optional[dedup.DedupIndex] = None,
+        logger: Optional[logging.Logger] = None) -> imap_utility.SyncPlan:
+    logger = logger or logging.getLogger(__name__)
+    plan = imap_utility.plan_sync(
+            client,
+            mailbox,
+            since,
+            state,
+            logger=logger)
+    # before the triage, the removed mails are not duplicates
+    if plan.reset:
+        reset_directory(directory, index=index, logger=logger)
+    # fetch the headers to skip non-receipt mails
+    if mail_class is not None and plan.uids:
+        plan = plan._replace(uids=imap_utility.triage(
+                client,
+                plan.uids,
+                mail_class,
+                index=index,
+                logger=logger))
+    return plan
+
+
+def download_option(
+        download_config: Dict[str, Any]) -> imap_utility.DownloadOption:
+    default = imap_utility.DownloadOption()
+    option = imap_utility.DownloadOption(**{
+            key: download_config.get(key) or value
+            for key, value in default._asdict().items()})
+    if option.mode not in (imap_utility.FULL_MODE, imap_utility.TEXT_MODE):
+        raise ValueError('unknown download mode: {0}'.format(option.mode))
+    return option
+
+
+def download(
+        config: Dict[str, Any],
+        *,
+        logger: Optional[logging.Logger] = None) -> None:
     logger = logger or logging.getLogger(__name__)
-    # config
-    config_path = pathlib.Path('config.yaml')
-    with config_path.open() as config_file:
-        config = yaml.load(
-                config_file,
-                Loader=yaml.SafeLoader)
-    logger.debug('config: %s', config)
     # since
     since = datetime.date(
             year=config['since']['year'],
             month=config['since']['month'],
             day=config['since']['day'])
     logger.info('download since %s', since)
+    download_config = config.get('download') or {}
+    option = download_option(download_config)
+    logger.debug('download option: %s', option)
+    range_size = (
+            download_config.get('range_size')
+            or imap_utility.DEFAULT_RANGE_SIZE)
+    use_triage = download_config.get('triage', True) is not False
+    # the mixed targets left empty in the template are skipped
+    mixed = utility.mixed_target(config, logger=logger)
+    target_list = {
+            name: target for name, target in config['target'].items()
+            if not target.get('mixed', False) or name in mixed}
+    # the index of the stored mails to skip duplicates
+    index = dedup.open_index(config, logger=logger)
     # download
-    with imapclient.IMAPClient(host=config['host']) as client:
-        # login
-        logger.info('log in to %s', config['host'])
-        client.login(config['username'], config['password'])
-        logger.info('it is succeeded to log in to %s', config['host'])
-        # target
-        for target in config['target'].values():
+    with imap_utility.ConnectionPool(
+            config['host'],
+            config['username'],
+            config['password'],
+            port=config.get('port'),
+            ssl=config.get('ssl', True) is not False,
+            size=(
+                    download_config.get('connections')
+                    or imap_utility.DEFAULT_CONNECTIONS),
+            compress=download_config.get('compress', True) is not False,
+            logger=logger) as pool:
+        # plan
+        plans: Dict[
+                str,
+                'concurrent.futures.Future[imap_utility.SyncPlan]'] = {}
+        for name, target in target_list.items():
             logger.info('target: %s', target)
+            workspace = pathlib.Path(target['workspace'])
+            state = imap_utility.load_sync_state(
+                    workspace.joinpath('sync.yaml'),
+                    logger=logger)
+            logger.debug('%s: sync state: %s', name, state)
+            plans[name] = pool.submit(functools.partial(
+                    plan_download,
+                    mailbox=target['mailbox'],
+                    since=since,
+                    state=state,
+                    directory=workspace.joinpath('mail'),
+                    mail_class=(
+                            triage_class(name, target)
+                            if use_triage else None),
+                    index=index,
+                    logger=logger))
+        # get mail
+        states: Dict[str, imap_utility.SyncState] = {}
+        journals: Dict[str, imap_utility.Journal] = {}
+        jobs: Dict[str, List['concurrent.futures.Future[int]']] = {}
+        for name, target in target_list.items():
+            try:
+                plan = plans[name].result()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('%s: failed to search mails', name)
+                continue
+            logger.info('%s: %d new mails', name, len(plan.uids))
             save_directory = pathlib.Path(target['workspace']).joinpath('mail')
             # directory
             if not save_directory.exists():
                 logger.debug('make directory: %s', save_directory)
                 save_directory.mkdir(parents=True)
-            # get mail
-            client.select_folder(target['mailbox'], readonly=True)
-            target = client.search(['SINCE', since])
-            response = client.fetch(target, ['RFC822'])
-            for message_id, data in response.items():
-                mail_path = save_directory.joinpath(str(message_id))
-                logger.info('download %d to %s', message_id, mail_path)
-                with mail_path.open(mode='wb') as mail_file:
-                    mail_file.write(data[b'RFC822'])
+            # once before the ranges write to the directory
+            imap_utility.remove_temp_files(save_directory, logger=logger)
+            # the mails completed by an interrupted run
+            journals[name] = imap_utility.Journal(
+                    pathlib.Path(target['workspace']).joinpath('sync.journal'),
+                    plan.state.uid_validity,
+                    logger=logger)
+            # split a large mailbox into UID ranges
+            jobs[name] = [
+                    pool.submit(functools.partial(
+                            imap_utility.download_range,
+                            mailbox=target['mailbox'],
+                            uids=uids,
+                            directory=save_directory,
+                            option=option,
+                            index=index,
+                            journal=journals[name],
+                            logger=logger))
+                    for uids in imap_utility.split_batch(
+                            plan.uids,
+                            range_size)]
+            states[name] = plan.state
+        # update sync state
+        for name, futures in jobs.items():
+            # the other ranges keep writing to the journal after a failure
+            concurrent.futures.wait(futures)
+            failed = [
+                    future.exception() for future in futures
+                    if future.exception() is not None]
+            if failed:
+                for error in failed:
+                    logger.error(
+                            '%s: failed to download mails',
+                            name,
+                            exc_info=error)
+                # keep the journal to resume the next run
+                journals[name].close()
+                continue
+            downloaded = sum(future.result() for future in futures)
+            logger.info('%s: %d mails are downloaded', name, downloaded)
+            state_path = pathlib.Path(
+                    target_list[name]['workspace']).joinpath('sync.yaml')
+            imap_utility.save_sync_state(state_path, states[name])
+            logger.debug('%s: save sync state: %s', name, states[name])
+            journals[name].clear()
+    if index is not None:
+        index.close()
+
+
+def main(*, logger: Optional[logging.Logger] = None) -> None:
+    logger = logger or logging.getLogger(__name__)
+    # config
+    config_path = pathlib.Path('config.yaml')
+    with config_path.open() as config_file:
+        config = yaml.load(
+                config_file,
+                Loader=yaml.SafeLoader)
+    logger.debug('config: %s', config)
+    download(config, logger=logger)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,889 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import datetime
+import imaplib
+import logging
+import os
+import pathlib
+import queue
+import socket
+import ssl
+import threading
+import time
+import uuid
+import zlib
+from typing import (
+        Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional,
+        Protocol, Set, Tuple, Type, TypeVar)
+import imapclient
+import yaml
+import dedup
+
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_BATCH_BYTES = 4 * 1024 * 1024
+DEFAULT_MAX_BATCH_BYTES = 32 * 1024 * 1024
+MIN_BATCH_BYTES = 64 * 1024
+DEFAULT_BATCH_SECONDS = 2.0
+DEFAULT_QUEUE_SIZE = 2
+DEFAULT_CONNECTIONS = 4
+DEFAULT_RANGE_SIZE = 500
+DEFAULT_RETRY = 3
+DEFAULT_TRIAGE_BATCH_SIZE = 500
+TRIAGE_FIELDS = ('SUBJECT', 'DATE', 'MESSAGE-ID')
+FULL_MODE = 'full'
+TEXT_MODE = 'text'
+
+
+T = TypeVar('T')
+
+
+# a dropped connection, not an error of the local files
+SESSION_ERRORS = (
+        imaplib.IMAP4.abort,
+        ConnectionError,
+        TimeoutError,
+        ssl.SSLError,
+        socket.gaierror)
+
+
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+
+class HeaderMailT(Protocol):
+    def subject(self) -> str: ...
+
+    def is_receipt(self) -> bool: ...
+
+    @classmethod
+    def read_binary(
+            cls,
+            binary: bytes,
+            *,
+            logger: Optional[logging.Logger]) -> 'HeaderMailT': ...
+
+
+class DownloadOption(NamedTuple):
+    mode: str = FULL_MODE
+    batch_size: int = DEFAULT_BATCH_SIZE
+    batch_bytes: int = DEFAULT_BATCH_BYTES
+    max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES
+    batch_seconds: float = DEFAULT_BATCH_SECONDS
+    queue_size: int = DEFAULT_QUEUE_SIZE
+
+
+class SyncState(NamedTuple):
+    mailbox: str
+    uid_validity: int
+    last_uid: int
+    highest_modseq: Optional[int] = None
+
+
+class SyncPlan(NamedTuple):
+    uids: List[int]
+    state: SyncState
+    reset: bool
+
+
+def load_sync_state(
+        path: pathlib.Path,
+        *,
+        logger: Optional[logging.Logger] = None) -> Optional[SyncState]:
+    logger = logger or logging.getLogger(__name__)
+    if not path.exists():
+        return None
+    with path.open() as state_file:
+        data = yaml.load(state_file, Loader=yaml.SafeLoader)
+    try:
+        return SyncState(
+                mailbox=str(data['mailbox']),
+                uid_validity=int(data['uid_validity']),
+                last_uid=int(data['last_uid']),
+                highest_modseq=(
+                        int(data['highest_modseq'])
+                        if data.get('highest_modseq') is not None
+                        else None))
+    except (TypeError, KeyError, ValueError, AttributeError):
+        logger.warning('ignore broken sync state: %s', path.as_posix())
+        return None
+
+
+def save_sync_state(path: pathlib.Path, state: SyncState) -> None:
+    write_atomic(path, yaml.dump(
+            state._asdict(),
+            Dumper=yaml.SafeDumper).encode('utf-8'))
+
+
+class Journal:
+    # UIDs whose download completed since the last saved sync state
+    def __init__(
+            self,
+            path: pathlib.Path,
+            uid_validity: int,
+            *,
+            logger: Optional[logging.Logger] = None) -> None:
+        self.path = path
+        self.uid_validity = uid_validity
+        self.logger = logger or logging.getLogger(__name__)
+        self.uids: Set[int] = set()
+        self._lock = threading.Lock()
+        if path.exists():
+            self._load()
+        self._file = path.open(mode='a')
+        if self._file.tell() == 0:
+            self._write(['UIDVALIDITY {0}'.format(uid_validity)])
+
+    def __contains__(self, uid: int) -> bool:
+        return uid in self.uids
+
+    def record(self, uids: Iterable[int]) -> None:
+        with self._lock:
+            uids = [uid for uid in uids if uid not in self.uids]
+            self._write([str(uid) for uid in uids])
+            self.uids.update(uids)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def clear(self) -> None:
+        # the sync state covers the journal
+        self.close()
+        self.path.unlink()
+        self.uids.clear()
+
+    def _load(self) -> None:
+        with self.path.open() as journal_file:
+            lines = journal_file.read().split('\n')
+        if lines[0] != 'UIDVALIDITY {0}'.format(self.uid_validity):
+            self.logger.info('discard journal: %s', self.path.as_posix())
+            self.path.unlink()
+            return
+        # the last line may be cut by a crash
+        for line in lines[1:]:
+            if line.isdigit():
+                self.uids.add(int(line))
+        self.logger.info(
+                'journal %s: %d mails are completed',
+                self.path.as_posix(),
+                len(self.uids))
+
+    def _write(self, lines: List[str]) -> None:
+        if not lines:
+            return
+        self._file.write(''.join('{0}\n'.format(line) for line in lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+
+def write_atomic(path: pathlib.Path, binary: bytes) -> None:
+    # a crash leaves either the old file or the complete new file,
+    # the temporary name is unique to the writer
+    temp_path = path.with_name('.{0}.{1}.tmp'.format(
+            path.name,
+            uuid.uuid4().hex))
+    with temp_path.open(mode='wb') as temp_file:
+        temp_file.write(binary)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.replace(temp_path, path)
+
+
+def remove_temp_files(
+        directory: pathlib.Path,
+        *,
+        logger: Optional[logging.Logger] = None) -> None:
+    # temporary files left by an interrupted run,
+    # before any writer of the directory starts
+    logger = logger or logging.getLogger(__name__)
+    if not directory.exists():
+        return
+    for temp_path in directory.glob('.*.tmp'):
+        logger.debug('remove %s', temp_path)
+        temp_path.unlink()
+
+
+def fsync_directory(directory: pathlib.Path) -> None:
+    # make the renames durable
+    descriptor = os.open(directory.as_posix(), os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def enable_condstore(
+        client: imapclient.IMAPClient,
+        *,
+        logger: Optional[logging.Logger] = None) -> bool:
+    logger = logger or logging.getLogger(__name__)
+    if not (client.has_capability('CONDSTORE')
+            and client.has_capability('ENABLE')):
+        logger.debug('CONDSTORE is not available')
+        return False
+    enabled = client.enable('CONDSTORE')
+    logger.debug('enabled: %s', enabled)
+    return b'CONDSTORE' in enabled
+
+
+def plan_sync(
+        client: imapclient.IMAPClient,
+        mailbox: str,
+        since: datetime.date,
+        state: Optional[SyncState],
+        *,
+        logger: Optional[logging.Logger] = None) -> SyncPlan:
+    logger = logger or logging.getLogger(__name__)
+    response: Dict[bytes, Any] = client.select_folder(mailbox, readonly=True)
+    uid_validity: int = response[b'UIDVALIDITY']
+    uid_next: Optional[int] = response.get(b'UIDNEXT')
+    highest_modseq: Optional[int] = response.get(b'HIGHESTMODSEQ')
+    logger.debug(
+            '%s: UIDVALIDITY=%d, UIDNEXT=%s, HIGHESTMODSEQ=%s',
+            mailbox,
+            uid_validity,
+            uid_next,
+            highest_modseq)
+    # invalidate
+    reset = False
+    if state is not None and state.mailbox != mailbox:
+        logger.warning(
+                '%s: mailbox is changed from %s, full resync',
+                mailbox,
+                state.mailbox)
+        state = None
+        reset = True
+    elif state is not None and state.uid_validity != uid_validity:
+        logger.warning(
+                '%s: UIDVALIDITY is changed from %d to %d, full resync',
+                mailbox,
+                state.uid_validity,
+                uid_validity)
+        state = None
+        reset = True
+    # search
+    uids: List[int]
+    if state is None:
+        logger.info('%s: full sync since %s', mailbox, since)
+        uids = sorted(client.search(['SINCE', since]))
+    elif (highest_modseq is not None
+            and state.highest_modseq == highest_modseq):
+        logger.info('%s: HIGHESTMODSEQ is not changed', mailbox)
+        uids = []
+    elif uid_next is not None and uid_next <= state.last_uid + 1:
+        logger.info('%s: no message after UID %d', mailbox, state.last_uid)
+        uids = []
+    else:
+        logger.info(
+                '%s: incremental sync after UID %d',
+                mailbox,
+                state.last_uid)
+        # 'n:*' always contains the last message even if its UID is below n
+        uids = sorted(
+                uid for uid in client.search([
+                        'UID', '{0}:*'.format(state.last_uid + 1),
+                        'SINCE', since])
+                if uid > state.last_uid)
+    # high-water mark
+    last_uid = max(
+            uids
+            + ([uid_next - 1] if uid_next is not None else [])
+            + ([state.last_uid] if state is not None else []),
+            default=0)
+    return SyncPlan(
+            uids=uids,
+            state=SyncState(
+                    mailbox=mailbox,
+                    uid_validity=uid_validity,
+                    last_uid=last_uid,
+                    highest_modseq=highest_modseq),
+            reset=reset)
+
+
+def triage(
+        client: imapclient.IMAPClient,
+        uids: List[int],
+        mail_class: Type[HeaderMailT],
+        *,
+        batch_size: int = DEFAULT_TRIAGE_BATCH_SIZE,
+        index: Optional[dedup.DedupIndex] = None,
+        logger: Optional[logging.Logger] = None) -> List[int]:
+    logger = logger or logging.getLogger(__name__)
+    section = 'BODY.PEEK[HEADER.FIELDS ({0})]'.format(' '.join(TRIAGE_FIELDS))
+    result: List[int] = []
+    for batch in split_batch(uids, batch_size):
+        response = client.fetch(batch, [section])
+        for uid in sorted(response.keys()):
+            header = _header_fields(response[uid])
+            # skip the mails already stored in any mailbox
+            key = dedup.message_id_key(header)
+            if index is not None and key is not None and index.is_known(key):
+                logger.info('UID %d is a duplicate: %s', uid, key)
+                continue
+            mail = mail_class.read_binary(header, logger=logger)
+            if mail.is_receipt():
+                result.append(uid)
+            else:
+                logger.info(
+                        'UID %d is not a receipt: %s',
+                        uid,
+                        mail.subject())
+    logger.info('%d/%d mails are receipts', len(result), len(uids))
+    return result
+
+
+def _header_fields(data: Dict[bytes, Any]) -> bytes:
+    # the server may echo the field list in its own format
+    for key, value in data.items():
+        if key.startswith(b'BODY[HEADER.FIELDS'):
+            return value
+    return b''
+
+
+def split_batch(uids: List[int], size: int) -> Iterator[List[int]]:
+    for i in range(0, len(uids), size):
+        yield uids[i:i + size]
+
+
+class MailWriter:
+    def __init__(
+            self,
+            directory: pathlib.Path,
+            *,
+            queue_size: int = DEFAULT_QUEUE_SIZE,
+            index: Optional[dedup.DedupIndex] = None,
+            journal: Optional[Journal] = None,
+            logger: Optional[logging.Logger] = None) -> None:
+        self.directory = directory
+        self.index = index
+        self.journal = journal
+        self.logger = logger or logging.getLogger(__name__)
+        self._queue: 'queue.Queue[Optional[Dict[int, bytes]]]' = (
+                queue.Queue(maxsize=queue_size))
+        self._thread = threading.Thread(
+                target=self._run,
+                name='MailWriter({0})'.format(directory.as_posix()),
+                daemon=True)
+        self._error: Optional[BaseException] = None
+        self.written = 0
+
+    def __enter__(self) -> 'MailWriter':
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type: Any, *args: Any) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        if exc_type is None:
+            self._check()
+
+    def put(self, batch: Dict[int, bytes]) -> None:
+        self._check()
+        self._queue.put(batch)
+
+    def _check(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def _run(self) -> None:
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                break
+            # keep draining the queue after an error not to block the fetch
+            if self._error is not None:
+                continue
+            try:
+                for uid, binary in batch.items():
+                    mail_path = self.directory.joinpath(str(uid))
+                    if self.index is not None:
+                        canonical = self.index.claim(
+                                dedup.mail_key(binary),
+                                mail_path)
+                        if canonical is not None:
+                            self.logger.info(
+                                    'skip %d: duplicate of %s',
+                                    uid,
+                                    canonical)
+                            continue
+                    self.logger.info('download %d to %s', uid, mail_path)
+                    write_atomic(mail_path, binary)
+                    self.written += 1
+                fsync_directory(self.directory)
+                if self.index is not None:
+                    self.index.commit()
+                if self.journal is not None:
+                    self.journal.record(batch.keys())
+            except BaseException as error:  # pylint: disable=broad-except
+                self._error = error
+
+
+def text_sections(body: Any, number: str = '') -> List[str]:
+    if body.is_multipart:
+        result: List[str] = []
+        for i, part in enumerate(body[0], start=1):
+            result.extend(text_sections(
+                    part,
+                    '{0}.{1}'.format(number, i) if number else str(i)))
+        return result
+    if (body[0].lower(), body[1].lower()) == (b'text', b'plain'):
+        return [number or '1']
+    return []
+
+
+def slim_message(header: bytes, parts: List[Tuple[bytes, bytes]]) -> bytes:
+    # drop the multipart headers of the original message
+    fields: List[bytes] = []
+    for line in header.splitlines(keepends=True):
+        if line in (b'\r\n', b'\n'):
+            break
+        if line[:1] in (b' ', b'\t') and fields:
+            fields[-1] += line
+        else:
+            fields.append(line)
+    fields = [
+            field for field in fields
+            if field.split(b':', 1)[0].strip().lower()
+            not in (b'content-type', b'content-transfer-encoding')]
+    boundary = '=_receipt_mail_{0}'.format(uuid.uuid4().hex).encode()
+    result = b''.join(fields)
+    result += (
+            b'Content-Type: multipart/mixed; boundary="'
+            + boundary
+            + b'"\r\n')
+    result += b'\r\n'
+    for mime, body in parts:
+        result += b'--' + boundary + b'\r\n' + mime + body + b'\r\n'
+    result += b'--' + boundary + b'--\r\n'
+    return result
+
+
+def fetch_text(
+        client: imapclient.IMAPClient,
+        uids: List[int],
+        *,
+        logger: Optional[logging.Logger] = None) -> Dict[int, bytes]:
+    logger = logger or logging.getLogger(__name__)
+    result: Dict[int, bytes] = {}
+    # group UIDs by text/plain sections
+    groups: Dict[Tuple[str, ...], List[int]] = {}
+    for uid, data in client.fetch(uids, ['BODYSTRUCTURE']).items():
+        body = data[b'BODYSTRUCTURE']
+        sections = tuple(text_sections(body)) if body.is_multipart else ()
+        groups.setdefault(sections, []).append(uid)
+    for sections, group in groups.items():
+        # single part mail is fetched as it is
+        if not sections:
+            for uid, data in client.fetch(group, ['RFC822']).items():
+                result[uid] = data[b'RFC822']
+            continue
+        logger.debug('fetch sections %s of UID %s', sections, group)
+        items = ['BODY.PEEK[HEADER]']
+        for section in sections:
+            items.append('BODY.PEEK[{0}.MIME]'.format(section))
+            items.append('BODY.PEEK[{0}]'.format(section))
+        for uid, data in client.fetch(group, items).items():
+            result[uid] = slim_message(
+                    data[b'BODY[HEADER]'],
+                    [(data['BODY[{0}.MIME]'.format(section).encode()],
+                      data['BODY[{0}]'.format(section).encode()])
+                     for section in sections])
+    return result
+
+
+def fetch_size(
+        client: imapclient.IMAPClient,
+        uids: List[int],
+        *,
+        batch_size: int = DEFAULT_TRIAGE_BATCH_SIZE) -> Dict[int, int]:
+    result: Dict[int, int] = {}
+    for batch in split_batch(uids, batch_size):
+        for uid, data in client.fetch(batch, ['RFC822.SIZE']).items():
+            result[uid] = data[b'RFC822.SIZE']
+    return result
+
+
+class AdaptiveBatch:
+    def __init__(
+            self,
+            option: DownloadOption,
+            *,
+            logger: Optional[logging.Logger] = None) -> None:
+        self.max_count = option.batch_size
+        self.max_budget = max(option.max_batch_bytes, MIN_BATCH_BYTES)
+        self.budget = min(
+                max(option.batch_bytes, MIN_BATCH_BYTES),
+                self.max_budget)
+        self.target_seconds = option.batch_seconds
+        self.logger = logger or logging.getLogger(__name__)
+
+    def split(
+            self,
+            uids: List[int],
+            sizes: Dict[int, int]) -> Iterator[List[int]]:
+        # the budget is read again for each batch after update()
+        i = 0
+        while i < len(uids):
+            batch = [uids[i]]
+            total = sizes.get(uids[i], 0)
+            i += 1
+            while (i < len(uids)
+                    and len(batch) < self.max_count
+                    and total + sizes.get(uids[i], 0) <= self.budget):
+                batch.append(uids[i])
+                total += sizes.get(uids[i], 0)
+                i += 1
+            yield batch
+
+    def update(self, size: int, seconds: float) -> None:
+        if seconds <= 0 or size <= 0:
+            return
+        # aim at the target time with the measured throughput
+        target = size / seconds * self.target_seconds
+        budget = (self.budget + target) / 2
+        self.budget = int(min(max(budget, MIN_BATCH_BYTES), self.max_budget))
+
+
+def download_mails(
+        client: imapclient.IMAPClient,
+        uids: List[int],
+        directory: pathlib.Path,
+        *,
+        option: DownloadOption = DownloadOption(),
+        index: Optional[dedup.DedupIndex] = None,
+        journal: Optional[Journal] = None,
+        logger: Optional[logging.Logger] = None) -> int:
+    logger = logger or logging.getLogger(__name__)
+    if journal is not None:
+        uids = [uid for uid in uids if uid not in journal]
+    if not uids:
+        return 0
+    # at most (queue_size + 2) batches are in memory:
+    # one in fetch, queue_size in the queue and one in write
+    logger.debug(
+            'fetch %d mails (%s mode), memory ceiling %d bytes',
+            len(uids),
+            option.mode,
+            (option.queue_size + 2) * option.max_batch_bytes)
+    sizes = fetch_size(client, uids)
+    batcher = AdaptiveBatch(option, logger=logger)
+    with MailWriter(
+            directory,
+            queue_size=option.queue_size,
+            index=index,
+            journal=journal,
+            logger=logger) as writer:
+        for i, batch in enumerate(batcher.split(uids, sizes)):
+            size = sum(sizes.get(uid, 0) for uid in batch)
+            start = time.perf_counter()
+            if option.mode == TEXT_MODE:
+                data = fetch_text(client, batch, logger=logger)
+            else:
+                data = {
+                        uid: value[b'RFC822']
+                        for uid, value
+                        in client.fetch(batch, ['RFC822']).items()}
+            elapsed = time.perf_counter() - start
+            batcher.update(size, elapsed)
+            logger.info(
+                    'batch %d: UID %d:%d, %d mails, %d bytes'
+                    ' in %.3f seconds (%.1f KiB/s), next budget %d bytes',
+                    i,
+                    batch[0],
+                    batch[-1],
+                    len(batch),
+                    size,
+                    elapsed,
+                    size / elapsed / 1024 if elapsed > 0 else 0.0,
+                    batcher.budget)
+            writer.put(data)
+            del data
+    return writer.written
+
+
+def download_range(
+        client: imapclient.IMAPClient,
+        mailbox: str,
+        uids: List[int],
+        directory: pathlib.Path,
+        *,
+        option: DownloadOption = DownloadOption(),
+        index: Optional[dedup.DedupIndex] = None,
+        journal: Optional[Journal] = None,
+        logger: Optional[logging.Logger] = None) -> int:
+    logger = logger or logging.getLogger(__name__)
+    logger.debug(
+            '%s: download UID %d:%d (%d mails)',
+            mailbox,
+            uids[0],
+            uids[-1],
+            len(uids))
+    client.select_folder(mailbox, readonly=True)
+    return download_mails(
+            client,
+            uids,
+            directory,
+            option=option,
+            index=index,
+            journal=journal,
+            logger=logger)
+
+
+def enable_compress(
+        client: imapclient.IMAPClient,
+        *,
+        logger: Optional[logging.Logger] = None) -> bool:
+    logger = logger or logging.getLogger(__name__)
+    if not client.has_capability('COMPRESS=DEFLATE'):
+        logger.debug('COMPRESS=DEFLATE is not available')
+        return False
+    # RFC 4978: imaplib does not know the COMPRESS command
+    imap = client._imap  # pylint: disable=protected-access
+    imaplib.Commands.setdefault('COMPRESS', ('AUTH', 'SELECTED'))
+    try:
+        typ, data = imap._simple_command(  # pylint: disable=protected-access
+                'COMPRESS',
+                'DEFLATE')
+    except imapclient.exceptions.IMAPClientError as error:
+        logger.warning('failed to enable COMPRESS=DEFLATE: %s', error)
+        return False
+    if typ != 'OK':
+        logger.warning('failed to enable COMPRESS=DEFLATE: %s', data)
+        return False
+    imap.file = _DeflateReader(imap.file)
+    compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION,
+            zlib.DEFLATED,
+            -zlib.MAX_WBITS)
+    sock = imap.sock
+
+    def _send(data: bytes) -> None:
+        sock.sendall(
+                compressor.compress(data)
+                + compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    imap.send = _send
+    logger.debug('COMPRESS=DEFLATE is enabled')
+    return True
+
+
+class _DeflateReader:
+    def __init__(self, file: Any) -> None:
+        self._file = file
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self._buffer = bytearray()
+
+    def read(self, size: int) -> bytes:
+        while len(self._buffer) < size and self._fill():
+            pass
+        return self._take(min(size, len(self._buffer)))
+
+    def readline(self, limit: int = -1) -> bytes:
+        start = 0
+        while True:
+            end = self._buffer.find(b'\n', start)
+            if end >= 0:
+                size = end + 1
+                break
+            start = len(self._buffer)
+            if 0 <= limit <= start or not self._fill():
+                size = start
+                break
+        return self._take(size if limit < 0 else min(size, limit))
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _take(self, size: int) -> bytes:
+        result = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return result
+
+    def _fill(self) -> bool:
+        data = self._file.read1(65536)
+        if not data:
+            return False
+        self._buffer += self._decompressor.decompress(data)
+        return True
+
+
+def connect(
+        host: str,
+        username: str,
+        password: str,
+        *,
+        port: Optional[int] = None,
+        ssl: bool = True,
+        compress: bool = False,
+        name: str = 'session',
+        logger: Optional[logging.Logger] = None) -> imapclient.IMAPClient:
+    logger = logger or logging.getLogger(__name__)
+    logger.info('%s: log in to %s', name, host)
+    client = imapclient.IMAPClient(host=host, port=port, ssl=ssl)
+    try:
+        client.login(username, password)
+        logger.info('%s: it is succeeded to log in to %s', name, host)
+        if compress:
+            enable_compress(client, logger=logger)
+        enable_condstore(client, logger=logger)
+    except BaseException:
+        client.shutdown()
+        raise
+    return client
+
+
+class _Session:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.client: Optional[imapclient.IMAPClient] = None
+        self.connections = 0
+        self.received = 0
+        self.busy_seconds = 0.0
+
+    def throughput(self) -> float:
+        if self.busy_seconds <= 0:
+            return 0.0
+        return self.received / self.busy_seconds
+
+
+class ConnectionPool:
+    def __init__(
+            self,
+            host: str,
+            username: str,
+            password: str,
+            *,
+            port: Optional[int] = None,
+            ssl: bool = True,
+            size: int = DEFAULT_CONNECTIONS,
+            retry: int = DEFAULT_RETRY,
+            compress: bool = True,
+            logger: Optional[logging.Logger] = None) -> None:
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self._username = username
+        self._password = password
+        self.size = size
+        self.retry = retry
+        self.compress = compress
+        self.logger = logger or logging.getLogger(__name__)
+        self._sessions = [
+                _Session('session-{0}'.format(i)) for i in range(size)]
+        self._idle: 'queue.Queue[_Session]' = queue.Queue()
+        for session in self._sessions:
+            self._idle.put(session)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=size,
+                thread_name_prefix='ConnectionPool')
+
+    def __enter__(self) -> 'ConnectionPool':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def submit(
+            self,
+            function: Callable[[imapclient.IMAPClient], T]
+            ) -> 'concurrent.futures.Future[T]':
+        return self._executor.submit(self.call, function)
+
+    def call(self, function: Callable[[imapclient.IMAPClient], T]) -> T:
+        session = self._idle.get()
+        try:
+            attempt = 0
+            while True:
+                try:
+                    client = self._connect(session)
+                    start = time.perf_counter()
+                    try:
+                        return function(client)
+                    finally:
+                        session.busy_seconds += time.perf_counter() - start
+                except SESSION_ERRORS as error:
+                    self.logger.warning(
+                            '%s: session is dropped (%s: %s)',
+                            session.name,
+                            type(error).__name__,
+                            error)
+                    self._disconnect(session)
+                    if attempt >= self.retry:
+                        raise
+                    attempt += 1
+                    wait = 2 ** (attempt - 1)
+                    self.logger.info(
+                            '%s: reconnect in %d seconds (%d/%d)',
+                            session.name,
+                            wait,
+                            attempt,
+                            self.retry)
+                    time.sleep(wait)
+        finally:
+            self._idle.put(session)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        for session in self._sessions:
+            if session.client is not None:
+                self.logger.info(
+                        '%s: %d bytes in %.3f seconds (%.1f KiB/s),'
+                        ' %d connection(s)',
+                        session.name,
+                        session.received,
+                        session.busy_seconds,
+                        session.throughput() / 1024,
+                        session.connections)
+                try:
+                    session.client.logout()
+                except Exception:  # pylint: disable=broad-except
+                    self._disconnect(session)
+                session.client = None
+
+    def _connect(self, session: _Session) -> imapclient.IMAPClient:
+        if session.client is not None:
+            return session.client
+        client = connect(
+                self.host,
+                self._username,
+                self._password,
+                port=self.port,
+                ssl=self.ssl,
+                compress=self.compress,
+                name=session.name,
+                logger=self.logger)
+        _count_received(client, session)
+        session.client = client
+        session.connections += 1
+        return client
+
+    def _disconnect(self, session: _Session) -> None:
+        if session.client is not None:
+            try:
+                session.client.shutdown()
+            except Exception:  # pylint: disable=broad-except
+                pass
+        session.client = None
+
+
+def _count_received(
+        client: imapclient.IMAPClient,
+        session: _Session) -> None:
+    # every response from imaplib is read by IMAP4.read() or readline()
+    imap = client._imap  # pylint: disable=protected-access
+    read = imap.read
+    readline = imap.readline
+
+    def _read(size: int) -> bytes:
+        data = read(size)
+        session.received += len(data)
+        return data
+
+    def _readline() -> bytes:
+        line = readline()
+        session.received += len(line)
+        return line
+
+    imap.read = _read
+    imap.readline = _readline
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import pathlib
+import pickle
+import sqlite3
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+
+DEFAULT_CACHE_NAME = 'parse_cache.sqlite3'
+SCHEMA_VERSION = 1
+
+
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+
+class CacheEntry(NamedTuple):
+    size: int
+    mtime_ns: int
+    is_receipt: bool
+    receipts: bytes
+    mail_key: str
+
+
+class ParseCache:
+    def __init__(
+            self,
+            path: pathlib.Path,
+            parser: str,
+            version: int,
+            *,
+            logger: Optional[logging.Logger] = None) -> None:
+        self.path = path
+        self.parser = parser
+        self.version = version
+        self.logger = logger or logging.getLogger(__name__)
+        self._connection = sqlite3.connect(path.as_posix())
+        # rebuild the cache written in an older layout
+        schema_version = self._connection.execute(
+                'PRAGMA user_version').fetchone()[0]
+        if schema_version != SCHEMA_VERSION:
+            self._connection.execute('DROP TABLE IF EXISTS parse')
+            self._connection.execute(
+                    'PRAGMA user_version = {0:d}'.format(SCHEMA_VERSION))
+        self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS parse ('
+                ' parser TEXT NOT NULL,'
+                ' path TEXT NOT NULL,'
+                ' version INTEGER NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' mtime_ns INTEGER NOT NULL,'
+                ' is_receipt INTEGER NOT NULL,'
+                ' receipts BLOB NOT NULL,'
+                ' mail_key TEXT NOT NULL,'
+                ' PRIMARY KEY (parser, path))')
+        # the entries of the other versions of this parser
+        removed = self._connection.execute(
+                'DELETE FROM parse WHERE parser = ? AND version != ?',
+                (parser, version)).rowcount
+        if removed:
+            self.logger.info(
+                    '%s: %d cache entries of the old parser are removed',
+                    parser,
+                    removed)
+        # the paths looked up in this run, the others are pruned
+        self._connection.execute(
+                'CREATE TEMP TABLE seen (path TEXT PRIMARY KEY) WITHOUT ROWID')
+        self._connection.commit()
+        self.hit = 0
+        self.miss = 0
+
+    def __enter__(self) -> 'ParseCache':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def get(
+            self,
+            path: pathlib.Path,
+            stat: os.stat_result) -> Optional[Tuple[bool, List[Any], str]]:
+        # looked up one by one, the receipts of the history stay on disk
+        self._connection.execute(
+                'INSERT OR IGNORE INTO temp.seen (path) VALUES (?)',
+                (path.as_posix(),))
+        entry = self._entry(path, stat)
+        if entry is None:
+            self.miss += 1
+            return None
+        self.hit += 1
+        return (
+                entry.is_receipt,
+                pickle.loads(entry.receipts),
+                entry.mail_key)
+
+    def mail_key(
+            self,
+            path: pathlib.Path,
+            stat: os.stat_result) -> Optional[str]:
+        # the dedup key of an unchanged file without reading it
+        row = self._connection.execute(
+                'SELECT mail_key FROM parse WHERE parser = ? AND path = ?'
+                ' AND size = ? AND mtime_ns = ?',
+                (self.parser,
+                 path.as_posix(),
+                 stat.st_size,
+                 stat.st_mtime_ns)).fetchone()
+        return row[0] if row is not None else None
+
+    def _entry(
+            self,
+            path: pathlib.Path,
+            stat: os.stat_result) -> Optional[CacheEntry]:
+        row = self._connection.execute(
+                'SELECT size, mtime_ns, is_receipt, receipts, mail_key'
+                ' FROM parse WHERE parser = ? AND path = ?',
+                (self.parser, path.as_posix())).fetchone()
+        if (row is None
+                or row[0] != stat.st_size
+                or row[1] != stat.st_mtime_ns):
+            return None
+        return CacheEntry(
+                size=row[0],
+                mtime_ns=row[1],
+                is_receipt=bool(row[2]),
+                receipts=row[3],
+                mail_key=row[4])
+
+    def put(
+            self,
+            path: pathlib.Path,
+            stat: os.stat_result,
+            is_receipt: bool,
+            receipts: List[Any],
+            mail_key: str) -> None:
+        entry = CacheEntry(
+                size=stat.st_size,
+                mtime_ns=stat.st_mtime_ns,
+                is_receipt=is_receipt,
+                receipts=pickle.dumps(receipts),
+                mail_key=mail_key)
+        self._connection.execute(
+                'INSERT OR REPLACE INTO parse'
+                ' (parser, path, version, size, mtime_ns, is_receipt,'
+                ' receipts, mail_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.parser,
+                 path.as_posix(),
+                 self.version,
+                 entry.size,
+                 entry.mtime_ns,
+                 int(entry.is_receipt),
+                 entry.receipts,
+                 entry.mail_key))
+
+    def prune(self) -> None:
+        # the entries of the files not looked up, removed or duplicate
+        removed = self._connection.execute(
+                'DELETE FROM parse WHERE parser = ?'
+                ' AND path NOT IN (SELECT path FROM temp.seen)',
+                (self.parser,)).rowcount
+        self.logger.debug(
+                '%s: %d cache entries are pruned',
+                self.parser,
+                removed)
+
+    def close(self) -> None:
+        self._connection.commit()
+        self._connection.close()
+        self.logger.debug(
+                '%s: parse cache %d hits, %d misses',
+                self.parser,
+                self.hit,
+                self.miss)
+
+
+def open_cache(
+        workspace: pathlib.Path,
+        mail_class: Any,
+        config: Dict[str, Any],
+        *,
+        logger: Optional[logging.Logger] = None) -> Optional[ParseCache]:
+    aggregate_config = config.get('aggregate') or {}
+    if aggregate_config.get('cache', True) is False:
+        return None
+    return ParseCache(
+            workspace.joinpath(DEFAULT_CACHE_NAME),
+            '{0}.{1}'.format(mail_class.__module__, mail_class.__qualname__),
+            mail_class.parser_version,
+            logger=logger)
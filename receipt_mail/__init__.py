@@ -1,3 +1,4 @@
 # -*- coding: utf-8 -*-
 
 from ._mail import Mail
+from ._router import Router
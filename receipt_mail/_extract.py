@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+from typing import List, Match, Pattern
+
+
+def extract_all(pattern: Pattern[str], text: str) -> List[Match[str]]:
+    # the matches in a single forward scan,
+    # instead of repeating search & sub(count=1) over the whole text
+    return list(pattern.finditer(text))
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+import re
+import time
+from typing import (
+        Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Pattern,
+        Tuple)
+from ._extract import extract_all
+
+
+Convert = Callable[[Any], Any]
+
+
+def integer(value: str) -> int:
+    return int(value.replace(',', ''))
+
+
+def negative(value: str) -> int:
+    return - integer(value)
+
+
+def integer_or(default: int) -> Convert:
+    # for an optional group
+    def convert(value: Optional[str]) -> int:
+        return integer(value) if value is not None else default
+    return convert
+
+
+class Section(NamedTuple):
+    # a block of the text in the group 'value'
+    name: str
+    pattern: str
+    flags: int = 0
+
+
+class Field(NamedTuple):
+    # the first match of the group 'value' in the text or the section
+    name: str
+    pattern: str
+    convert: Convert = str
+    default: Any = None
+    flags: int = 0
+    section: Optional[str] = None
+    # matched within a line (MULTILINE), scanned with the other line fields
+    line: bool = False
+
+
+class Rows(NamedTuple):
+    # every match in the text or the section, the named groups converted
+    name: str
+    pattern: str
+    convert: Dict[str, Convert]
+    flags: int = 0
+    section: Optional[str] = None
+
+
+class Cost(NamedTuple):
+    name: str
+    calls: int
+    hits: int
+    seconds: float
+
+
+class Grammar:
+    def __init__(
+            self,
+            name: str,
+            *,
+            sections: Iterable[Section] = (),
+            fields: Iterable[Field] = (),
+            rows: Iterable[Rows] = ()) -> None:
+        self.name = name
+        self.sections = tuple(sections)
+        self.fields = tuple(fields)
+        self.rows = tuple(rows)
+        # compiled once
+        self._section_regex: Dict[str, Pattern[str]] = {
+                section.name: re.compile(section.pattern, section.flags)
+                for section in self.sections}
+        self._field_regex: Dict[str, Pattern[str]] = {}
+        for field in self.fields:
+            if field.line and field.flags not in (0, re.MULTILINE):
+                raise ValueError('{0}.{1}: a line field takes no flags'
+                                 .format(name, field.name))
+            regex = re.compile(
+                    field.pattern,
+                    field.flags | re.MULTILINE if field.line else field.flags)
+            if set(regex.groupindex) != {'value'}:
+                raise ValueError('{0}.{1}: the only named group must be'
+                                 ' "value"'.format(name, field.name))
+            self._field_regex[field.name] = regex
+        self._rows_regex: Dict[str, Pattern[str]] = {
+                rows.name: re.compile(rows.pattern, rows.flags)
+                for rows in self.rows}
+        # the line fields of each section in one alternation
+        line_field: Dict[Optional[str], List[Field]] = {}
+        for field in self.fields:
+            if field.line:
+                line_field.setdefault(field.section, []).append(field)
+        self._line_regex: Dict[
+                Optional[str],
+                Tuple[Pattern[str], Dict[str, Tuple[Field, str]]]] = {}
+        for section, field_list in line_field.items():
+            group = {
+                    '_{0:d}'.format(i): (field, '_{0:d}_value'.format(i))
+                    for i, field in enumerate(field_list)}
+            # fail at once in the middle of a line
+            anchored = all(
+                    field.pattern.startswith('^') for field in field_list)
+            alternative = '|'.join(
+                    '(?P<{0}>{1})'.format(
+                            key,
+                            (field.pattern[1:] if anchored else field.pattern)
+                            .replace(
+                                    '(?P<value>',
+                                    '(?P<{0}>'.format(value_group)))
+                    for key, (field, value_group) in group.items())
+            pattern = (
+                    '^(?:{0})'.format(alternative)
+                    if anchored else alternative)
+            self._line_regex[section] = (
+                    re.compile(pattern, re.MULTILINE),
+                    group)
+
+    def parse(self, text: str) -> Dict[str, Any]:
+        # sections by their names, then the fields and the rows
+        result: Dict[str, Any] = {}
+        source = self._source(text)
+        for section in self.sections:
+            result[section.name] = source[section.name]
+        for section_name, (regex, group) in self._line_regex.items():
+            found: Dict[str, Optional[str]] = {}
+            section_text = source[section_name]
+            if section_text is not None:
+                for match in regex.finditer(section_text):
+                    key = match.lastgroup
+                    if key is not None and key not in found:
+                        found[key] = match.group(group[key][1])
+            for key, (field, _) in group.items():
+                result[field.name] = (
+                        field.convert(found[key])
+                        if key in found else field.default)
+        for field in self.fields:
+            if field.line:
+                continue
+            section_text = source[field.section]
+            field_match = (
+                    self._field_regex[field.name].search(section_text)
+                    if section_text is not None else None)
+            result[field.name] = (
+                    field.convert(field_match.group('value'))
+                    if field_match else field.default)
+        for rows in self.rows:
+            section_text = source[rows.section]
+            match_list = (
+                    extract_all(self._rows_regex[rows.name], section_text)
+                    if section_text is not None else [])
+            result[rows.name] = [
+                    {key: convert(match.group(key))
+                     for key, convert in rows.convert.items()}
+                    for match in match_list]
+        return result
+
+    def cost(self, text_list: List[str]) -> List[Cost]:
+        # the match cost of each pattern by itself over text_list
+        source_list = [self._source(text) for text in text_list]
+        result: List[Cost] = []
+
+        def measure(
+                name: str,
+                section: Optional[str],
+                run: Callable[[str], Any]) -> None:
+            calls = 0
+            hits = 0
+            start = time.perf_counter()
+            for source in source_list:
+                section_text = source[section]
+                if section_text is None:
+                    continue
+                calls += 1
+                hits += bool(run(section_text))
+            result.append(Cost(
+                    name=name,
+                    calls=calls,
+                    hits=hits,
+                    seconds=time.perf_counter() - start))
+
+        for section in self.sections:
+            measure(
+                    'section {0}'.format(section.name),
+                    None,
+                    self._section_regex[section.name].search)
+        for field in self.fields:
+            # a line field alone, parse scans it in the line fields
+            measure(
+                    'field {0}{1}'.format(
+                            field.name,
+                            ' (line)' if field.line else ''),
+                    field.section,
+                    self._field_regex[field.name].search)
+        for section_name, (regex, _) in self._line_regex.items():
+            measure(
+                    'line fields in {0}'.format(section_name or 'text'),
+                    section_name,
+                    regex.findall)
+        for rows in self.rows:
+            measure(
+                    'rows {0}'.format(rows.name),
+                    rows.section,
+                    self._rows_regex[rows.name].findall)
+        return result
+
+    def _source(self, text: str) -> Dict[Optional[str], Optional[str]]:
+        source: Dict[Optional[str], Optional[str]] = {None: text}
+        for section in self.sections:
+            match = self._section_regex[section.name].search(text)
+            source[section.name] = match.group('value') if match else None
+        return source
@@ -1,38 +1,102 @@
 # -*- coding: utf-8 -*-
 
+import collections
 import datetime
+import functools
 import logging
 import email
 import email.message
+import email.parser
 import email.policy
 import pathlib
-from typing import List, Optional, Type, TypeVar
+import re
+from typing import (
+        Any, Callable, Counter, Dict, Iterable, List, Optional, Tuple, Type,
+        TypeVar)
 
 
 MailT = TypeVar('MailT', bound='Mail')
+T = TypeVar('T')
 
 
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 
 
+def cached_section(method: Callable[[MailT], T]) -> Callable[[MailT], T]:
+    # computed once per mail, the callers must not modify the result
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self: MailT) -> T:
+        if name in self._section:
+            self.cache_hit[name] += 1
+            return self._section[name]
+        value = method(self)
+        self._section[name] = value
+        return value
+
+    return wrapper
+
+
 class Mail:
+    parser_version = 0
+    # the subjects of the receipts, exact or searched with re.search
+    receipt_subject: Tuple[str, ...] = ()
+    receipt_subject_pattern: Optional[str] = None
+
     def __init__(
             self,
             mail: email.message.EmailMessage,
             *,
+            loader: Optional[Callable[[], email.message.EmailMessage]] = None,
             logger: Optional[logging.Logger] = None) -> None:
-        self._mail = mail
+        # mail may hold only the headers until loader parses the whole
+        self._header = mail
+        self._message: Optional[email.message.EmailMessage] = (
+                mail if loader is None else None)
+        self._loader = loader
+        self._section: Dict[str, Any] = {}
+        self.cache_hit: Counter[str] = collections.Counter()
         self.logger = logger or logging.getLogger(__name__)
 
+    @property
+    def _mail(self) -> email.message.EmailMessage:
+        if self._message is None:
+            assert self._loader is not None
+            self._message = self._loader()
+            self._loader = None
+        return self._message
+
+    def is_loaded(self) -> bool:
+        return self._message is not None
+
     def subject(self) -> str:
-        return self._mail.get('Subject')
+        return self._header.get('Subject')
+
+    def is_receipt(self) -> bool:
+        subject = self.subject()
+        if subject is None:
+            return False
+        return (subject in self.receipt_subject
+                or (self.receipt_subject_pattern is not None
+                    and bool(re.search(self.receipt_subject_pattern,
+                                       subject))))
+
+    @classmethod
+    def from_mail(cls: Type[MailT], mail: 'Mail') -> MailT:
+        # the same message as the other class, parsed or not
+        result = cls(mail._header, loader=mail._loader, logger=mail.logger)
+        result._message = mail._message
+        return result
 
     def is_multipart(self) -> bool:
         return self._mail.is_multipart()
 
+    @cached_section
     def text(self) -> str:
         return self._mail.get_content()
 
+    @cached_section
     def text_list(self) -> List[str]:
         return [part.get_content() for part in self._mail.walk()
                 if part.get_content_type() == 'text/plain']
@@ -60,27 +124,59 @@ class Mail:
         return '\n'.join(result)
 
     def date(self) -> datetime.datetime:
-        return self._mail.get('Date').datetime
+        return self._header.get('Date').datetime
 
     @classmethod
     def read_binary(
             cls: Type[MailT],
             binary: bytes,
             *,
+            lazy: bool = False,
             logger: Optional[logging.Logger] = None) -> MailT:
-        mail = email.message_from_bytes(
-                binary,
-                policy=email.policy.default)
-        return cls(mail, logger=logger)
+
+        def load() -> email.message.EmailMessage:
+            return email.message_from_bytes(
+                    binary,
+                    policy=email.policy.default)
+
+        if lazy:
+            return cls(
+                    _parse_header(_header_lines(binary.splitlines(True))),
+                    loader=load,
+                    logger=logger)
+        return cls(load(), logger=logger)
 
     @classmethod
     def read_file(
             cls: Type[MailT],
             path: pathlib.Path,
             *,
+            lazy: bool = False,
             logger: Optional[logging.Logger] = None) -> MailT:
-        with path.open(mode='rb') as file:
-            mail = email.message_from_binary_file(
-                    file,
-                    policy=email.policy.default)
-            return cls(mail, logger=logger)
+
+        def load() -> email.message.EmailMessage:
+            with path.open(mode='rb') as file:
+                return email.message_from_binary_file(
+                        file,
+                        policy=email.policy.default)
+
+        if lazy:
+            # read up to the end of the headers, the body on demand
+            with path.open(mode='rb') as file:
+                header = _parse_header(_header_lines(file))
+            return cls(header, loader=load, logger=logger)
+        return cls(load(), logger=logger)
+
+
+def _header_lines(lines: Iterable[bytes]) -> bytes:
+    result: List[bytes] = []
+    for line in lines:
+        if line in (b'\r\n', b'\n'):
+            break
+        result.append(line)
+    return b''.join(result)
+
+
+def _parse_header(header: bytes) -> email.message.EmailMessage:
+    return email.parser.BytesHeaderParser(
+            policy=email.policy.default).parsebytes(header)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import pathlib
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple, Type
+from ._mail import Mail
+
+
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+
+class Router:
+    def __init__(self, mail_class: Dict[str, Type[Mail]]) -> None:
+        self.mail_class = dict(mail_class)
+        # exact subjects by a hash lookup, the patterns in one alternation
+        self._exact: Dict[str, str] = {}
+        self._group: Dict[str, str] = {}
+        pattern_list: List[str] = []
+        for i, (name, cls) in enumerate(self.mail_class.items()):
+            for subject in cls.receipt_subject:
+                self._exact.setdefault(subject, name)
+            if cls.receipt_subject_pattern is not None:
+                group = '_{0:d}'.format(i)
+                self._group[group] = name
+                pattern_list.append('(?P<{0}>{1})'.format(
+                        group,
+                        cls.receipt_subject_pattern))
+        self._regex = (
+                re.compile('|'.join(pattern_list)) if pattern_list else None)
+        # the routing of a file is cached by the name and the version,
+        # which change with the vendors and their subjects
+        self.name = 'receipt_mail.Router({0})'.format(
+                ','.join(sorted(self.mail_class)))
+        self.version = zlib.crc32(repr((
+                sorted(self._exact.items()),
+                sorted(self._group.items()),
+                self._regex.pattern if self._regex is not None else None
+                )).encode('utf-8'))
+        # the header triage of the mails of any vendor
+        self.any_receipt: Type[Mail] = type(
+                'AnyReceipt',
+                (Mail,),
+                {'receipt_subject': tuple(self._exact),
+                 'receipt_subject_pattern': (
+                        self._regex.pattern
+                        if self._regex is not None else None)})
+
+    def route(self, subject: Optional[str]) -> Optional[str]:
+        if subject is None:
+            return None
+        name = self._exact.get(subject)
+        if name is not None or self._regex is None:
+            return name
+        match = self._regex.search(subject)
+        if match is None or match.lastgroup is None:
+            return None
+        return self._group[match.lastgroup]
+
+    def read_file(
+            self,
+            path: pathlib.Path,
+            *,
+            logger: Optional[logging.Logger] = None) -> Optional[
+                    Tuple[str, Mail]]:
+        # the headers only, the vendor class parses the body on demand
+        mail = Mail.read_file(path, lazy=True, logger=logger)
+        name = self.route(mail.subject())
+        if name is None:
+            return None
+        return name, self.mail_class[name].from_mail(mail)
+
+    def route_binary(
+            self,
+            binary: bytes,
+            *,
+            logger: Optional[logging.Logger] = None) -> Optional[str]:
+        # the vendor of a mail by its header part
+        return self.route(
+                Mail.read_binary(binary, lazy=True, logger=logger).subject())
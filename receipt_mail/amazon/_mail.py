@@ -3,8 +3,10 @@
 import datetime
 import re
 import textwrap
-from typing import List, NamedTuple, Optional, Tuple
-from .._mail import Mail as MailBase
+from typing import List, NamedTuple, Tuple
+from .._grammar import (
+        Field, Grammar, Rows, Section, integer, integer_or, negative)
+from .._mail import Mail as MailBase, cached_section
 
 
 class Item(NamedTuple):
@@ -27,9 +29,9 @@ class Receipt(NamedTuple):
 
 
 class Mail(MailBase):
-    def is_receipt(self) -> bool:
-        pattern = r'Amazon.co.jp ご注文の確認'
-        return bool(re.match(pattern, self.subject()))
+    # bump when the parse result changes
+    parser_version = 2
+    receipt_subject_pattern = r'^Amazon.co.jp ご注文の確認'
 
     def receipt(self) -> List[Receipt]:
         result: List[Receipt] = []
@@ -43,19 +45,25 @@ class Mail(MailBase):
                     'order %d:\n%s',
                     i,
                     textwrap.indent(str(order), '    '))
+            value = ORDER_GRAMMAR.parse(order)
             # order
-            order_id = _order_id(order)
+            order_id = value['order_id']
             self.logger.debug('order id: %s', order_id)
             # item list
-            item_list = _item_list(order)
+            item_list = [
+                    Item(
+                            name=row['name'],
+                            piece=row['piece'],
+                            price=row['unit_price'] * row['piece'])
+                    for row in value['items']]
             self.logger.debug('item list: %s', item_list)
             if not item_list:
                 self.logger.error('item list is empty')
             # shipping
-            shipping = _shipping(order)
+            shipping = value['shipping']
             self.logger.debug('shipping: %d', shipping)
             # discount
-            discount = _discount(order)
+            discount = value['discount']
             self.logger.debug('discount: %d', discount)
             # receipt
             receipt = Receipt(
@@ -65,103 +73,81 @@ class Mail(MailBase):
                     discount=discount,
                     purchased_date=self.date())
             # total payment
-            if receipt.total_payment() != _total_payment(order):
+            if receipt.total_payment() != value['total_payment']:
                 self.logger.error(
                         'total payment is mismatch: %d(mail) & %d(result)',
-                        _total_payment(order),
+                        value['total_payment'],
                         receipt.total_payment())
             result.append(receipt)
         if not result:
             self.logger.warning('order is not found')
         return result
 
+    @cached_section
     def order(self) -> List[str]:
         result: List[str] = []
         if not self.text_list():
             self.logger.warning('mail has not text/plain')
-        pattern = re.compile(
-                r'=+\n'
-                r'.+?'
-                r'注文番号：\s*[0-9-]+\s*\n'
-                r'.+?'
-                r'(?==+\n)',
-                flags=re.DOTALL)
         for text in map(lambda x: x.replace('\r\n', '\n'), self.text_list()):
-            match = pattern.search(text)
-            while match:
-                text = pattern.sub('', text, count=1)
-                result.append(match.group())
-                match = pattern.search(text)
+            result.extend(
+                    row['order'] for row in MAIL_GRAMMAR.parse(text)['orders'])
         return result
 
 
-def _order_id(order: str) -> str:
-    match = re.search(
-            r'\s*注文番号：\s*(?P<order_id>[0-9-]+)\s*\n',
-            order)
-    if match:
-        return match.group('order_id')
-    return ''
-
-
-def _extract_item_list(order: str) -> Optional[str]:
-    match = re.search(
-            r'=+\n'
-            r'.+?'
-            r'注文番号：\s*[0-9-]+\s*\n'
-            r'(?P<item_list>.+?)'
-            r'_+\n',
-            order,
-            flags=re.DOTALL)
-    if match:
-        return match.group('item_list')
-    return None
-
-
-def _item_list(order: str) -> List[Item]:
-    result: List[Item] = []
-    text = _extract_item_list(order)
-    if text:
-        regex = re.compile(
-                r'\s*(?P<name>.+?)(\s*-\s*(?P<piece>[0-9,]+)\s*点|)\n'
-                r'\s*￥\s*(?P<unit_price>[0-9,]+)\n')
-        match = regex.search(text)
-        while match:
-            text = regex.sub('', text, count=1)
-            piece = (int(match.group('piece').replace(',', ''))
-                     if match.group('piece') is not None
-                     else 1)
-            unit_price = int(match.group('unit_price').replace(',', ''))
-            result.append(Item(
-                    name=match.group('name'),
-                    piece=piece,
-                    price=unit_price * piece))
-            match = regex.search(text)
-    return result
-
-
-def _shipping(order: str) -> int:
-    match = re.search(
-            r'\s*配送料・手数料： \s*￥\s*(?P<value>[0-9,]+)',
-            order)
-    if match:
-        return int(match.group('value').replace(',', ''))
-    return 0
-
-
-def _discount(order: str) -> int:
-    match = re.search(
-            r'\s*割引：\s*-￥\s*(?P<value>[0-9,]+)',
-            order)
-    if match:
-        return - int(match.group('value').replace(',', ''))
-    return 0
-
-
-def _total_payment(order: str) -> int:
-    match = re.search(
-            r'\s*注文合計：\s*￥\s*(?P<value>[0-9,]+)\n',
-            order)
-    if match:
-        return int(match.group('value').replace(',', ''))
-    return 0
+# the orders in a text/plain part
+MAIL_GRAMMAR = Grammar(
+        'amazon',
+        rows=(
+                Rows(
+                        'orders',
+                        r'(?P<order>'
+                        r'=+\n'
+                        r'.+?'
+                        r'注文番号：\s*[0-9-]+\s*\n'
+                        r'.+?'
+                        r'(?==+\n))',
+                        convert={'order': str},
+                        flags=re.DOTALL),))
+
+
+ORDER_GRAMMAR = Grammar(
+        'amazon order',
+        sections=(
+                Section(
+                        'item_list',
+                        r'=+\n'
+                        r'.+?'
+                        r'注文番号：\s*[0-9-]+\s*\n'
+                        r'(?P<value>.+?)'
+                        r'_+\n',
+                        flags=re.DOTALL),),
+        fields=(
+                Field(
+                        'order_id',
+                        r'\s*注文番号：\s*(?P<value>[0-9-]+)\s*\n',
+                        default=''),
+                Field(
+                        'shipping',
+                        r'\s*配送料・手数料： \s*￥\s*(?P<value>[0-9,]+)',
+                        convert=integer,
+                        default=0),
+                Field(
+                        'discount',
+                        r'\s*割引：\s*-￥\s*(?P<value>[0-9,]+)',
+                        convert=negative,
+                        default=0),
+                Field(
+                        'total_payment',
+                        r'\s*注文合計：\s*￥\s*(?P<value>[0-9,]+)\n',
+                        convert=integer,
+                        default=0)),
+        rows=(
+                Rows(
+                        'items',
+                        r'\s*(?P<name>.+?)(\s*-\s*(?P<piece>[0-9,]+)\s*点|)\n'
+                        r'\s*￥\s*(?P<unit_price>[0-9,]+)\n',
+                        convert={
+                                'name': str,
+                                'piece': integer_or(1),
+                                'unit_price': integer},
+                        section='item_list'),))
@@ -4,9 +4,10 @@ import datetime
 import enum
 import re
 import textwrap
-from typing import List, NamedTuple, Optional, Tuple
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 import pytz
-from .._mail import Mail as MailBase
+from .._grammar import Field, Grammar, Rows
+from .._mail import Mail as MailBase, cached_section
 
 
 class ReceiptType(enum.Enum):
@@ -44,6 +45,12 @@ class Receipt(NamedTuple):
 
 
 class Mail(MailBase):
+    # bump when the parse result changes
+    # 2: a field on the last line of the order block is read
+    parser_version = 2
+    receipt_subject_pattern = r'Order Confirmation'
+
+    @cached_section
     def order(self) -> Optional[str]:
         pattern = (
             r'\[Your Order\]\n'
@@ -58,8 +65,22 @@ class Mail(MailBase):
             return result
         return None
 
-    def is_receipt(self) -> bool:
-        return bool(re.search(r'Order Confirmation', self.subject()))
+    @cached_section
+    def value(self) -> Dict[str, Any]:
+        return GRAMMAR.parse(self.order() or '')
+
+    @cached_section
+    def items(self) -> List[Item]:
+        order = self.order()
+        if not order:
+            return []
+        result = [
+                Item(name=row['name'], price=row['price'], piece=1)
+                for row in self.value()['books']]
+        coin = _get_coin(order)
+        if coin is not None:
+            result.append(coin)
+        return result
 
     def receipt_type(self) -> ReceiptType:
         order = self.order()
@@ -68,8 +89,7 @@ class Mail(MailBase):
                     r'Order Confirmation for Pre-ordered eBooks',
                     self.subject()):
                 return ReceiptType.PRE_ORDER
-            items = _get_item(order)
-            for item in items:
+            for item in self.items():
                 if re.match(r'BOOK☆WALKER (期間限定)?コイン .+', item.name):
                     return ReceiptType.COIN
             return ReceiptType.ORDER
@@ -92,24 +112,19 @@ class Mail(MailBase):
             if type_ == ReceiptType.NONE:
                 self.logger.error('receipt type is None')
             # item
-            items = _get_item(order)
+            items = self.items()
+            value = self.value()
             # discount
-            discount = _get_jpy(order, 'Coupon Discount')
-            if discount is None:
-                discount = 0
+            discount = value['discount']
             self.logger.debug('discount: %d', discount)
             # tax
-            tax = _get_jpy(order, 'Tax')
-            if tax is None:
-                tax = 0
+            tax = value['tax']
             self.logger.debug('tax: %d', tax)
             # coin usage
-            coin_usage = _get_jpy(order, r'Coin Usage \(1 Coin = JPY 1\)')
-            if coin_usage is None:
-                coin_usage = 0
+            coin_usage = value['coin_usage']
             self.logger.debug('coin usage: %d', coin_usage)
             # purchased date
-            purchased_date = _get_purchased_date(order)
+            purchased_date = value['purchased_date']
             if purchased_date is None:
                 purchased_date = self.date()
             self.logger.debug('purchased date: %s', purchased_date)
@@ -128,7 +143,7 @@ class Mail(MailBase):
                     granted_coin=tuple(granted_coin),
                     purchased_date=purchased_date)
             # total amount
-            total_amount = _get_jpy(order, 'Total Amount')
+            total_amount = value['total_amount']
             self.logger.debug('total ammount: %s', total_amount)
             if (total_amount is not None
                     and receipt.total_amount() != total_amount):
@@ -137,7 +152,7 @@ class Mail(MailBase):
                         total_amount,
                         receipt.total_amount())
             # total payment
-            total_payment = _get_jpy(order, 'Total Payment')
+            total_payment = value['total_payment']
             self.logger.debug('total payment: %s', total_payment)
             if (total_payment is not None
                     and receipt.total_payment() != total_payment):
@@ -151,21 +166,7 @@ class Mail(MailBase):
         return result
 
 
-def _get_item(text: str) -> List[Item]:
-    result: List[Item] = []
-    # book
-    book_regex = re.compile(
-            r'■(|Title / )Item\s*[:：]\s*(?P<name>.+)\n'
-            r'■Price\s*[:：]\s*(?P<price>.+)\n')
-    book_match = book_regex.search(text)
-    while book_match:
-        text = book_regex.sub('', text, count=1)
-        result.append(Item(
-                name=book_match.group('name').strip(),
-                price=_to_jpy(book_match.group('price').strip()),
-                piece=1))
-        book_match = book_regex.search(text)
-    # coin
+def _get_coin(text: str) -> Optional[Item]:
     coin_regex = re.compile(
             r'■Item\s*[:：]\s*(?P<name>BOOK☆WALKER (期間限定)?コイン [0-9,]+円分)[^\n]+\n+'
             r'■Amount\s*[:：]\s*(?P<amount>.+)\n')
@@ -176,20 +177,10 @@ def _get_item(text: str) -> List[Item]:
         text = coin_regex.sub('', text, count=1)
         coin_price_match = coin_price_regex.search(text)
         if coin_price_match:
-            text = coin_price_regex.sub('', text, count=1)
-            result.append(Item(
+            return Item(
                     name=coin_match.group('name').strip(),
                     price=_to_jpy(coin_price_match.group('price').strip()),
-                    piece=int(coin_match.group('amount').strip())))
-    return result
-
-
-def _get_jpy(text: str, key: str) -> Optional[int]:
-    match = re.search(
-            r'■{0}\s*[:：]\s*(?P<value>.+)\n'.format(key),
-            text)
-    if match:
-        return _to_jpy(match.group('value'))
+                    piece=int(coin_match.group('amount').strip()))
     return None
 
 
@@ -260,15 +251,6 @@ def _get_granted_coin_latest(text: str) -> List[int]:
     return result
 
 
-def _get_purchased_date(text: str) -> Optional[datetime.datetime]:
-    match = re.search(
-            r'■Purchased Date\s*[:：]\s*(?P<value>.+)\n',
-            text)
-    if match:
-        return _to_datetime(match.group('value'))
-    return None
-
-
 def _to_jpy(text: str) -> int:
     pattern = r'JPY (?P<value>(|-)[0-9,]+)(| \(\+Tax\))'
     match = re.match(pattern, text)
@@ -304,3 +286,44 @@ def _to_datetime(text: str) -> Optional[datetime.datetime]:
             return result.astimezone(tz=timezone)
         return result
     return None
+
+
+def _field(
+        name: str,
+        key: str,
+        convert: Any,
+        default: Any = None) -> Field:
+    return Field(
+            name,
+            r'^■{0}\s*[:：][^\S\n]*(?P<value>.+)$'.format(re.escape(key)),
+            convert=convert,
+            default=default,
+            line=True)
+
+
+# the order block after Mail.order
+# the line fields end at '$', so a field on the last line of the block,
+# which has no newline, is read; the searches up to parser_version 1
+# required the newline and missed it
+GRAMMAR = Grammar(
+        'bookwalker',
+        fields=(
+                _field('purchased_date', 'Purchased Date', _to_datetime),
+                _field('discount', 'Coupon Discount', _to_jpy, 0),
+                _field('tax', 'Tax', _to_jpy, 0),
+                _field('total_amount', 'Total Amount', _to_jpy),
+                _field(
+                        'coin_usage',
+                        'Coin Usage (1 Coin = JPY 1)',
+                        _to_jpy,
+                        0),
+                _field('total_payment', 'Total Payment', _to_jpy)),
+        rows=(
+                Rows(
+                        'books',
+                        r'■(|Title / )Item\s*[:：]\s*(?P<name>.+)\n'
+                        r'■Price\s*[:：]\s*(?P<price>.+)\n',
+                        convert={
+                                'name': str.strip,
+                                'price': lambda value: _to_jpy(
+                                        value.strip())}),))
@@ -3,6 +3,7 @@
 import datetime
 import re
 from typing import List, NamedTuple, Tuple
+from .._grammar import Field, Grammar, Rows, Section, integer
 from .._mail import Mail as MailBase
 
 
@@ -29,79 +30,76 @@ class Receipt(NamedTuple):
 
 
 class Mail(MailBase):
-    def is_receipt(self) -> bool:
-        pattern = '【メロンブックス／フロマージュブックス】 ご注文の確認'
-        return self.subject() == pattern
+    # bump when the parse result changes
+    parser_version = 1
+    receipt_subject = ('【メロンブックス／フロマージュブックス】 ご注文の確認',)
 
     def receipt(self) -> List[Receipt]:
         result: List[Receipt] = []
         if self.is_receipt():
-            text = self.text()
+            value = GRAMMAR.parse(self.text())
             receipt = Receipt(
-                order_id=_order_id(text),
-                items=tuple(_item_list(text)),
-                shipping=_price('送料', text),
-                charge=_price('手数料', text),
-                point_usage=_point('利用ポイント数', text),
-                granted_point=_point('獲得予定ポイント数', text),
+                order_id=value['order_id'],
+                items=tuple(Item(**row) for row in value['items']),
+                shipping=value['shipping'],
+                charge=value['charge'],
+                point_usage=value['point_usage'],
+                granted_point=value['granted_point'],
                 purchased_date=self.date())
             assert receipt.items
-            assert receipt.total_payment() == _price('合計額', text)
+            assert receipt.total_payment() == value['total']
             result.append(receipt)
         return result
 
 
-def _order_id(text: str) -> int:
-    match = re.search(
-            r'●ご注文番号\n'
-            r'(?P<value>[0-9]+)\n',
-            text)
-    if match:
-        return int(match.group('value'))
-    return 0
-
-
-def _item_list(text: str) -> List[Item]:
-    result: List[Item] = []
-    order_match = re.search(
-            r'●ご注文内容\n'
-            r'(?P<order>.+?)\n'
-            r'(?=●合計\n)',
-            text,
-            flags=re.DOTALL)
-    if order_match:
-        order = order_match.group('order')
-        regex = re.compile(
-                r'商品名:\s*(?P<name>.+)\s*\n'
-                r'数量:\s*(?P<piece>[0-9,]+)\s*個\s*\n'
-                r'単価:\s*(?P<unit_price>[0-9,]+)\s*円 \+ 消費税\s*\n'
-                r'商品合計額:\s*(?P<price>[0-9,]+)\s*円\s*\(税込\)\s*\n')
-        match = regex.search(order)
-        while match:
-            order = regex.sub('', order, count=1)
-            result.append(Item(
-                    name=match.group('name'),
-                    piece=int(match.group('piece').replace(',', '')),
-                    price=int(match.group('price').replace(',', ''))))
-            match = regex.search(order)
-    return result
-
-
-def _price(target: str, text: str) -> int:
-    match = re.search(
+def _price(name: str, target: str) -> Field:
+    return Field(
+            name,
             r'^{0}:\s*(?P<value>[0-9,]+)円\(税込\)$'.format(target),
-            text,
-            flags=re.MULTILINE)
-    if match:
-        return int(match.group('value').replace(',', ''))
-    return 0
+            convert=integer,
+            default=0,
+            line=True)
 
 
-def _point(target: str, text: str) -> int:
-    match = re.search(
+def _point(name: str, target: str) -> Field:
+    return Field(
+            name,
             r'^{0}(:|：)\s*(?P<value>[0-9,]+)\s*$'.format(target),
-            text,
-            flags=re.MULTILINE)
-    if match:
-        return int(match.group('value').replace(',', ''))
-    return 0
+            convert=integer,
+            default=0,
+            line=True)
+
+
+GRAMMAR = Grammar(
+        'melonbooks',
+        sections=(
+                Section(
+                        'order',
+                        r'●ご注文内容\n'
+                        r'(?P<value>.+?)\n'
+                        r'(?=●合計\n)',
+                        flags=re.DOTALL),),
+        fields=(
+                Field(
+                        'order_id',
+                        r'●ご注文番号\n'
+                        r'(?P<value>[0-9]+)\n',
+                        convert=int,
+                        default=0),
+                _price('shipping', '送料'),
+                _price('charge', '手数料'),
+                _price('total', '合計額'),
+                _point('point_usage', '利用ポイント数'),
+                _point('granted_point', '獲得予定ポイント数')),
+        rows=(
+                Rows(
+                        'items',
+                        r'商品名:\s*(?P<name>.+)\s*\n'
+                        r'数量:\s*(?P<piece>[0-9,]+)\s*個\s*\n'
+                        r'単価:\s*(?P<unit_price>[0-9,]+)\s*円 \+ 消費税\s*\n'
+                        r'商品合計額:\s*(?P<price>[0-9,]+)\s*円\s*\(税込\)\s*\n',
+                        convert={
+                                'name': str,
+                                'piece': integer,
+                                'price': integer},
+                        section='order'),))
@@ -3,7 +3,8 @@
 import datetime
 import re
 import textwrap
-from typing import List, NamedTuple, Optional, Tuple
+from typing import List, NamedTuple, Tuple
+from .._grammar import Field, Grammar, Rows, Section, integer
 from .._mail import Mail as MailBase
 
 
@@ -27,9 +28,9 @@ class Receipt(NamedTuple):
 
 
 class Mail(MailBase):
-    def is_receipt(self) -> bool:
-        pattern = 'ヨドバシ・ドット・コム：ご注文ありがとうございます'
-        return self.subject() == pattern
+    # bump when the parse result changes
+    parser_version = 1
+    receipt_subject = ('ヨドバシ・ドット・コム：ご注文ありがとうございます',)
 
     def receipt(self) -> List[Receipt]:
         result: List[Receipt] = []
@@ -38,20 +39,21 @@ class Mail(MailBase):
             textwrap.indent(self.structure(), '    '))
         for i, text in enumerate(self.text_list()):
             self.logger.debug('text %d:\n%s', i, textwrap.indent(text, '    '))
-            order = _extract_item_list(text)
+            value = GRAMMAR.parse(text)
+            order = value['order']
             if order:
                 self.logger.debug('order:\n%s', textwrap.indent(order, '    '))
                 # item list
-                item_list = _item_list(order)
+                item_list = [Item(**row) for row in value['items']]
                 self.logger.debug('item list: %s', item_list)
                 # shipping
-                shipping = _shipping(order)
+                shipping = value['shipping']
                 self.logger.debug('shipping: %d', shipping)
                 # used point
-                used_point = _used_point(text)
+                used_point = value['used_point']
                 self.logger.debug('used point: %d', used_point)
                 # granted point
-                granted_point = _granted_point(text)
+                granted_point = value['granted_point']
                 self.logger.debug('granted point: %d', granted_point)
                 # receipt
                 receipt = Receipt(
@@ -64,60 +66,42 @@ class Mail(MailBase):
         return result
 
 
-def _extract_item_list(text: str) -> Optional[str]:
-    match = re.search(
-            r'【ご注文商品】\n'
-            r'-+\n'
-            r'(?P<item_list>.+)\n'
-            r'【お支払方法】',
-            text,
-            flags=re.DOTALL)
-    if match:
-        return match.group('item_list')
-    return None
-
-
-def _item_list(text: str) -> List[Item]:
-    result: List[Item] = []
-    regex = re.compile(
-            r'・「(?P<name>.+?)」\n'
-            r'.+?'
-            r'合計 (?P<piece>[0-9,]+) 点\s+(?P<price>[0-9,]+) 円',
-            flags=re.DOTALL)
-    match = regex.search(text)
-    while match:
-        text = regex.sub('', text, count=1)
-        result.append(Item(
-                name=match.group('name'),
-                price=int(match.group('price').replace(',', '')),
-                piece=int(match.group('piece').replace(',', ''))))
-        match = regex.search(text)
-    return result
-
-
-def _shipping(text: str) -> int:
-    match = re.search(
-            r'・配達料金：\s*(?P<price>[0-9,]+) 円',
-            text,
-            flags=re.DOTALL)
-    if match:
-        return int(match.group('price').replace(',', ''))
-    return 0
-
-
-def _used_point(text: str) -> int:
-    match = re.search(
-            r'ゴールドポイントでのお支払い\s+(?P<point>[0-9.]+)\s+円',
-            text)
-    if match:
-        return int(match.group('point').replace(',', ''))
-    return 0
-
-
-def _granted_point(text: str) -> int:
-    match = re.search(
-            r'今回の還元ゴールドポイント数\s+(?P<point>[0-9,]+) ポイント',
-            text)
-    if match:
-        return int(match.group('point').replace(',', ''))
-    return 0
+GRAMMAR = Grammar(
+        'yodobashi',
+        sections=(
+                Section(
+                        'order',
+                        r'【ご注文商品】\n'
+                        r'-+\n'
+                        r'(?P<value>.+)\n'
+                        r'【お支払方法】',
+                        flags=re.DOTALL),),
+        fields=(
+                Field(
+                        'shipping',
+                        r'・配達料金：\s*(?P<value>[0-9,]+) 円',
+                        convert=integer,
+                        default=0,
+                        section='order'),
+                Field(
+                        'used_point',
+                        r'ゴールドポイントでのお支払い\s+(?P<value>[0-9.]+)\s+円',
+                        convert=integer,
+                        default=0),
+                Field(
+                        'granted_point',
+                        r'今回の還元ゴールドポイント数\s+(?P<value>[0-9,]+) ポイント',
+                        convert=integer,
+                        default=0)),
+        rows=(
+                Rows(
+                        'items',
+                        r'・「(?P<name>.+?)」\n'
+                        r'.+?'
+                        r'合計 (?P<piece>[0-9,]+) 点\s+(?P<price>[0-9,]+) 円',
+                        convert={
+                                'name': str,
+                                'price': integer,
+                                'piece': integer},
+                        flags=re.DOTALL,
+                        section='order'),))
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import datetime
+import logging
+import pathlib
+import pickle
+import sqlite3
+from typing import (
+        Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple,
+        TypeVar)
+import utility
+
+
+DEFAULT_STORE_PATH = 'receipt.sqlite3'
+DEFAULT_INSERT_BATCH = 1000
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+SCHEMA_VERSION = 1
+GRAM_SIZE = 2
+
+
+RecordT = TypeVar('RecordT', bound=Tuple[str, Any])
+
+
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+
+SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS receipt ('
+        ' id INTEGER PRIMARY KEY,'
+        ' vendor TEXT NOT NULL,'
+        ' receipt_id TEXT NOT NULL,'
+        ' order_id TEXT,'
+        ' purchased_date TEXT NOT NULL,'
+        ' data BLOB NOT NULL,'
+        ' UNIQUE (vendor, receipt_id))',
+        'CREATE INDEX IF NOT EXISTS receipt_purchased_date'
+        ' ON receipt (purchased_date)',
+        'CREATE INDEX IF NOT EXISTS receipt_vendor_purchased_date'
+        ' ON receipt (vendor, purchased_date)',
+        'CREATE INDEX IF NOT EXISTS receipt_order_id ON receipt (order_id)',
+        'CREATE TABLE IF NOT EXISTS item ('
+        ' receipt INTEGER NOT NULL'
+        ' REFERENCES receipt (id) ON DELETE CASCADE,'
+        ' position INTEGER NOT NULL,'
+        ' name TEXT NOT NULL,'
+        ' price INTEGER NOT NULL,'
+        ' piece INTEGER NOT NULL,'
+        ' PRIMARY KEY (receipt, position))',
+        # inverted index: n-gram -> item
+        'CREATE TABLE IF NOT EXISTS item_gram ('
+        ' gram TEXT NOT NULL,'
+        ' receipt INTEGER NOT NULL'
+        ' REFERENCES receipt (id) ON DELETE CASCADE,'
+        ' position INTEGER NOT NULL,'
+        ' PRIMARY KEY (gram, receipt, position)) WITHOUT ROWID',
+        'CREATE INDEX IF NOT EXISTS item_gram_receipt'
+        ' ON item_gram (receipt)')
+
+
+class ItemMatch(NamedTuple):
+    vendor: str
+    purchased_date: datetime.datetime
+    order_id: Optional[str]
+    name: str
+    price: int
+    piece: int
+
+
+def date_key(date: datetime.datetime) -> str:
+    # fixed width UTC, the text order is the time order
+    return date.astimezone(datetime.timezone.utc).strftime(DATE_FORMAT)
+
+
+def search_key(string: str) -> str:
+    string = utility.fullwidth_to_halfwidth(utility.normalize(string))
+    return ''.join(string.casefold().split())
+
+
+def tokenize(string: str) -> Set[str]:
+    # character n-grams, word boundaries are not marked in Japanese
+    key = search_key(string)
+    if len(key) < GRAM_SIZE:
+        return {key} if key else set()
+    return {key[i:i + GRAM_SIZE] for i in range(len(key) - GRAM_SIZE + 1)}
+
+
+class ReceiptStore:
+    def __init__(
+            self,
+            path: pathlib.Path,
+            *,
+            logger: Optional[logging.Logger] = None) -> None:
+        self.path = path
+        self.logger = logger or logging.getLogger(__name__)
+        # the targets write with their own connections
+        self._connection = sqlite3.connect(path.as_posix(), timeout=60.0)
+        self._connection.execute('PRAGMA journal_mode = WAL')
+        self._connection.execute('PRAGMA synchronous = NORMAL')
+        self._connection.execute('PRAGMA foreign_keys = ON')
+        with self._transaction():
+            schema_version = self._connection.execute(
+                    'PRAGMA user_version').fetchone()[0]
+            for statement in SCHEMA:
+                self._connection.execute(statement)
+            if schema_version != SCHEMA_VERSION:
+                self._reindex()
+                self._connection.execute(
+                        'PRAGMA user_version = {0:d}'.format(SCHEMA_VERSION))
+
+    def __enter__(self) -> 'ReceiptStore':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[None]:
+        # take the write lock first, a deferred transaction that reads
+        # before it writes fails at once when the other targets committed
+        # in between, without waiting for the busy timeout
+        self._connection.execute('BEGIN IMMEDIATE')
+        with self._connection:
+            yield
+
+    def clear(self, vendor: str) -> int:
+        with self._transaction():
+            return self._connection.execute(
+                    'DELETE FROM receipt WHERE vendor = ?',
+                    (vendor,)).rowcount
+
+    def insert_stream(
+            self,
+            vendor: str,
+            record_list: Iterable[RecordT],
+            *,
+            batch_size: int = DEFAULT_INSERT_BATCH,
+            replace: bool = False) -> Iterator[RecordT]:
+        # store (receipt id, receipt) pairs while passing them through,
+        # committed every batch_size receipts to keep the write lock short
+        # replace: the vendor's receipts not in record_list are removed
+        # after the last one, the store is never empty in between
+        if replace:
+            with self._transaction():
+                self._connection.execute(
+                        'CREATE TEMP TABLE IF NOT EXISTS seen ('
+                        ' receipt_id TEXT PRIMARY KEY) WITHOUT ROWID')
+                self._connection.execute('DELETE FROM temp.seen')
+        batch: List[RecordT] = []
+        for record in record_list:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                self.insert(vendor, batch, replace=replace)
+                yield from batch
+                batch = []
+        self.insert(vendor, batch, replace=replace)
+        yield from batch
+        if replace:
+            with self._transaction():
+                removed = self._connection.execute(
+                        'DELETE FROM receipt WHERE vendor = ? AND receipt_id'
+                        ' NOT IN (SELECT receipt_id FROM temp.seen)',
+                        (vendor,)).rowcount
+                self._connection.execute('DELETE FROM temp.seen')
+            self.logger.debug('%s: %d receipts are removed', vendor, removed)
+
+    def insert(
+            self,
+            vendor: str,
+            record_list: List[RecordT],
+            *,
+            replace: bool = False) -> int:
+        # replace: overwrite a stored receipt of the same id once per run,
+        # the ids are kept in temp.seen (see insert_stream)
+        inserted = 0
+        with self._transaction():
+            for receipt_id, receipt in record_list:
+                data = pickle.dumps(receipt)
+                if replace:
+                    if self._connection.execute(
+                            'INSERT OR IGNORE INTO temp.seen (receipt_id)'
+                            ' VALUES (?)',
+                            (receipt_id,)).rowcount == 0:
+                        continue
+                    row = self._connection.execute(
+                            'SELECT id, data FROM receipt'
+                            ' WHERE vendor = ? AND receipt_id = ?',
+                            (vendor, receipt_id)).fetchone()
+                    if row is not None:
+                        if row[1] == data:
+                            continue
+                        # the items and the n-grams by the cascade
+                        self._connection.execute(
+                                'DELETE FROM receipt WHERE id = ?',
+                                (row[0],))
+                order_id = getattr(receipt, 'order_id', None)
+                cursor = self._connection.execute(
+                        'INSERT OR IGNORE INTO receipt'
+                        ' (vendor, receipt_id, order_id, purchased_date, data)'
+                        ' VALUES (?, ?, ?, ?, ?)',
+                        (vendor,
+                         receipt_id,
+                         str(order_id) if order_id is not None else None,
+                         date_key(receipt.purchased_date),
+                         data))
+                if cursor.rowcount == 0:
+                    continue
+                inserted += 1
+                self._connection.executemany(
+                        'INSERT INTO item (receipt, position, name, price,'
+                        ' piece) VALUES (?, ?, ?, ?, ?)',
+                        ((cursor.lastrowid,
+                          position,
+                          item.name,
+                          item.price,
+                          getattr(item, 'piece', 1))
+                         for position, item
+                         in enumerate(getattr(receipt, 'items', ()))))
+                self._connection.executemany(
+                        'INSERT INTO item_gram (gram, receipt, position)'
+                        ' VALUES (?, ?, ?)',
+                        ((gram, cursor.lastrowid, position)
+                         for position, item
+                         in enumerate(getattr(receipt, 'items', ()))
+                         for gram in tokenize(item.name)))
+        return inserted
+
+    def _reindex(self) -> None:
+        # the n-grams of the items stored before the index existed
+        self._connection.execute('DELETE FROM item_gram')
+        self._connection.executemany(
+                'INSERT INTO item_gram (gram, receipt, position)'
+                ' VALUES (?, ?, ?)',
+                ((gram, receipt, position)
+                 for receipt, position, name in self._connection.execute(
+                        'SELECT receipt, position, name FROM item').fetchall()
+                 for gram in tokenize(name)))
+
+    def iter_receipt(
+            self,
+            *,
+            vendor: Optional[str] = None,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None) -> Iterator[Any]:
+        # in the order of purchased_date, then of insertion
+        where, parameters = _condition(vendor, since, until)
+        for (data,) in self._connection.execute(
+                'SELECT data FROM receipt{0}'
+                ' ORDER BY purchased_date, id'.format(where),
+                parameters):
+            yield pickle.loads(data)
+
+    def count(
+            self,
+            *,
+            vendor: Optional[str] = None,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None) -> int:
+        where, parameters = _condition(vendor, since, until)
+        return self._connection.execute(
+                'SELECT COUNT(*) FROM receipt{0}'.format(where),
+                parameters).fetchone()[0]
+
+    def search_item(
+            self,
+            query: str,
+            *,
+            vendor: Optional[str] = None,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None) -> List[ItemMatch]:
+        key = search_key(query)
+        if not key:
+            return []
+        if len(key) < GRAM_SIZE:
+            # every n-gram starting with the character,
+            # or ending with it for the last character of a name
+            candidate = (
+                    'SELECT DISTINCT receipt, position FROM item_gram'
+                    ' WHERE (gram >= ? AND gram < ?) OR substr(gram, 2) = ?')
+            parameters: List[str] = [key, chr(ord(key) + 1), key]
+        else:
+            gram_list = sorted(tokenize(query))
+            candidate = (
+                    'SELECT receipt, position FROM item_gram'
+                    ' WHERE gram IN ({0}) GROUP BY receipt, position'
+                    ' HAVING COUNT(*) = {1:d}'.format(
+                            ', '.join('?' * len(gram_list)),
+                            len(gram_list)))
+            parameters = gram_list
+        where, condition = _condition(vendor, since, until, table='receipt')
+        result: List[ItemMatch] = []
+        for row in self._connection.execute(
+                'SELECT receipt.vendor, receipt.purchased_date,'
+                ' receipt.order_id, item.name, item.price, item.piece'
+                ' FROM ({0}) AS candidate'
+                ' JOIN item USING (receipt, position)'
+                ' JOIN receipt ON receipt.id = candidate.receipt{1}'
+                ' ORDER BY receipt.purchased_date, receipt.id,'
+                ' item.position'.format(
+                        candidate,
+                        where),
+                parameters + condition):
+            # the n-grams match, the string may not
+            if key not in search_key(row[3]):
+                continue
+            result.append(ItemMatch(
+                    vendor=row[0],
+                    purchased_date=datetime.datetime.strptime(
+                            row[1],
+                            DATE_FORMAT).replace(
+                                    tzinfo=datetime.timezone.utc),
+                    order_id=row[2],
+                    name=row[3],
+                    price=row[4],
+                    piece=row[5]))
+        return result
+
+    def find_order(self, order_id: str) -> List[Tuple[str, Any]]:
+        return [
+                (vendor, pickle.loads(data))
+                for vendor, data in self._connection.execute(
+                        'SELECT vendor, data FROM receipt WHERE order_id = ?'
+                        ' ORDER BY purchased_date, id',
+                        (order_id,))]
+
+
+def _condition(
+        vendor: Optional[str],
+        since: Optional[datetime.datetime],
+        until: Optional[datetime.datetime],
+        *,
+        table: Optional[str] = None) -> Tuple[str, List[str]]:
+    prefix = '{0}.'.format(table) if table is not None else ''
+    clause: List[str] = []
+    parameters: List[str] = []
+    if vendor is not None:
+        clause.append('{0}vendor = ?'.format(prefix))
+        parameters.append(vendor)
+    if since is not None:
+        clause.append('{0}purchased_date >= ?'.format(prefix))
+        parameters.append(date_key(since))
+    if until is not None:
+        clause.append('{0}purchased_date < ?'.format(prefix))
+        parameters.append(date_key(until))
+    where = ' WHERE {0}'.format(' AND '.join(clause)) if clause else ''
+    return where, parameters
+
+
+def open_store(
+        config: Dict[str, Any],
+        *,
+        logger: Optional[logging.Logger] = None) -> Optional[ReceiptStore]:
+    store_config = config.get('store') or {}
+    if store_config.get('enable', True) is False:
+        return None
+    return ReceiptStore(
+            pathlib.Path(store_config.get('path') or DEFAULT_STORE_PATH),
+            logger=logger)
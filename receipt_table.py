@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+import array
+import datetime
+import enum
+import typing
+from typing import (
+        Any, Callable, Dict, Generic, Iterable, Iterator, List, Optional,
+        Tuple, Type, TypeVar)
+
+
+ReceiptT = TypeVar('ReceiptT')
+
+
+# typecodes: int64 for the receipts, int32 for the items
+RECEIPT_INTEGER = 'q'
+ITEM_INTEGER = 'i'
+
+
+class StringTable:
+    # each distinct string is held once, the columns hold its index
+    def __init__(self) -> None:
+        self._index: Dict[str, int] = {}
+        self._string: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._string)
+
+    def __getitem__(self, index: int) -> str:
+        return self._string[index]
+
+    def intern(self, string: str) -> int:
+        index = self._index.get(string)
+        if index is None:
+            index = len(self._string)
+            self._index[string] = index
+            self._string.append(string)
+        return index
+
+
+def _localize(
+        value: datetime.datetime,
+        timezone: Optional[datetime.tzinfo]) -> datetime.datetime:
+    # a naive datetime in the timezone, or in the local time without it
+    if timezone is None:
+        return value.astimezone()
+    localize = getattr(timezone, 'localize', None)
+    if localize is not None:
+        # pytz
+        return localize(value)
+    return value.replace(tzinfo=timezone)
+
+
+class _Columns:
+    # the fields of a NamedTuple class in flat typed arrays
+    def __init__(
+            self,
+            row_class: Type[Any],
+            strings: StringTable,
+            integer: str,
+            timezone: Optional[datetime.tzinfo] = None) -> None:
+        self.row_class = row_class
+        self.strings = strings
+        self.timezone = timezone
+        self.size = 0
+        self.array: Dict[str, array.array] = {}
+        self.child: Dict[str, _Columns] = {}
+        self._append: List[Callable[[Any], None]] = []
+        self._get: List[Callable[[int], Any]] = []
+        hints = typing.get_type_hints(row_class)
+        for name in row_class._fields:
+            self._add_field(name, hints[name], integer)
+
+    def _add_field(self, name: str, hint: Any, integer: str) -> None:
+        origin = typing.get_origin(hint)
+        argument = typing.get_args(hint)
+        if hint is int:
+            self._add_integer(name, integer)
+        elif hint is str:
+            self._add_string(name)
+        elif hint is datetime.datetime:
+            self._add_datetime(name)
+        elif isinstance(hint, type) and issubclass(hint, enum.Enum):
+            self._add_enum(name, hint)
+        elif (origin is tuple
+              and len(argument) == 2
+              and argument[1] is Ellipsis):
+            if argument[0] is int:
+                self._add_integer_tuple(name)
+            elif hasattr(argument[0], '_fields'):
+                self._add_row_tuple(name, argument[0])
+            else:
+                raise TypeError('{0}.{1}: unsupported type {2}'.format(
+                        self.row_class.__name__,
+                        name,
+                        hint))
+        else:
+            raise TypeError('{0}.{1}: unsupported type {2}'.format(
+                    self.row_class.__name__,
+                    name,
+                    hint))
+
+    def _add_integer(self, name: str, integer: str) -> None:
+        column = self.array[name] = array.array(integer)
+        self._append.append(column.append)
+        self._get.append(column.__getitem__)
+
+    def _add_string(self, name: str) -> None:
+        column = self.array[name] = array.array('I')
+        strings = self.strings
+        self._append.append(lambda value: column.append(strings.intern(value)))
+        self._get.append(lambda i: strings[column[i]])
+
+    def _add_datetime(self, name: str) -> None:
+        # epoch seconds and the UTC offset in seconds
+        column = self.array[name] = array.array('q')
+        offset = self.array['{0}:utcoffset'.format(name)] = array.array('i')
+        timezone: Dict[int, datetime.timezone] = {}
+
+        def append(value: datetime.datetime) -> None:
+            utcoffset = value.utcoffset()
+            if utcoffset is None:
+                # an unknown timezone label of a mail
+                value = _localize(value, self.timezone)
+                utcoffset = value.utcoffset()
+                assert utcoffset is not None
+            column.append(int(value.timestamp()))
+            offset.append(int(utcoffset.total_seconds()))
+
+        def get(i: int) -> datetime.datetime:
+            seconds = offset[i]
+            if seconds not in timezone:
+                timezone[seconds] = datetime.timezone(
+                        datetime.timedelta(seconds=seconds))
+            return datetime.datetime.fromtimestamp(
+                    column[i],
+                    tz=timezone[seconds])
+
+        self._append.append(append)
+        self._get.append(get)
+
+    def _add_enum(self, name: str, enum_class: Type[enum.Enum]) -> None:
+        column = self.array[name] = array.array('B')
+        member = list(enum_class)
+        index = {value: i for i, value in enumerate(member)}
+        self._append.append(lambda value: column.append(index[value]))
+        self._get.append(lambda i: member[column[i]])
+
+    def _add_integer_tuple(self, name: str) -> None:
+        # the values of the i-th row in [offset[i], offset[i + 1])
+        column = self.array[name] = array.array(RECEIPT_INTEGER)
+        offset = self.array['{0}:offset'.format(name)] = array.array('I', [0])
+
+        def append(value: Tuple[int, ...]) -> None:
+            column.extend(value)
+            offset.append(len(column))
+
+        self._append.append(append)
+        self._get.append(lambda i: tuple(column[offset[i]:offset[i + 1]]))
+
+    def _add_row_tuple(self, name: str, row_class: Type[Any]) -> None:
+        child = self.child[name] = _Columns(
+                row_class,
+                self.strings,
+                ITEM_INTEGER,
+                timezone=self.timezone)
+        offset = self.array['{0}:offset'.format(name)] = array.array('I', [0])
+
+        def append(value: Tuple[Any, ...]) -> None:
+            for row in value:
+                child.append(row)
+            offset.append(child.size)
+
+        self._append.append(append)
+        self._get.append(lambda i: tuple(
+                child.get(j) for j in range(offset[i], offset[i + 1])))
+
+    def append(self, row: Any) -> None:
+        if type(row) is not self.row_class:
+            raise TypeError('{0} is expected, but got {1}'.format(
+                    self.row_class.__name__,
+                    type(row).__name__))
+        for append, value in zip(self._append, row):
+            append(value)
+        self.size += 1
+
+    def get(self, i: int) -> Any:
+        return self.row_class(*(get(i) for get in self._get))
+
+    def nbytes(self) -> int:
+        return (sum(column.itemsize * len(column)
+                    for column in self.array.values())
+                + sum(child.nbytes() for child in self.child.values()))
+
+
+class ReceiptTable(Generic[ReceiptT]):
+    # receipts of one NamedTuple class in columns,
+    # iterated as the receipts rebuilt one at a time
+    # timezone: of the naive datetimes, which are rebuilt aware
+    def __init__(
+            self,
+            receipt_list: Iterable[ReceiptT] = (),
+            *,
+            receipt_class: Optional[Type[ReceiptT]] = None,
+            strings: Optional[StringTable] = None,
+            timezone: Optional[datetime.tzinfo] = None) -> None:
+        self.strings = strings if strings is not None else StringTable()
+        self.timezone = timezone
+        self._columns: Optional[_Columns] = (
+                self._new_columns(receipt_class)
+                if receipt_class is not None else None)
+        self.extend(receipt_list)
+
+    def __len__(self) -> int:
+        return self._columns.size if self._columns is not None else 0
+
+    def __getitem__(self, index: int) -> ReceiptT:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('receipt index out of range')
+        assert self._columns is not None
+        return self._columns.get(index)
+
+    def __iter__(self) -> Iterator[ReceiptT]:
+        if self._columns is None:
+            return
+        for i in range(self._columns.size):
+            yield self._columns.get(i)
+
+    def append(self, receipt: ReceiptT) -> None:
+        # the columns follow the class of the first receipt
+        if self._columns is None:
+            self._columns = self._new_columns(type(receipt))
+        self._columns.append(receipt)
+
+    def extend(self, receipt_list: Iterable[ReceiptT]) -> None:
+        for receipt in receipt_list:
+            self.append(receipt)
+
+    def clear(self) -> None:
+        # the strings may be shared with the other tables
+        if self._columns is not None:
+            self._columns = self._new_columns(self._columns.row_class)
+
+    def sort(self) -> None:
+        # stable in the order of purchased_date
+        if self._columns is None:
+            return
+        columns = self._columns
+        date = columns.array['purchased_date']
+        order = sorted(range(columns.size), key=date.__getitem__)
+        self._columns = self._new_columns(columns.row_class)
+        for i in order:
+            self._columns.append(columns.get(i))
+
+    def _new_columns(self, receipt_class: Type[Any]) -> _Columns:
+        return _Columns(
+                receipt_class,
+                self.strings,
+                RECEIPT_INTEGER,
+                timezone=self.timezone)
+
+    def nbytes(self) -> int:
+        # the columns, without the interned strings
+        return self._columns.nbytes() if self._columns is not None else 0
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import datetime
+import logging
+import pathlib
+import sys
+from typing import Optional
+import pytz
+import yaml
+import receipt_store
+import utility
+import vendors
+
+
+TIMEZONE = pytz.timezone('Asia/Tokyo')
+
+
+def parse_date(value: str) -> datetime.datetime:
+    return TIMEZONE.localize(datetime.datetime.strptime(value, '%Y-%m-%d'))
+
+
+def main(*, logger: Optional[logging.Logger] = None) -> None:
+    logger = logger or logging.getLogger(__name__)
+    parser = argparse.ArgumentParser(
+            description='render the receipts in the store')
+    parser.add_argument(
+            '--vendor', choices=sorted(vendors.VENDOR), action='append',
+            help='vendors to render (default: all)')
+    parser.add_argument(
+            '--since', type=parse_date, metavar='YYYY-MM-DD',
+            help='first purchased date (inclusive)')
+    parser.add_argument(
+            '--until', type=parse_date, metavar='YYYY-MM-DD',
+            help='last purchased date (exclusive)')
+    parser.add_argument(
+            '--format', choices=('markdown', 'gnucash'), default='markdown')
+    option = parser.parse_args()
+    # config
+    config_path = pathlib.Path('config.yaml')
+    with config_path.open() as config_file:
+        config = yaml.load(
+                config_file,
+                Loader=yaml.SafeLoader)
+    store = receipt_store.open_store(config, logger=logger)
+    if store is None:
+        logger.error('receipt store is disabled')
+        sys.exit(1)
+    with store:
+        for name in option.vendor or sorted(vendors.VENDOR):
+            vendor = vendors.VENDOR[name]
+            writer = (
+                    utility.MarkdownWriter(
+                            sys.stdout,
+                            vendor.to_markdown,
+                            logger=logger,
+                            timezone=TIMEZONE)
+                    if option.format == 'markdown'
+                    else utility.GnuCashWriter(
+                            sys.stdout,
+                            vendor.to_gnucash,
+                            timezone=TIMEZONE,
+                            logger=logger))
+            for receipt in store.iter_receipt(
+                    vendor=name,
+                    since=option.since,
+                    until=option.until):
+                writer.write(receipt)
+
+
+if __name__ == '__main__':
+    _logger = logging.getLogger('render')
+    _logger.setLevel(logging.WARNING)
+    handler = logging.StreamHandler()
+    handler.formatter = logging.Formatter(
+                fmt='%(name)s::%(levelname)s::%(message)s')
+    _logger.addHandler(handler)
+    main(logger=_logger)
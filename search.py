@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import datetime
+import logging
+import pathlib
+import sys
+import time
+from typing import Optional
+import pytz
+import yaml
+import receipt_store
+import vendors
+
+
+TIMEZONE = pytz.timezone('Asia/Tokyo')
+
+
+def parse_date(value: str) -> datetime.datetime:
+    return TIMEZONE.localize(datetime.datetime.strptime(value, '%Y-%m-%d'))
+
+
+def main(*, logger: Optional[logging.Logger] = None) -> None:
+    logger = logger or logging.getLogger(__name__)
+    parser = argparse.ArgumentParser(
+            description='search the purchased items in the store')
+    parser.add_argument(
+            'query',
+            help='a part of the item name')
+    parser.add_argument(
+            '--vendor', choices=sorted(vendors.VENDOR))
+    parser.add_argument(
+            '--since', type=parse_date, metavar='YYYY-MM-DD',
+            help='first purchased date (inclusive)')
+    parser.add_argument(
+            '--until', type=parse_date, metavar='YYYY-MM-DD',
+            help='last purchased date (exclusive)')
+    option = parser.parse_args()
+    # config
+    config_path = pathlib.Path('config.yaml')
+    with config_path.open() as config_file:
+        config = yaml.load(
+                config_file,
+                Loader=yaml.SafeLoader)
+    store = receipt_store.open_store(config, logger=logger)
+    if store is None:
+        logger.error('receipt store is disabled')
+        sys.exit(1)
+    with store:
+        start = time.perf_counter()
+        match_list = store.search_item(
+                option.query,
+                vendor=option.vendor,
+                since=option.since,
+                until=option.until)
+        elapsed = time.perf_counter() - start
+    for match in match_list:
+        print('{0}\t{1}\t{2}\t{3}\t{4}'.format(
+                match.purchased_date.astimezone(TIMEZONE).strftime(
+                        '%Y-%m-%d %H:%M'),
+                match.vendor,
+                match.price,
+                match.piece,
+                match.name))
+    logger.info(
+            '%d items in %.1f ms',
+            len(match_list),
+            elapsed * 1000)
+
+
+if __name__ == '__main__':
+    _logger = logging.getLogger('search')
+    _logger.setLevel(logging.INFO)
+    handler = logging.StreamHandler()
+    handler.formatter = logging.Formatter(
+                fmt='%(name)s::%(levelname)s::%(message)s')
+    _logger.addHandler(handler)
+    main(logger=_logger)
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import pathlib
+import pytest
+from benchmark import fake_imap, generator
+from benchmark.download import run
+
+
+def test_download_uid_validity_changed(tmp_path: pathlib.Path) -> None:
+    # the mails stored under the old UIDVALIDITY are not duplicates
+    with fake_imap.FakeIMAPServer() as server:
+        server.load('amazon', generator.generate('amazon', 10, noise=0.0))
+        assert run(server, tmp_path, {})['mails'] == 10
+        server.mailbox('amazon').uid_validity += 1
+        assert run(server, tmp_path, {})['mails'] == 10
+        assert run(server, tmp_path, {})['mails'] == 10
+
+
+def test_download_ranges_share_directory(
+        tmp_path: pathlib.Path,
+        caplog: pytest.LogCaptureFixture) -> None:
+    # a range does not remove the temporary files of the others
+    with fake_imap.FakeIMAPServer() as server:
+        server.load('amazon', generator.generate('amazon', 300))
+        with caplog.at_level(logging.WARNING):
+            assert run(
+                    server,
+                    tmp_path,
+                    {'connections': 8, 'range_size': 10})['mails'] == 300
+    assert 'session is dropped' not in caplog.text
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import datetime
+import pathlib
+import threading
+from typing import NamedTuple, Tuple
+import receipt_store
+
+
+class Item(NamedTuple):
+    name: str
+    price: int
+    piece: int
+
+
+class Receipt(NamedTuple):
+    order_id: str
+    items: Tuple[Item, ...]
+    purchased_date: datetime.datetime
+
+
+def _store(path: pathlib.Path) -> receipt_store.ReceiptStore:
+    store = receipt_store.ReceiptStore(path.joinpath('receipt.sqlite3'))
+    store.insert('amazon', [(
+            '1',
+            Receipt(
+                    order_id='1',
+                    items=(
+                            Item(name='iPhone X', price=100000, piece=1),
+                            Item(name='ケーブル', price=1000, piece=2)),
+                    purchased_date=datetime.datetime(
+                            2020, 1, 1, tzinfo=datetime.timezone.utc)))])
+    return store
+
+
+def test_search_item_substring(tmp_path: pathlib.Path) -> None:
+    with _store(tmp_path) as store:
+        for query in ('i', 'phone', 'Phone X'):
+            assert [match.name for match in store.search_item(query)] == [
+                    'iPhone X']
+
+
+def test_search_item_last_character(tmp_path: pathlib.Path) -> None:
+    with _store(tmp_path) as store:
+        for query in ('X', 'x'):
+            assert [match.name for match in store.search_item(query)] == [
+                    'iPhone X']
+        assert [match.name for match in store.search_item('ル')] == [
+                'ケーブル']
+
+
+def test_search_item_no_match(tmp_path: pathlib.Path) -> None:
+    with _store(tmp_path) as store:
+        assert store.search_item('z') == []
+        assert store.search_item('') == []
+
+
+def _receipt(order_id: str, name: str) -> Receipt:
+    return Receipt(
+            order_id=order_id,
+            items=(Item(name=name, price=100, piece=1),),
+            purchased_date=datetime.datetime(
+                    2020, 1, int(order_id), tzinfo=datetime.timezone.utc))
+
+
+def test_insert_stream_replace(tmp_path: pathlib.Path) -> None:
+    with receipt_store.ReceiptStore(
+            tmp_path.joinpath('receipt.sqlite3')) as store:
+        for _ in store.insert_stream('amazon', [
+                ('1', _receipt('1', 'old')),
+                ('2', _receipt('2', 'removed'))]):
+            pass
+        stream = store.insert_stream(
+                'amazon',
+                [('1', _receipt('1', 'new')), ('3', _receipt('3', 'added'))],
+                batch_size=1,
+                replace=True)
+        next(stream)
+        # the receipts of the last run are kept until the end
+        assert store.count(vendor='amazon') == 2
+        assert [match.name for match in store.search_item('removed')] == [
+                'removed']
+        for _ in stream:
+            pass
+        assert [receipt.items[0].name for receipt in store.iter_receipt()] == [
+                'new', 'added']
+        assert store.search_item('old') == []
+        assert store.search_item('removed') == []
+
+
+def test_insert_stream_concurrent(tmp_path: pathlib.Path) -> None:
+    # the targets write to one store with their own connections
+    path = tmp_path.joinpath('receipt.sqlite3')
+    barrier = threading.Barrier(2)
+
+    def insert(vendor: str) -> int:
+        with receipt_store.ReceiptStore(path) as store:
+            barrier.wait()
+            for _ in store.insert_stream(
+                    vendor,
+                    [(str(i), _receipt(str(i % 28 + 1), vendor))
+                     for i in range(200)],
+                    batch_size=5,
+                    replace=True):
+                pass
+            return store.count(vendor=vendor)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        assert list(executor.map(insert, ['amazon', 'yodobashi'])) == [
+                200, 200]
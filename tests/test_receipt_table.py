@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+from typing import NamedTuple, Tuple
+import pytz
+import receipt_table
+
+
+class Item(NamedTuple):
+    name: str
+    price: int
+
+
+class Receipt(NamedTuple):
+    purchased_date: datetime.datetime
+    items: Tuple[Item, ...]
+
+
+def test_naive_datetime_in_timezone() -> None:
+    # an unknown timezone label leaves the date naive
+    timezone = pytz.timezone('Asia/Tokyo')
+    table: receipt_table.ReceiptTable[Receipt] = receipt_table.ReceiptTable(
+            timezone=timezone)
+    aware = timezone.localize(datetime.datetime(2020, 1, 2, 3, 4))
+    table.append(Receipt(
+            purchased_date=datetime.datetime(2020, 1, 2, 3, 4),
+            items=(Item(name='book', price=500),)))
+    table.append(Receipt(purchased_date=aware, items=()))
+    assert [receipt.purchased_date for receipt in table] == [aware, aware]
+    assert [
+            receipt.purchased_date.utcoffset() for receipt in table] == [
+            datetime.timedelta(hours=9)] * 2
+
+
+def test_naive_datetime_fixed_offset() -> None:
+    table: receipt_table.ReceiptTable[Receipt] = receipt_table.ReceiptTable(
+            timezone=datetime.timezone(datetime.timedelta(hours=-5)))
+    table.append(Receipt(
+            purchased_date=datetime.datetime(2020, 1, 2, 3, 4),
+            items=()))
+    assert table[0].purchased_date == datetime.datetime(
+            2020, 1, 2, 8, 4, tzinfo=datetime.timezone.utc)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import itertools
+import logging
+import pathlib
+import unittest.mock
+from typing import Any, Dict, List, NamedTuple, Optional
+import receipt_mail
+import receipt_mail.amazon
+import utility
+import vendors
+from benchmark import generator
+
+
+class Receipt(NamedTuple):
+    order_id: Any
+
+
+def test_receipt_id_order_id() -> None:
+    assert utility.receipt_id('key', 0, Receipt(order_id='1-2')) == '1-2'
+    assert utility.receipt_id('key', 0, Receipt(order_id=12)) == '12'
+
+
+def test_receipt_id_without_order_id() -> None:
+    # an order id that was not parsed does not collide with the others
+    for order_id in (None, '', 0):
+        first = utility.receipt_id('key', 0, Receipt(order_id=order_id))
+        second = utility.receipt_id('key', 1, Receipt(order_id=order_id))
+        other = utility.receipt_id('other', 0, Receipt(order_id=order_id))
+        assert len({first, second, other}) == 3
+
+
+def test_route_mixed_without_workspace() -> None:
+    # the mixed target of the template is left empty
+    config = {'target': {
+            'amazon': {'mailbox': 'amazon', 'workspace': 'amazon'},
+            'mixed': {'mailbox': None, 'workspace': None, 'mixed': True}}}
+    router = receipt_mail.Router({'amazon': receipt_mail.amazon.Mail})
+    assert utility.mixed_target(config) == {}
+    assert utility.route_mixed(config, router) == {'amazon': []}
+
+
+def test_route_mixed_cached(tmp_path: pathlib.Path) -> None:
+    # the headers are read by the first run only
+    generator.write_directory(
+            tmp_path.joinpath('mail'),
+            itertools.chain.from_iterable(
+                    generator.generate(vendor, 3, noise=0.3)
+                    for vendor in ('amazon', 'melonbooks', 'yodobashi')))
+    config = {'target': {'mixed': {
+            'mailbox': 'mixed',
+            'workspace': tmp_path.as_posix(),
+            'mixed': True}}}
+    expected: Dict[str, List[pathlib.Path]] = {
+            vendor: [] for vendor in vendors.ROUTER.mail_class}
+    for path in sorted(tmp_path.joinpath('mail').iterdir()):
+        vendor = vendors.ROUTER.route(
+                receipt_mail.Mail.read_file(path).subject())
+        if vendor is not None:
+            expected[vendor].append(path)
+    routed = utility.route_mixed(config, vendors.ROUTER)
+    assert routed == expected
+    assert sum(len(path_list) for path_list in routed.values()) > 0
+    with unittest.mock.patch.object(
+            utility.dedup,
+            'file_header',
+            side_effect=AssertionError('header is read')):
+        assert utility.route_mixed(config, vendors.ROUTER) == routed
+
+
+class Order(NamedTuple):
+    name: str
+    price: int
+    purchased_date: datetime.datetime
+
+
+def _to_markdown(
+        receipt: Order,
+        *,
+        logger: Optional[logging.Logger] = None) -> utility.MarkdownRecord:
+    return utility.MarkdownRecord(
+            description='shop',
+            row_list=(utility.MarkdownRow(
+                    name=receipt.name,
+                    price=receipt.price),))
+
+
+def _to_gnucash(
+        receipt: Order,
+        *,
+        logger: Optional[logging.Logger] = None) -> utility.GnuCashRecord:
+    return utility.GnuCashRecord(
+            description=receipt.name,
+            row_list=(utility.GnuCashRow(
+                    account='Expenses',
+                    value=receipt.price),))
+
+
+def _record(id_: str, day: int, hour: int) -> utility.ReceiptRecord:
+    return utility.ReceiptRecord(
+            id=id_,
+            receipt=Order(
+                    name=id_,
+                    price=100,
+                    purchased_date=datetime.datetime(
+                            2020, 1, day, hour,
+                            tzinfo=datetime.timezone.utc)))
+
+
+def test_append_output_markdown_sections(tmp_path: pathlib.Path) -> None:
+    # a receipt of a day already exported goes into its section
+    ledger = utility.ExportLedger(tmp_path.joinpath('shop.exported'))
+    for record_list in (
+            [_record('a', 1, 0), _record('c', 2, 0)],
+            [_record('a', 1, 0), _record('b', 1, 1), _record('c', 2, 0)]):
+        utility.append_output(
+                tmp_path,
+                'shop',
+                record_list,
+                _to_markdown,
+                _to_gnucash,
+                ledger,
+                timezone=datetime.timezone.utc)
+    markdown = tmp_path.joinpath('shop.md').read_text().splitlines()
+    assert [line for line in markdown if line.startswith('#')] == [
+            '#2020/01/01', '#2020/01/02']
+    assert [
+            line.split('|')[4] for line in markdown
+            if line.startswith('|')] == ['a', 'b', 'c']
+    csv = tmp_path.joinpath('shop.csv').read_text().splitlines()
+    assert [line.split(',')[1] for line in csv] == ['a', 'c', 'b']
+    delta = tmp_path.joinpath('shop.delta.csv').read_text().splitlines()
+    assert [line.split(',')[1] for line in delta] == ['b']
@@ -1,19 +1,39 @@
 # -*- coding: utf-8 -*-
 
+import collections
+import concurrent.futures
+import contextlib
 import datetime
+import hashlib
+import heapq
+import itertools
 import logging
+import os
 import pathlib
+import pickle
+import shutil
+import tempfile
 import unicodedata
 from typing import (
-        Callable, Dict, List, NamedTuple, Optional, Protocol, Tuple, Type,
-        TypeVar, Union, cast)
+        IO, Any, Callable, Counter, Deque, Dict, Iterable, Iterator, List,
+        NamedTuple, Optional, Protocol, Sequence, Set, Tuple, Type, TypeVar,
+        Union, cast)
 import yaml
 from mypy_extensions import DefaultNamedArg
+import dedup
+import parse_cache
+import receipt_mail
+import receipt_store
 
 
 ReceiptT = TypeVar('ReceiptT')
 
 
+DEFAULT_WORKERS = 1
+DEFAULT_CHUNK_SIZE = 64
+DEFAULT_RUN_SIZE = 10000
+
+
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 
 
@@ -23,6 +43,9 @@ class ReceiptBase(Protocol):
 
 
 class MailT(Protocol[ReceiptT]):
+    parser_version: int
+    cache_hit: Counter[str]
+
     def subject(self) -> str: ...
 
     def is_receipt(self) -> bool: ...
@@ -34,6 +57,7 @@ class MailT(Protocol[ReceiptT]):
             cls,
             path: pathlib.Path,
             *,
+            lazy: bool = ...,
             logger: Optional[logging.Logger]) -> 'MailT': ...
 
 
@@ -52,27 +76,49 @@ ToMarkdown = Callable[
         MarkdownRecord]
 
 
+class MarkdownWriter:
+    def __init__(
+            self,
+            f: IO[str],
+            to_markdown: ToMarkdown,
+            logger: Optional[logging.Logger] = None,
+            timezone: Optional[datetime.tzinfo] = None) -> None:
+        self._file = f
+        self._to_markdown = to_markdown
+        self._logger = logger
+        self._timezone = timezone
+        self._last_date: Optional[datetime.date] = None
+
+    def write(self, receipt: ReceiptBase) -> None:
+        data = self._to_markdown(receipt, logger=self._logger)
+        time = receipt.purchased_date.astimezone(tz=self._timezone)
+        if self._last_date is None or self._last_date != time.date():
+            self._last_date = time.date()
+            self._file.write('#{0}\n'.format(
+                    self._last_date.strftime("%Y/%m/%d")))
+        for i, row in enumerate(data.row_list):
+            self._file.write('|{0}|{1}|{2}|{3}|{4}|\n'.format(
+                    '{0}'.format(time.day) if i == 0 else '',
+                    time.strftime('%H:%M') if i == 0 else '',
+                    data.description if i == 0 else '',
+                    row.name,
+                    row.price))
+
+
 def write_markdown(
         path: pathlib.Path,
-        receipt_list: List[ReceiptBase],
+        receipt_list: Iterable[ReceiptBase],
         to_markdown: ToMarkdown,
         logger: Optional[logging.Logger] = None,
         timezone: Optional[datetime.tzinfo] = None) -> None:
     with path.open(mode='w') as f:
-        last_date: Optional[datetime.date] = None
+        writer = MarkdownWriter(
+                f,
+                to_markdown,
+                logger=logger,
+                timezone=timezone)
         for receipt in receipt_list:
-            data = to_markdown(receipt, logger=logger)
-            time = receipt.purchased_date.astimezone(tz=timezone)
-            if last_date is None or last_date != time.date():
-                last_date = time.date()
-                f.write('#{0}\n'.format(last_date.strftime("%Y/%m/%d")))
-            for i, row in enumerate(data.row_list):
-                f.write('|{0}|{1}|{2}|{3}|{4}|\n'.format(
-                        '{0}'.format(time.day) if i == 0 else '',
-                        time.strftime('%H:%M') if i == 0 else '',
-                        data.description if i == 0 else '',
-                        row.name,
-                        row.price))
+            writer.write(receipt)
 
 
 class GnuCashRow(NamedTuple):
@@ -90,31 +136,645 @@ ToGnuCash = Callable[
         GnuCashRecord]
 
 
+class GnuCashWriter:
+    def __init__(
+            self,
+            f: IO[str],
+            to_csv: ToGnuCash,
+            timezone: Optional[datetime.tzinfo] = None,
+            logger: Optional[logging.Logger] = None) -> None:
+        self._file = f
+        self._to_csv = to_csv
+        self._timezone = timezone
+        self._logger = logger
+        self._last_number: Optional[str] = None
+
+    def write(
+            self,
+            receipt: ReceiptBase,
+            number: Optional[str] = None) -> None:
+        data = self._to_csv(receipt, logger=self._logger)
+        time = receipt.purchased_date.astimezone(tz=self._timezone)
+        is_head = True
+        date = time.strftime('%Y-%m-%d')
+        if number is None:
+            number = time.strftime('%Y%m%d%H%M')
+            if self._last_number is not None and self._last_number == number:
+                number += '#'
+            self._last_number = number
+        for row in data.row_list:
+            self._file.write('{0},{1},{2},{3},{4}\n'.format(
+                    date if is_head else '',
+                    number if is_head else '',
+                    data.description if is_head else '',
+                    row.account,
+                    row.value))
+            is_head = False
+
+
 def write_gnucash_csv(
         path: pathlib.Path,
-        receipt_list: List[ReceiptBase],
+        receipt_list: Iterable[ReceiptBase],
         to_csv: ToGnuCash,
         timezone: Optional[datetime.tzinfo] = None,
         logger: Optional[logging.Logger] = None) -> None:
     with path.open(mode='w') as f:
-        last_number: Optional[str] = None
+        writer = GnuCashWriter(
+                f,
+                to_csv,
+                timezone=timezone,
+                logger=logger)
         for receipt in receipt_list:
-            data = to_csv(receipt, logger=logger)
-            time = receipt.purchased_date.astimezone(tz=timezone)
-            is_head = True
-            date = time.strftime('%Y-%m-%d')
-            number = time.strftime('%Y%m%d%H%M')
-            if last_number is not None and last_number == number:
-                number += '#'
-            last_number = number
-            for row in data.row_list:
-                f.write('{0},{1},{2},{3},{4}\n'.format(
-                        date if is_head else '',
-                        number if is_head else '',
-                        data.description if is_head else '',
-                        row.account,
-                        row.value))
-                is_head = False
+            writer.write(receipt)
+
+
+class Vendor(NamedTuple):
+    mail_class: Type[MailT[Any]]
+    to_markdown: ToMarkdown
+    to_gnucash: ToGnuCash
+
+
+def iter_mail(
+        mail_directory: pathlib.Path,
+        index: Optional[dedup.DedupIndex] = None,
+        cache: Optional[parse_cache.ParseCache] = None,
+        logger: Optional[logging.Logger] = None) -> Iterator[pathlib.Path]:
+    logger = logger or logging.getLogger(__name__)
+    # only the sorted file names are held, the paths are made one by one
+    for name in sorted(os.listdir(mail_directory)):
+        # temporary file of an interrupted download
+        if name.startswith('.'):
+            continue
+        mail_file = mail_directory.joinpath(name)
+        # skip the mail stored twice before parsing it
+        if index is not None:
+            # the key of an unchanged file is in the parse cache
+            key = (
+                    cache.mail_key(mail_file, mail_file.stat())
+                    if cache is not None else None)
+            canonical = index.claim(
+                    key or dedup.file_key(mail_file),
+                    mail_file)
+            if canonical is not None:
+                logger.info(
+                        '%s: is duplicate of %s',
+                        mail_file.as_posix(),
+                        canonical.as_posix())
+                continue
+        yield mail_file
+
+
+def list_mail(
+        mail_directory: pathlib.Path,
+        index: Optional[dedup.DedupIndex] = None,
+        cache: Optional[parse_cache.ParseCache] = None,
+        logger: Optional[logging.Logger] = None) -> List[pathlib.Path]:
+    return list(iter_mail(
+            mail_directory,
+            index=index,
+            cache=cache,
+            logger=logger))
+
+
+class ParseResult(NamedTuple):
+    is_receipt: bool
+    receipts: List[Any]
+    mail_key: str
+
+
+class ReceiptRecord(NamedTuple):
+    id: str
+    receipt: Any
+
+
+def receipt_id(mail_key: str, index: int, receipt: Any) -> str:
+    # the vendor order id, or the position in the mail
+    # when the order id is missing or was not parsed ('' or 0)
+    order_id = getattr(receipt, 'order_id', None)
+    if order_id:
+        return str(order_id)
+    return hashlib.sha1(
+            '{0}#{1}'.format(mail_key, index).encode('utf-8')).hexdigest()[:16]
+
+
+def parse_mail(
+        mail_file: pathlib.Path,
+        mail_class: Type[MailT[ReceiptT]],
+        logger: Optional[logging.Logger] = None) -> ParseResult:
+    logger = logger or logging.getLogger(__name__)
+    logger.info('read %s', mail_file.as_posix())
+    # the body is parsed only for the receipts
+    mail = mail_class.read_file(mail_file, lazy=True, logger=logger)
+    logger.info('subject: %s', mail.subject())
+    if not mail.is_receipt():
+        logger.info('%s: is not receipt', mail_file.as_posix())
+        # the key is cached for the dedup of the next run
+        return ParseResult(
+                is_receipt=False,
+                receipts=[],
+                mail_key=dedup.file_key(mail_file))
+    receipts = mail.receipt()
+    logger.debug(
+            '%s: section cache hits %s',
+            mail_file.as_posix(),
+            dict(mail.cache_hit))
+    for receipt in receipts:
+        logger.info('%s: %s', mail_file.as_posix(), repr(receipt))
+    if not receipts:
+        logger.warning(
+                '%s: failed to parse as a receipt',
+                mail_file.as_posix())
+    return ParseResult(
+            is_receipt=True,
+            receipts=receipts,
+            mail_key=dedup.file_key(mail_file))
+
+
+def read_receipt(
+        mail_file: pathlib.Path,
+        mail_class: Type[MailT[ReceiptT]],
+        logger: Optional[logging.Logger] = None) -> List[ReceiptT]:
+    return parse_mail(mail_file, mail_class, logger=logger).receipts
+
+
+def read_receipt_record(
+        mail_file: pathlib.Path,
+        mail_class: Type[MailT[Any]],
+        logger: Optional[logging.Logger] = None) -> List[ReceiptRecord]:
+    result = parse_mail(mail_file, mail_class, logger=logger)
+    return [
+            ReceiptRecord(
+                    id=receipt_id(result.mail_key, i, receipt),
+                    receipt=receipt)
+            for i, receipt in enumerate(result.receipts)]
+
+
+def read_receipt_list(
+        mail_list: List[pathlib.Path],
+        mail_class: Type[MailT[ReceiptT]],
+        workers: int = DEFAULT_WORKERS,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        cache: Optional[parse_cache.ParseCache] = None,
+        logger: Optional[logging.Logger] = None) -> List[ReceiptT]:
+    return list(iter_receipt(
+            mail_list,
+            mail_class,
+            workers=workers,
+            chunk_size=chunk_size,
+            cache=cache,
+            logger=logger))
+
+
+def iter_receipt(
+        mail_list: Iterable[pathlib.Path],
+        mail_class: Type[MailT[ReceiptT]],
+        workers: int = DEFAULT_WORKERS,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        cache: Optional[parse_cache.ParseCache] = None,
+        logger: Optional[logging.Logger] = None) -> Iterator[ReceiptT]:
+    for record in iter_receipt_record(
+            mail_list,
+            mail_class,
+            workers=workers,
+            chunk_size=chunk_size,
+            cache=cache,
+            logger=logger):
+        yield record.receipt
+
+
+def iter_receipt_record(
+        mail_list: Iterable[pathlib.Path],
+        mail_class: Type[MailT[Any]],
+        workers: int = DEFAULT_WORKERS,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        cache: Optional[parse_cache.ParseCache] = None,
+        executor: Optional[concurrent.futures.Executor] = None,
+        logger: Optional[logging.Logger] = None) -> Iterator[ReceiptRecord]:
+    logger = logger or logging.getLogger(__name__)
+    logger.debug('parse mails with %d processes', workers)
+    # the chunks are taken as the window moves
+    mail_iter = iter(mail_list)
+    chunk_iter = iter(
+            lambda: list(itertools.islice(mail_iter, chunk_size)),
+            [])
+    with contextlib.ExitStack() as stack:
+        # the pool may be shared by the targets
+        if executor is None and workers > 1:
+            executor = stack.enter_context(
+                    concurrent.futures.ProcessPoolExecutor(
+                            max_workers=workers))
+        # at most 2 * workers chunks are in flight
+        window: Deque[_Chunk] = collections.deque()
+        for chunk in chunk_iter:
+            window.append(_Chunk(
+                    chunk,
+                    mail_class,
+                    executor=executor,
+                    cache=cache,
+                    logger=logger))
+            if len(window) > 2 * workers:
+                yield from window.popleft().result()
+        while window:
+            yield from window.popleft().result()
+
+
+class _Chunk:
+    def __init__(
+            self,
+            mail_list: List[pathlib.Path],
+            mail_class: Type[MailT[Any]],
+            *,
+            executor: Optional[concurrent.futures.Executor],
+            cache: Optional[parse_cache.ParseCache],
+            logger: logging.Logger) -> None:
+        self.mail_list = mail_list
+        self.mail_class = mail_class
+        self.cache = cache
+        self.logger = logger
+        self.stat_list = [mail_file.stat() for mail_file in mail_list]
+        self.result_list: List[Optional[ParseResult]] = [None] * len(mail_list)
+        # the mails parsed by the previous runs
+        if cache is not None:
+            for i, mail_file in enumerate(mail_list):
+                cached = cache.get(mail_file, self.stat_list[i])
+                if cached is None:
+                    continue
+                self.result_list[i] = ParseResult(*cached)
+                if cached[0] and not cached[1]:
+                    logger.warning(
+                            '%s: failed to parse as a receipt (cached)',
+                            mail_file.as_posix())
+        self.pending = [
+                i for i, result in enumerate(self.result_list)
+                if result is None]
+        self.future: Optional[concurrent.futures.Future[
+                Tuple[List[ParseResult], List[logging.LogRecord]]]] = None
+        if executor is not None and self.pending:
+            self.future = executor.submit(
+                    _parse_chunk,
+                    mail_class,
+                    [mail_list[i] for i in self.pending],
+                    logger_name=logger.name,
+                    level=logger.getEffectiveLevel())
+
+    def result(self) -> Iterator[ReceiptRecord]:
+        if self.future is not None:
+            parsed, records = self.future.result()
+            for record in records:
+                self.logger.handle(record)
+        else:
+            parsed = [
+                    parse_mail(
+                            self.mail_list[i],
+                            self.mail_class,
+                            logger=self.logger)
+                    for i in self.pending]
+        for i, parse_result in zip(self.pending, parsed):
+            self.result_list[i] = parse_result
+            if self.cache is not None:
+                self.cache.put(
+                        self.mail_list[i],
+                        self.stat_list[i],
+                        parse_result.is_receipt,
+                        parse_result.receipts,
+                        parse_result.mail_key)
+        for result in self.result_list:
+            if result is None:
+                continue
+            for i, receipt in enumerate(result.receipts):
+                yield ReceiptRecord(
+                        id=receipt_id(result.mail_key, i, receipt),
+                        receipt=receipt)
+
+
+class _RecordHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: List[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # format the message in the worker to make the record picklable
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                    record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+def _parse_chunk(
+        mail_class: Type[MailT[ReceiptT]],
+        mail_list: List[pathlib.Path],
+        *,
+        logger_name: str,
+        level: int) -> Tuple[List[ParseResult], List[logging.LogRecord]]:
+    # the records are sent back to the parent process
+    handler = _RecordHandler()
+    logger = logging.getLogger(logger_name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(level)
+    result_list = [
+            parse_mail(mail_file, mail_class, logger=logger)
+            for mail_file in mail_list]
+    return result_list, handler.records
+
+
+def sort_receipt(
+        receipt_list: Iterable[ReceiptT],
+        key: Callable[[ReceiptT], Any],
+        run_size: int = DEFAULT_RUN_SIZE,
+        logger: Optional[logging.Logger] = None) -> Iterator[ReceiptT]:
+    # external merge sort:
+    # sorted runs of run_size receipts are spilled to temporary files
+    logger = logger or logging.getLogger(__name__)
+    run: List[ReceiptT] = []
+    with contextlib.ExitStack() as stack:
+        run_files: List[IO[bytes]] = []
+        for receipt in receipt_list:
+            run.append(receipt)
+            if len(run) >= run_size:
+                run_files.append(stack.enter_context(_spill_run(run, key)))
+                run = []
+        run.sort(key=key)
+        if not run_files:
+            yield from run
+            return
+        logger.debug(
+                'merge %d runs of %d receipts',
+                len(run_files) + 1,
+                run_size)
+        # the last run stays in memory
+        # heapq.merge takes the earlier run first for equal keys
+        yield from heapq.merge(
+                *(_load_run(run_file) for run_file in run_files),
+                run,
+                key=key)
+
+
+def _spill_run(
+        run: List[ReceiptT],
+        key: Callable[[ReceiptT], Any]) -> IO[bytes]:
+    run.sort(key=key)
+    run_file = tempfile.TemporaryFile()
+    for receipt in run:
+        pickle.dump(receipt, run_file)
+    run_file.seek(0)
+    return run_file
+
+
+def _load_run(run_file: IO[bytes]) -> Iterator[Any]:
+    while True:
+        try:
+            yield pickle.load(run_file)
+        except EOFError:
+            return
+
+
+@contextlib.contextmanager
+def open_atomic(path: pathlib.Path, mode: str = 'w') -> Iterator[IO[str]]:
+    # the file is replaced only when the writing completes,
+    # an error leaves the old one
+    temp_path = path.with_name('.{0}.tmp'.format(path.name))
+    if mode == 'a' and path.exists():
+        shutil.copyfile(path, temp_path)
+    try:
+        with temp_path.open(mode=mode) as temp_file:
+            yield temp_file
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    os.replace(temp_path, path)
+
+
+def write_output(
+        workspace: pathlib.Path,
+        category: str,
+        receipt_list: Iterable[ReceiptBase],
+        to_markdown: ToMarkdown,
+        to_gnucash: ToGnuCash,
+        timezone: Optional[datetime.tzinfo] = None,
+        logger: Optional[logging.Logger] = None) -> int:
+    # write markdown and gnucash csv in a single pass over the receipts
+    markdown_path = workspace.joinpath('{0}.md'.format(category))
+    csv_path = workspace.joinpath('{0}.csv'.format(category))
+    with open_atomic(markdown_path) as markdown_file, \
+            open_atomic(csv_path) as csv_file:
+        markdown = MarkdownWriter(
+                markdown_file,
+                to_markdown,
+                logger=logger,
+                timezone=timezone)
+        gnucash = GnuCashWriter(
+                csv_file,
+                to_gnucash,
+                timezone=timezone)
+        count = 0
+        for receipt in receipt_list:
+            markdown.write(receipt)
+            gnucash.write(receipt)
+            count += 1
+    return count
+
+
+class ExportLedger:
+    # the IDs of the receipts already written to the output
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self.exists = path.exists()
+        self.ids: Set[str] = set()
+        if self.exists:
+            with path.open() as ledger_file:
+                self.ids.update(line.rstrip('\n') for line in ledger_file)
+            self.ids.discard('')
+
+    def __contains__(self, receipt_id: str) -> bool:
+        return receipt_id in self.ids
+
+    def record(self, ids: List[str]) -> None:
+        with self.path.open(mode='a') as ledger_file:
+            ledger_file.write(''.join('{0}\n'.format(x) for x in ids))
+            ledger_file.flush()
+            os.fsync(ledger_file.fileno())
+        self.ids.update(ids)
+        self.exists = True
+
+
+def append_output(
+        workspace: pathlib.Path,
+        category: str,
+        record_list: Iterable[ReceiptRecord],
+        to_markdown: ToMarkdown,
+        to_gnucash: ToGnuCash,
+        ledger: ExportLedger,
+        timezone: Optional[datetime.tzinfo] = None,
+        logger: Optional[logging.Logger] = None,
+        receipt_list: Optional[Iterable[ReceiptBase]] = None) -> int:
+    # the markdown is rewritten with all the receipts to keep one section
+    # a day, the csv gets the receipts not in the ledger appended,
+    # and only them are written to <category>.delta.csv for the import
+    # receipt_list: all the receipts for the markdown when record_list
+    # holds only the new ones
+    logger = logger or logging.getLogger(__name__)
+    # the first run rewrites the csv of the full mode
+    mode = 'a' if ledger.exists else 'w'
+    markdown_path = workspace.joinpath('{0}.md'.format(category))
+    csv_path = workspace.joinpath('{0}.csv'.format(category))
+    delta_path = workspace.joinpath('{0}.delta.csv'.format(category))
+    new_ids: List[str] = []
+    new_id_set: Set[str] = set()
+    with open_atomic(markdown_path) as markdown_file, \
+            open_atomic(csv_path, mode=mode) as csv_file, \
+            open_atomic(delta_path) as delta_file:
+        markdown = MarkdownWriter(
+                markdown_file,
+                to_markdown,
+                logger=logger,
+                timezone=timezone)
+        gnucash = GnuCashWriter(
+                csv_file,
+                to_gnucash,
+                timezone=timezone)
+        delta = GnuCashWriter(
+                delta_file,
+                to_gnucash,
+                timezone=timezone)
+        for record in record_list:
+            if receipt_list is None:
+                markdown.write(record.receipt)
+            # the same order may be confirmed twice
+            if record.id in ledger or record.id in new_id_set:
+                continue
+            gnucash.write(record.receipt, number=record.id)
+            delta.write(record.receipt, number=record.id)
+            new_ids.append(record.id)
+            new_id_set.add(record.id)
+        for receipt in receipt_list or ():
+            markdown.write(receipt)
+    ledger.record(new_ids)
+    logger.info('%s: %d new receipts are exported', category, len(new_ids))
+    return len(new_ids)
+
+
+class AggregateResult(NamedTuple):
+    category: str
+    mails: int
+    receipts: int
+
+
+def mixed_target(
+        config: Dict[str, Any],
+        logger: Optional[logging.Logger] = None) -> Dict[str, Dict[str, Any]]:
+    # the mixed targets, the ones left empty in the template are skipped
+    logger = logger or logging.getLogger(__name__)
+    result: Dict[str, Dict[str, Any]] = {}
+    for name, target in config['target'].items():
+        if not target.get('mixed', False):
+            continue
+        if not target.get('workspace') or not target.get('mailbox'):
+            logger.warning(
+                    '%s: mixed target has no workspace or mailbox, skip',
+                    name)
+            continue
+        result[name] = target
+    return result
+
+
+def route_mixed(
+        config: Dict[str, Any],
+        router: receipt_mail.Router,
+        index: Optional[dedup.DedupIndex] = None,
+        logger: Optional[logging.Logger] = None) -> Dict[
+                str, List[pathlib.Path]]:
+    # the mails of the mixed targets by the vendor,
+    # the header of a new mail is read once for the vendor and the key,
+    # the ones of the unchanged mails are in the parse cache
+    logger = logger or logging.getLogger(__name__)
+    aggregate_config = config.get('aggregate') or {}
+    result: Dict[str, List[pathlib.Path]] = {
+            name: [] for name in router.mail_class}
+    for name, target in mixed_target(config, logger=logger).items():
+        workspace = pathlib.Path(target['workspace'])
+        mail_directory = workspace.joinpath('mail')
+        if not mail_directory.exists():
+            continue
+        cache = (
+                parse_cache.ParseCache(
+                        workspace.joinpath(parse_cache.DEFAULT_CACHE_NAME),
+                        router.name,
+                        router.version,
+                        logger=logger)
+                if aggregate_config.get('cache', True) is not False
+                else None)
+        routed: Dict[str, List[pathlib.Path]] = {
+                vendor: [] for vendor in router.mail_class}
+        for mail_file in iter_mail(mail_directory, logger=logger):
+            vendor, key = _route_mail(mail_file, router, cache, logger)
+            # skip the mail stored twice
+            if index is not None:
+                canonical = index.claim(key, mail_file)
+                if canonical is not None:
+                    logger.info(
+                            '%s: is duplicate of %s',
+                            mail_file.as_posix(),
+                            canonical.as_posix())
+                    continue
+            if vendor is None:
+                logger.info('%s: is not a receipt', mail_file.as_posix())
+                continue
+            routed[vendor].append(mail_file)
+        if cache is not None:
+            cache.prune()
+            cache.close()
+        for vendor, path_list in routed.items():
+            logger.info(
+                    '%s: %d mails are routed to %s',
+                    name,
+                    len(path_list),
+                    vendor)
+            result[vendor].extend(path_list)
+    if index is not None:
+        index.commit()
+    return result
+
+
+def _route_mail(
+        mail_file: pathlib.Path,
+        router: receipt_mail.Router,
+        cache: Optional[parse_cache.ParseCache],
+        logger: logging.Logger) -> Tuple[Optional[str], str]:
+    # the vendor and the dedup key of a mail,
+    # the vendor is cached in the place of the receipts
+    stat = mail_file.stat()
+    cached = cache.get(mail_file, stat) if cache is not None else None
+    if cached is not None:
+        _, vendor_list, key = cached
+        return (vendor_list[0] if vendor_list else None), key
+    header, key = dedup.file_header(mail_file)
+    vendor = router.route_binary(header, logger=logger)
+    if cache is not None:
+        cache.put(
+                mail_file,
+                stat,
+                vendor is not None,
+                [vendor] if vendor is not None else [],
+                key)
+    return vendor, key
+
+
+def target_workspace(
+        config: Dict[str, Any],
+        category: str) -> pathlib.Path:
+    target = config['target'].get(category)
+    if target is not None:
+        return pathlib.Path(target['workspace'])
+    # a vendor only in the mixed targets
+    for target in mixed_target(config).values():
+        workspace = pathlib.Path(target['workspace']).joinpath(category)
+        workspace.mkdir(parents=True, exist_ok=True)
+        return workspace
+    raise KeyError('{0}: no target'.format(category))
 
 
 def aggregate(
@@ -132,40 +792,128 @@ def aggregate(
         config = yaml.load(
                 config_file,
                 Loader=yaml.SafeLoader)
+    index = dedup.open_index(config, logger=logger)
+    try:
+        # only this vendor is picked from the mixed targets
+        router = receipt_mail.Router(
+                {category: cast(Type[receipt_mail.Mail], mail_class)})
+        aggregate_target(
+                category,
+                config,
+                mail_class,
+                to_markdown,
+                to_gnucash,
+                timezone=timezone,
+                index=index,
+                routed=route_mixed(
+                        config,
+                        router,
+                        index=index,
+                        logger=logger)[category],
+                logger=logger)
+    finally:
+        if index is not None:
+            index.close()
+
+
+def aggregate_target(
+        category: str,
+        config: Dict[str, Any],
+        mail_class: Type[MailT[Any]],
+        to_markdown: ToMarkdown,
+        to_gnucash: ToGnuCash,
+        timezone: Optional[datetime.tzinfo] = None,
+        index: Optional[dedup.DedupIndex] = None,
+        executor: Optional[concurrent.futures.Executor] = None,
+        routed: Sequence[pathlib.Path] = (),
+        logger: Optional[logging.Logger] = None) -> AggregateResult:
+    logger = logger or logging.getLogger(__name__)
     # workspace directory
-    workspace = pathlib.Path(config['target'][category]['workspace'])
-    # correct receipt
-    mail_directory = workspace.joinpath('mail')
-    receipt_list: List[ReceiptBase] = []
-    for mail_file in mail_directory.iterdir():
-        logger.info('read %s', mail_file.as_posix())
-        mail = mail_class.read_file(mail_file, logger=logger)
-        logger.info('subject: %s', mail.subject())
-        if not mail.is_receipt():
-            logger.info('%s: is not receipt', mail_file.as_posix())
-            continue
-        receipts = mail.receipt()
-        for receipt in receipts:
-            logger.info('%s: %s', mail_file.as_posix(), repr(receipt))
-            receipt_list.append(receipt)
-        if not receipts:
-            logger.warning(
-                    '%s: failed to parse as a receipt',
-                    mail_file.as_posix())
-    receipt_list.sort(key=lambda x: x.purchased_date)
-    # markdown
-    write_markdown(
-            workspace.joinpath('{0}.md'.format(category)),
-            receipt_list,
-            to_markdown,
-            timezone=timezone,
+    workspace = target_workspace(config, category)
+    aggregate_config = config.get('aggregate') or {}
+    cache = parse_cache.open_cache(
+            workspace,
+            mail_class,
+            config,
+            logger=logger)
+    # correct receipt, and the ones routed from the mixed targets,
+    # listed while they are parsed
+    mail_iter: Iterator[pathlib.Path] = iter(routed)
+    if category in config['target']:
+        mail_iter = itertools.chain(
+                iter_mail(
+                        workspace.joinpath('mail'),
+                        index=index,
+                        cache=cache,
+                        logger=logger),
+                mail_iter)
+    mails = 0
+
+    def count_mail() -> Iterator[pathlib.Path]:
+        nonlocal mails
+        for mail_file in mail_iter:
+            mails += 1
+            yield mail_file
+
+    # files -> receipts -> sorted receipts -> output
+    record_iter = iter_receipt_record(
+            count_mail(),
+            mail_class,
+            workers=aggregate_config.get('workers') or DEFAULT_WORKERS,
+            chunk_size=(
+                    aggregate_config.get('chunk_size') or DEFAULT_CHUNK_SIZE),
+            cache=cache,
+            executor=executor,
+            logger=logger)
+    run_size = aggregate_config.get('run_size') or DEFAULT_RUN_SIZE
+    incremental = aggregate_config.get('incremental', False)
+    # the receipts already exported
+    ledger = (
+            ExportLedger(workspace.joinpath('{0}.exported'.format(category)))
+            if incremental else None)
+    sorted_iter = sort_receipt(
+            record_iter,
+            key=lambda x: x.receipt.purchased_date,
+            run_size=run_size,
             logger=logger)
-    # gnucash csv
-    write_gnucash_csv(
-            workspace.joinpath('{0}.csv'.format(category)),
-            receipt_list,
-            to_gnucash,
-            timezone=timezone)
+    # the store gets the same receipts as the output,
+    # the vendor's receipts are replaced at the end
+    store = receipt_store.open_store(config, logger=logger)
+    if store is not None:
+        sorted_iter = store.insert_stream(
+                category,
+                sorted_iter,
+                replace=True)
+    if ledger is not None:
+        count = append_output(
+                workspace,
+                category,
+                sorted_iter,
+                to_markdown,
+                to_gnucash,
+                ledger,
+                timezone=timezone,
+                logger=logger)
+    else:
+        count = write_output(
+                workspace,
+                category,
+                (record.receipt for record in sorted_iter),
+                to_markdown,
+                to_gnucash,
+                timezone=timezone,
+                logger=logger)
+    if store is not None:
+        store.close()
+    if index is not None:
+        index.commit()
+    if cache is not None:
+        cache.prune()
+        cache.close()
+    return AggregateResult(
+            category=category,
+            mails=mails,
+            receipts=count)
 
 
 def normalize(string: str) -> str:
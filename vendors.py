@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+from typing import Dict, Type, cast
+import receipt_mail
+import receipt_mail.amazon
+import receipt_mail.bookwalker
+import receipt_mail.melonbooks
+import receipt_mail.yodobashi
+import amazon
+import bookwalker
+import melonbooks
+import yodobashi
+import utility
+
+
+VENDOR: Dict[str, utility.Vendor] = {
+        'amazon': utility.Vendor(
+                mail_class=receipt_mail.amazon.Mail,
+                to_markdown=amazon.to_markdown,
+                to_gnucash=amazon.to_gnucash),
+        'bookwalker': utility.Vendor(
+                mail_class=receipt_mail.bookwalker.Mail,
+                to_markdown=bookwalker.to_markdown,
+                to_gnucash=bookwalker.to_gnucach),
+        'melonbooks': utility.Vendor(
+                mail_class=receipt_mail.melonbooks.Mail,
+                to_markdown=melonbooks.to_markdown,
+                to_gnucash=melonbooks.to_gnucash),
+        'yodobashi': utility.Vendor(
+                mail_class=receipt_mail.yodobashi.Mail,
+                to_markdown=yodobashi.to_markdown,
+                to_gnucash=yodobashi.to_gnucash)}
+
+
+# the vendor of a mail in the mixed targets
+ROUTER = receipt_mail.Router({
+        name: cast(Type[receipt_mail.Mail], vendor.mail_class)
+        for name, vendor in VENDOR.items()})